@@ -17,3 +17,15 @@ OpenStack Neat :: an add-on to OpenStack implementing energy and performance eff
 """
 __version__ = "0.1"
 __author__  = "Anton Beloglazov"
+
+
+import os
+import contracts
+
+# The contracts of the functions are checked only if the NEAT_CONTRACTS
+# environment variable is set to 1, as the checking multiplies the
+# cost of the algorithms and the data collection. The decision must be
+# made before the modules of the package are imported: when checking is
+# disabled, the @contract decorators return the functions unchanged.
+if os.environ.get('NEAT_CONTRACTS') != '1':
+    contracts.disable_all()
@@ -23,20 +23,35 @@ import os
 import time
 import json
 import re
-import numpy
+import socket
 import subprocess
 
 from neat.config import *
-from neat.db_utils import *
+import neat.metrics as metrics
+import neat.profiler as profiler
+from neat.scheduler import Scheduler, SKIP, host_offset
 
 import logging
 log = logging.getLogger(__name__)
 
 
 @contract
-def start(init_state, execute, config, time_interval, iterations=-1):
+def start(init_state, execute, config, time_interval, iterations=-1,
+          phase=None, wait=None):
     """ Start the processing loop.
 
+    The iterations are performed at deadlines spaced by the time
+    interval on a monotonic clock, optionally aligned to a phase, as
+    implemented in `neat.scheduler`. The overruns are handled according
+    to the `scheduler_overrun_policy` option. The deadlines are shifted
+    by the offset of the host within the `scheduler_phase_spread`, and
+    delayed by a random jitter of up to `scheduler_jitter` seconds.
+
+    If a wait function is passed, the iterations are driven by events
+    instead: an iteration is performed once the function returns,
+    which it must do when an event arrives or the time interval
+    expires.
+
     :param init_state: A function accepting a config and
                        returning a state dictionary.
      :type init_state: function
@@ -53,23 +68,77 @@ def start(init_state, execute, config, time_interval, iterations=-1):
     :param iterations: The number of iterations to perform, -1 for infinite.
      :type iterations: int
 
+    :param phase: The offset of the iterations in seconds, None to start now.
+     :type phase: None|number
+
+    :param wait: A function accepting a state and a timeout in seconds.
+     :type wait: None|function
+
     :return: The final state.
      :rtype: dict(str: *)
     """
     state = init_state(config)
+    scheduler = Scheduler(
+        time_interval, phase,
+        config.get('scheduler_overrun_policy', SKIP),
+        host_offset(socket.gethostname(),
+                    float(config.get('scheduler_phase_spread', 0))),
+        float(config.get('scheduler_jitter', 0)))
+
+    while iterations != 0:
+        if wait is None:
+            scheduler.wait()
+        else:
+            wait(state, time_interval)
+        state = execute_iteration(execute, config, state)
+        if wait is None:
+            scheduler.advance()
+        if iterations > 0:
+            iterations -= 1
 
-    if iterations == -1:
-        while True:
-            state = execute(config, state)
-            time.sleep(time_interval)
-    else:
-        for _ in xrange(iterations):
-            state = execute(config, state)
-            time.sleep(time_interval)
+    return state
+
+
+@contract
+def execute_iteration(execute, config, state):
+    """ Perform an iteration and record its duration in the metrics.
+
+    The iteration is profiled if profiling has been requested.
+
+    :param execute: A function performing the processing at each iteration.
+     :type execute: function
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param state: A state dictionary.
+     :type state: dict(str: *)
 
+    :return: The updated state dictionary.
+     :rtype: dict(str: *)
+    """
+    start_time = time.time()
+    state = profiler.run(execute, config, state)
+    metrics.observe('neat_iteration_seconds', time.time() - start_time)
+    metrics.export()
     return state
 
 
+@contract
+def parse_phase(phase):
+    """ Parse the phase of the iterations from the config file.
+
+    :param phase: The phase in seconds, or an empty string to not align.
+     :type phase: str
+
+    :return: The phase in seconds, or None to not align the iterations.
+     :rtype: None|float
+    """
+    if not phase.strip():
+        return None
+    return float(phase)
+
+
 @contract
 def build_local_vm_path(local_data_directory):
     """ Build the path to the local VM data directory.
@@ -218,12 +287,25 @@ def call_function_by_name(name, args):
     :return: The return value of the function call.
      :rtype: *
     """
+    return get_object_by_name(name)(*args)
+
+
+@contract
+def get_object_by_name(name):
+    """ Get a module attribute specified by a fully qualified name.
+
+    :param name: A fully qualified name of a function or class.
+     :type name: str
+
+    :return: The function or class.
+     :rtype: *
+    """
     fragments = name.split('.')
     module = '.'.join(fragments[:-1])
     fromlist = fragments[-2]
     function = fragments[-1]
     m = __import__(module, fromlist=fromlist)
-    return getattr(m, function)(*args)
+    return getattr(m, function)
 
 
 @contract
@@ -266,6 +348,8 @@ def calculate_migration_time(vms, bandwidth):
     :return: The mean VM migration time in seconds.
      :rtype: float
     """
+    # NumPy is not needed by the data collector, so it is loaded here
+    import numpy
     return float(numpy.mean(vms.values()) / bandwidth)
 
 
@@ -49,19 +49,53 @@ REQUIRED_FIELDS = [
     'compute_hosts',
     'global_manager_host',
     'global_manager_port',
+    'global_manager_server',
+    'global_manager_keepalive_timeout',
+    'global_manager_protocol',
+    'global_manager_timeout',
+    'notification_retries',
+    'notification_backoff',
+    'global_manager_coalescing_window',
+    'cluster_model_ttl',
     'db_cleaner_interval',
     'local_data_directory',
     'local_manager_interval',
     'data_collector_interval',
     'data_collector_data_length',
+    'data_collector_metrics_port',
+    'local_manager_metrics_port',
+    'local_agent_metrics_port',
+    'metrics_textfile_directory',
+    'profiler_iterations',
+    'scheduler_overrun_policy',
+    'scheduler_phase_spread',
+    'scheduler_jitter',
+    'data_collector_phase',
+    'local_manager_phase',
+    'local_manager_trigger',
+    'detector_state_max_age',
     'host_cpu_overload_threshold',
     'host_cpu_usable_by_vms',
     'compute_user',
     'compute_password',
     'sleep_command',
     'ether_wake_interface',
+    'power_probe_port',
+    'power_probe_interval',
+    'power_command_timeout',
+    'power_ready_timeout',
+    'forecast_period',
+    'forecast_smoothing',
+    'forecast_horizon',
     'block_migration',
     'network_migration_bandwidth',
+    'migration_max_per_source',
+    'migration_max_per_destination',
+    'migration_max_total',
+    'migration_poll_interval_min',
+    'migration_poll_interval_max',
+    'migration_timeout',
+    'migration_retries',
     'algorithm_underload_detection_factory',
     'algorithm_underload_detection_parameters',
     'algorithm_overload_detection_factory',
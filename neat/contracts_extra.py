@@ -15,18 +15,37 @@
 from contracts import new_contract
 
 
+def instance_of(module, name):
+    """ Create a contract checking that a value is an instance of a class.
+
+    The module defining the class is imported when the contract is
+    first checked, so that importing the contracts does not load heavy
+    dependencies, such as libvirt or SQLAlchemy.
+
+    :param module: The name of the module defining the class.
+     :type module: str
+
+    :param name: The name of the class.
+     :type name: str
+
+    :return: A function checking the type of a value.
+     :rtype: function
+    """
+    def check(value):
+        cls = getattr(__import__(module, fromlist=[name]), name)
+        return isinstance(value, cls)
+    return check
+
+
 import collections
 new_contract('deque', collections.deque)
 
 import datetime
 new_contract('datetime', datetime.datetime)
 
-import libvirt
-new_contract('virConnect', libvirt.virConnect)
-new_contract('virDomain', libvirt.virDomain)
+new_contract('virConnect', instance_of('libvirt', 'virConnect'))
+new_contract('virDomain', instance_of('libvirt', 'virDomain'))
 
-import sqlalchemy
-new_contract('Table', sqlalchemy.Table)
+new_contract('Table', instance_of('sqlalchemy', 'Table'))
 
-import neat.db
-new_contract('Database', neat.db.Database)
+new_contract('Database', instance_of('neat.db', 'Database'))
@@ -34,9 +34,11 @@ class Database(object):
               vm_resource_usage=Table,
               vm_migrations=Table,
               host_states=Table,
-              host_overload=Table)
+              host_overload=Table,
+              host_power_latencies=Table)
     def __init__(self, connection, hosts, host_resource_usage, vms,
-                 vm_resource_usage, vm_migrations, host_states, host_overload):
+                 vm_resource_usage, vm_migrations, host_states, host_overload,
+                 host_power_latencies):
         """ Initialize the database.
 
         :param connection: A database connection table.
@@ -47,6 +49,7 @@ class Database(object):
         :param vm_migrations: The vm_migrations table.
         :param host_states: The host_states table.
         :param host_overload: The host_overload table.
+        :param host_power_latencies: The host_power_latencies table.
         """
         self.connection = connection
         self.hosts = hosts
@@ -56,8 +59,25 @@ class Database(object):
         self.vm_migrations = vm_migrations
         self.host_states = host_states
         self.host_overload = host_overload
+        self.host_power_latencies = host_power_latencies
         log.debug('Instantiated a Database object')
 
+    def copy(self):
+        """ Create a database object using a new connection.
+
+        A connection must not be used by several threads at once, so a
+        thread processing requests concurrently with the worker of the
+        global manager uses a copy.
+
+        :return: A database object sharing the tables.
+         :rtype: Database
+        """
+        return Database(self.connection.engine.connect(),
+                        self.hosts, self.host_resource_usage, self.vms,
+                        self.vm_resource_usage, self.vm_migrations,
+                        self.host_states, self.host_overload,
+                        self.host_power_latencies)
+
     @contract
     def select_cpu_mhz_for_vm(self, uuid, n):
         """ Select n last values of CPU MHz for a VM UUID.
@@ -80,6 +100,46 @@ class Database(object):
         res = self.connection.execute(sel).fetchall()
         return list(reversed([int(x[0]) for x in res]))
 
+    @contract
+    def select_cpu_mhz_for_vms(self, uuids, n):
+        """ Select n last values of CPU MHz for a set of VM UUIDs.
+
+        The values are selected in a single query in the reverse order
+        of insertion, which is stopped as soon as n values have been
+        selected for every VM.
+
+        :param uuids: A list of VM UUIDs.
+         :type uuids: list(str)
+
+        :param n: The number of last values to select.
+         :type n: int,>0
+
+        :return: A dict of VM UUIDs to the lists of n last CPU Mhz values.
+         :rtype: dict(str: list(int))
+        """
+        result = dict((uuid, []) for uuid in uuids)
+        if not uuids:
+            return result
+        sel = select([self.vms.c.uuid, self.vm_resource_usage.c.cpu_mhz]). \
+            where(and_(
+                self.vms.c.id == self.vm_resource_usage.c.vm_id,
+                self.vms.c.uuid.in_(uuids))). \
+            order_by(self.vm_resource_usage.c.id.desc())
+        remaining = len(result)
+        rows = self.connection.execute(sel)
+        for uuid, cpu_mhz in rows:
+            values = result[str(uuid)]
+            if len(values) < n:
+                values.append(int(cpu_mhz))
+                if len(values) == n:
+                    remaining -= 1
+                    if remaining == 0:
+                        break
+        rows.close()
+        for values in result.values():
+            values.reverse()
+        return result
+
     @contract
     def select_last_cpu_mhz_for_vms(self):
         """ Select the last value of CPU MHz for all the VMs.
@@ -258,6 +318,30 @@ class Database(object):
             hosts_ram[hostname] = int(x[4])
         return hosts_cpu_mhz, hosts_cpu_cores, hosts_ram
 
+    @contract
+    def update_host_macs(self, macs):
+        """ Update the MAC addresses of a set of hosts.
+
+        :param macs: A dict of host names to MAC addresses.
+         :type macs: dict(str: str)
+        """
+        for hostname, mac in macs.items():
+            self.connection.execute(self.hosts.update().
+                                    where(self.hosts.c.hostname == hostname).
+                                    values(mac=mac))
+
+    @contract
+    def select_host_macs(self):
+        """ Select the known MAC addresses of the hosts.
+
+        :return: A dict of host names to MAC addresses.
+         :rtype: dict(str: str)
+        """
+        sel = select([self.hosts.c.hostname, self.hosts.c.mac]). \
+            where(self.hosts.c.mac != None)
+        return dict((str(hostname), str(mac))
+                    for hostname, mac in self.connection.execute(sel))
+
     @contract
     def select_host_id(self, hostname):
         """ Select the ID of a host.
@@ -285,6 +369,36 @@ class Database(object):
         return dict((str(x[1]), int(x[0]))
                     for x in self.hosts.select().execute().fetchall())
 
+    @contract
+    def select_cpu_mhz_since(self, host_usage_id, vm_usage_id):
+        """ Select the CPU usage records added after the specified records.
+
+        Each record is a tuple of the record ID, the host or VM ID, the
+        timestamp, and the CPU MHz value.
+
+        :param host_usage_id: The ID of the last known host usage record.
+         :type host_usage_id: int,>=0
+
+        :param vm_usage_id: The ID of the last known VM usage record.
+         :type vm_usage_id: int,>=0
+
+        :return: The lists of the new host and VM usage records.
+         :rtype: tuple(list(tuple), list(tuple))
+        """
+        result = []
+        for table, column, last_id in [
+                (self.host_resource_usage,
+                 self.host_resource_usage.c.host_id, host_usage_id),
+                (self.vm_resource_usage,
+                 self.vm_resource_usage.c.vm_id, vm_usage_id)]:
+            sel = select([table.c.id, column, table.c.timestamp,
+                          table.c.cpu_mhz]). \
+                where(table.c.id > last_id). \
+                order_by(table.c.id)
+            result.append([(int(x[0]), int(x[1]), x[2], int(x[3]))
+                           for x in self.connection.execute(sel)])
+        return tuple(result)
+
     @contract(datetime_threshold=datetime.datetime)
     def cleanup_vm_resource_usage(self, datetime_threshold):
         """ Delete VM resource usage data older than the threshold.
@@ -381,6 +495,42 @@ class Database(object):
             host_id=self.select_host_id(hostname),
             overload=int(overload))
 
+    @contract
+    def insert_host_power_latency(self, hostname, state, latency):
+        """ Insert the latency of a power state transition of a host.
+
+        :param hostname: A host name.
+         :type hostname: str
+
+        :param state: The target state: 0 - suspended, 1 - active.
+         :type state: int
+
+        :param latency: The latency of the transition in seconds.
+         :type latency: number,>=0
+        """
+        self.host_power_latencies.insert().execute(
+            host_id=self.select_host_id(hostname),
+            state=state,
+            latency=float(latency))
+
+    @contract
+    def select_host_power_latencies(self):
+        """ Select the mean suspend and resume latencies of the hosts.
+
+        :return: Dicts of host names to mean suspend and resume latencies.
+         :rtype: tuple(dict(str: float), dict(str: float))
+        """
+        sel = select([self.hosts.c.hostname,
+                      self.host_power_latencies.c.state,
+                      func.avg(self.host_power_latencies.c.latency)]). \
+            where(self.hosts.c.id == self.host_power_latencies.c.host_id). \
+            group_by(self.hosts.c.hostname,
+                     self.host_power_latencies.c.state)
+        latencies = ({}, {})
+        for hostname, state, latency in self.connection.execute(sel):
+            latencies[state][str(hostname)] = float(latency)
+        return latencies
+
     @contract
     def insert_vm_migration(self, vm, hostname):
         """ Insert a VM migration.
@@ -16,10 +16,9 @@ from contracts import contract
 from neat.contracts_primitive import *
 from neat.contracts_extra import *
 
-from sqlalchemy import *
-from sqlalchemy.sql import func
+import time
 
-from neat.db import Database
+import neat.metrics as metrics
 
 import logging
 log = logging.getLogger(__name__)
@@ -35,7 +34,14 @@ def init_db(sql_connection):
     :return: The initialized database.
      :rtype: Database
     """
+    # SQLAlchemy is only loaded when a database is initialized
+    from sqlalchemy import create_engine, MetaData, Table, Column, \
+        ForeignKey, Integer, String, DateTime, Float
+    from sqlalchemy.sql import func
+    from neat.db import Database
+
     engine = create_engine(sql_connection)  # 'sqlite:///:memory:'
+    measure_queries(engine)
     metadata = MetaData()
     metadata.bind = engine
 
@@ -44,7 +50,8 @@ def init_db(sql_connection):
                   Column('hostname', String(255), nullable=False),
                   Column('cpu_mhz', Integer, nullable=False),
                   Column('cpu_cores', Integer, nullable=False),
-                  Column('ram', Integer, nullable=False))
+                  Column('ram', Integer, nullable=False),
+                  Column('mac', String(17)))
 
     host_resource_usage = \
         Table('host_resource_usage', metadata,
@@ -85,10 +92,84 @@ def init_db(sql_connection):
               Column('timestamp', DateTime, default=func.now()),
               Column('overload', Integer, nullable=False))
 
+    host_power_latencies = \
+        Table('host_power_latencies', metadata,
+              Column('id', Integer, primary_key=True),
+              Column('host_id', Integer, ForeignKey('hosts.id'), nullable=False),
+              Column('timestamp', DateTime, default=func.now()),
+              Column('state', Integer, nullable=False),
+              Column('latency', Float, nullable=False))
+
     metadata.create_all()
+    for table in metadata.sorted_tables:
+        add_missing_columns(engine, table)
     connection = engine.connect()
     db = Database(connection, hosts, host_resource_usage, vms,
-                  vm_resource_usage, vm_migrations, host_states, host_overload)
+                  vm_resource_usage, vm_migrations, host_states, host_overload,
+                  host_power_latencies)
 
     log.debug('Initialized a DB connection to %s', sql_connection)
     return db
+
+
+@contract
+def add_missing_columns(engine, table):
+    """ Add the columns of a table missing in an existing database.
+
+    Creating the tables does not alter the existing ones, so the columns
+    added to the schema later, e.g., hosts.mac, are added to the tables
+    of a database created by a previous version. Such columns must be
+    nullable.
+
+    :param engine: An SQLAlchemy engine.
+     :type engine: *
+
+    :param table: A table of the current schema.
+     :type table: *
+    """
+    from sqlalchemy import MetaData, Table
+
+    existing = Table(table.name, MetaData(),
+                     autoload=True, autoload_with=engine).c.keys()
+    for column in table.columns:
+        if column.name not in existing:
+            log.info('Adding the missing column %s.%s',
+                     table.name, column.name)
+            engine.execute('ALTER TABLE {0} ADD COLUMN {1} {2}'.format(
+                table.name, column.name,
+                column.type.compile(dialect=engine.dialect)))
+
+
+@contract
+def measure_queries(engine):
+    """ Count the queries executed by an engine and measure their latency.
+
+    The queries are labeled in the metrics by the type of the statement,
+    e.g., select or insert.
+
+    :param engine: An SQLAlchemy engine.
+     :type engine: *
+    """
+    from sqlalchemy import event
+
+    # The start time is kept in the execution context, which is
+    # discarded if the query fails
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.neat_start_time = time.time()
+
+    # The statement is passed as unicode, and the metrics must never
+    # make a query fail
+    def after(conn, cursor, statement, parameters, context, executemany):
+        if context is None or not hasattr(context, 'neat_start_time'):
+            return
+        try:
+            duration = time.time() - context.neat_start_time
+            labels = {'statement': str(statement.split(None, 1)[0].lower())}
+            metrics.inc('neat_db_queries_total', labels)
+            metrics.observe('neat_db_query_seconds', duration, labels)
+        except Exception:
+            log.exception('Exception at measuring a query:')
+
+    event.listen(engine, 'before_cursor_execute', before)
+    event.listen(engine, 'after_cursor_execute', after)
@@ -0,0 +1,294 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" A cached model of the cluster inventory used by the global manager.
+
+Processing a request requires the current placement of VMs on hosts,
+the RAM limits of the VMs, the RAM usage of the hosts, and the host
+characteristics. Obtaining them directly from the Nova API and the
+database results in O(VMs) API calls per request. Instead, the global
+manager keeps an in-process model of the cluster:
+
+- The VMs and their hosts and flavors are fully reloaded using a
+  single `servers.list()` call once the model is older than the TTL.
+  Otherwise, only the servers changed since the previous poll are
+  requested using the `changes-since` filter of the Nova API.
+
+- The flavors, the RAM usage of the hosts, and the host characteristics
+  stored in the database are cached for the TTL.
+
+- Migrations initiated by the global manager itself update the
+  placement of the migrated VMs in the model and invalidate the cached
+  RAM usage of the source and destination hosts.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+from neat.contracts_extra import *
+
+import datetime
+import threading
+import time
+
+import neat.metrics as metrics
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# The margin in seconds subtracted from the time of the previous poll
+# to tolerate a clock skew between the global manager and Nova
+CHANGES_SINCE_MARGIN = 60
+
+
+class ClusterModel(object):
+    """ A cached and incrementally updated model of the cluster.
+    """
+
+    @contract(ttl='number,>=0')
+    def __init__(self, nova, db, ttl):
+        """ Initialize the cluster model.
+
+        :param nova: A Nova client.
+        :param db: The database object.
+        :param ttl: The time to live of the cached data in seconds.
+        """
+        self.nova = nova
+        self.db = db
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.vms = {}
+        self.vms_updated = 0
+        self.vms_polled = 0
+        self.flavors = {}
+        self.flavors_updated = 0
+        self.hosts_ram = {}
+        self.characteristics = None
+        self.characteristics_updated = 0
+
+    @contract
+    def expired(self, timestamp):
+        """ Check whether data obtained at the timestamp have expired.
+
+        :param timestamp: The time the data were obtained.
+         :type timestamp: number
+
+        :return: Whether the data have expired.
+         :rtype: bool
+        """
+        return time.time() - timestamp >= self.ttl
+
+    def refresh_vms(self):
+        """ Bring the VM placement up to date.
+
+        The full list of servers is reloaded if it has expired,
+        otherwise only the servers changed since the previous poll are
+        requested.
+        """
+        with self.lock:
+            now = time.time()
+            expired = self.expired(self.vms_updated)
+            metrics.cache_requests('vms', not expired)
+            if expired:
+                self.vms = dict((str(vm.id), vm_info(vm))
+                                for vm in self.nova.servers.list())
+                self.vms_updated = now
+                log.debug('Reloaded %d VMs', len(self.vms))
+            else:
+                changes_since = datetime.datetime.utcfromtimestamp(
+                    self.vms_polled - CHANGES_SINCE_MARGIN). \
+                    strftime('%Y-%m-%dT%H:%M:%SZ')
+                changed = self.nova.servers.list(
+                    search_opts={'changes-since': changes_since})
+                for vm in changed:
+                    if vm.status == u'DELETED':
+                        self.vms.pop(str(vm.id), None)
+                    else:
+                        self.vms[str(vm.id)] = vm_info(vm)
+                log.debug('Updated %d changed VMs', len(changed))
+            self.vms_polled = now
+
+    @contract
+    def vms_by_hosts(self, hosts):
+        """ Get a map of host names to VMs.
+
+        :param hosts: A list of host names.
+         :type hosts: list(str)
+
+        :return: A dict of host names to lists of VM UUIDs.
+         :rtype: dict(str: list(str))
+        """
+        with self.lock:
+            self.refresh_vms()
+            result = dict((host, []) for host in hosts)
+            for uuid, vm in self.vms.items():
+                if vm['host'] in result:
+                    result[vm['host']].append(uuid)
+            return result
+
+    @contract
+    def vms_by_host(self, host):
+        """ Get VMs from the specified host.
+
+        :param host: A host name.
+         :type host: str
+
+        :return: A list of VM UUIDs from the specified host.
+         :rtype: list(str)
+        """
+        return self.vms_by_hosts([host])[host]
+
+    @contract
+    def flavors_ram(self):
+        """ Get a dict of flavor IDs to the RAM limits.
+
+        :return: A dict of flavor IDs to the RAM limits.
+         :rtype: dict(str: int)
+        """
+        with self.lock:
+            expired = self.expired(self.flavors_updated)
+            metrics.cache_requests('flavors', not expired)
+            if expired:
+                self.flavors = dict((str(fl.id), fl.ram)
+                                    for fl in self.nova.flavors.list())
+                self.flavors_updated = time.time()
+            return self.flavors
+
+    @contract
+    def vms_ram_limit(self, vms):
+        """ Get the RAM limit from the flavors of the VMs.
+
+        The VMs missing in the model are requested from Nova one by
+        one, the VMs that do not exist anymore are skipped.
+
+        :param vms: A list of VM UUIDs.
+         :type vms: list(str)
+
+        :return: A dict of VM UUIDs to the RAM limits.
+         :rtype: dict(str: int)
+        """
+        # Already loaded by the Nova client
+        import novaclient.exceptions
+
+        with self.lock:
+            flavors_to_ram = self.flavors_ram()
+            vms_ram = {}
+            for uuid in vms:
+                metrics.cache_requests('vms', uuid in self.vms)
+                if uuid not in self.vms:
+                    try:
+                        self.vms[uuid] = vm_info(self.nova.servers.get(uuid))
+                    except novaclient.exceptions.NotFound:
+                        continue
+                flavor = self.vms[uuid]['flavor']
+                if flavor not in flavors_to_ram:
+                    self.flavors_updated = 0
+                    flavors_to_ram = self.flavors_ram()
+                if flavor in flavors_to_ram:
+                    vms_ram[uuid] = flavors_to_ram[flavor]
+            return vms_ram
+
+    @contract
+    def host_used_ram(self, host):
+        """ Get the used RAM of the host.
+
+        :param host: A host name.
+         :type host: str
+
+        :return: The used RAM of the host.
+         :rtype: int
+        """
+        with self.lock:
+            expired = host not in self.hosts_ram or \
+                self.expired(self.hosts_ram[host][1])
+            metrics.cache_requests('hosts_ram', not expired)
+            if expired:
+                self.hosts_ram[host] = (host_used_ram(self.nova, host),
+                                        time.time())
+            return self.hosts_ram[host][0]
+
+    @contract
+    def host_characteristics(self):
+        """ Get the characteristics of all the hosts from the database.
+
+        :return: Three dicts of hostnames to CPU MHz, cores, and RAM.
+         :rtype: tuple(dict(str: int), dict(str: int), dict(str: int))
+        """
+        with self.lock:
+            expired = self.characteristics is None or \
+                self.expired(self.characteristics_updated)
+            metrics.cache_requests('host_characteristics', not expired)
+            if expired:
+                self.characteristics = self.db.select_host_characteristics()
+                self.characteristics_updated = time.time()
+            return tuple(dict(x) for x in self.characteristics)
+
+    @contract
+    def record_migrations(self, placement):
+        """ Account migrations initiated by the global manager.
+
+        The migrated VMs are moved to their destination hosts, and the
+        RAM usage of the source and destination hosts is invalidated.
+
+        :param placement: A dict of VM UUIDs to host names.
+         :type placement: dict(str: str)
+        """
+        with self.lock:
+            for uuid, host in placement.items():
+                if uuid in self.vms:
+                    self.hosts_ram.pop(self.vms[uuid]['host'], None)
+                    self.vms[uuid]['host'] = host
+                self.hosts_ram.pop(host, None)
+
+    def invalidate(self):
+        """ Drop all the cached data.
+        """
+        with self.lock:
+            self.vms_updated = 0
+            self.flavors_updated = 0
+            self.hosts_ram = {}
+            self.characteristics = None
+
+
+@contract
+def vm_info(vm):
+    """ Extract the data about a VM stored in the cluster model.
+
+    :param vm: A Nova VM object.
+     :type vm: *
+
+    :return: A dict of the host name and flavor ID of the VM.
+     :rtype: dict(str: str)
+    """
+    return {'host': str(getattr(vm, 'OS-EXT-SRV-ATTR:host')),
+            'flavor': str(vm.flavor['id'])}
+
+
+@contract
+def host_used_ram(nova, host):
+    """ Get the used RAM of the host using the Nova API.
+
+    :param nova: A Nova client.
+     :type nova: *
+
+    :param host: A host name.
+     :type host: str
+
+    :return: The used RAM of the host.
+     :rtype: int
+    """
+    data = nova.hosts.get(host)
+    if len(data) > 2 and data[2].memory_mb != 0:
+        return data[2].memory_mb
+    return data[1].memory_mb
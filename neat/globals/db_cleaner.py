@@ -28,6 +28,7 @@ import datetime
 import neat.common as common
 from neat.config import *
 from neat.db_utils import *
+import neat.profiler as profiler
 
 import logging
 log = logging.getLogger(__name__)
@@ -47,6 +48,7 @@ def start():
         config['log_directory'],
         'db-cleaner.log',
         int(config['log_level']))
+    profiler.init_profiler(config, 'db-cleaner')
 
     interval = config['db_cleaner_interval']
     if log.isEnabledFor(logging.INFO):
@@ -0,0 +1,132 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" A command line client of the dry-run mode of the global manager.
+
+The command asks the global manager what it would do if it received
+a request from a host, without migrating any VMs or switching any
+hosts. If only a host is specified, the host is considered
+underloaded and all its VMs are placed; if VM UUIDs are specified, the
+host is considered overloaded and only these VMs are placed:
+
+    neat-dry-run compute1
+    neat-dry-run compute1 <vm uuid> <vm uuid>
+
+The command prints the placement, the migration plan, the hosts that
+would be switched on and off, and the time spent in each phase of
+processing the request by the global manager.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+import argparse
+from hashlib import sha1
+import json
+
+from neat.config import *
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# The phases of processing a request, which are timed separately
+PHASES = ['db', 'nova', 'placement', 'plan', 'migration', 'power']
+
+
+def start(args=None):
+    """ Request a dry run from the global manager and print the report.
+
+    :param args: The command line arguments, None to use sys.argv.
+    """
+    parser = argparse.ArgumentParser(
+        description='Show what the global manager would do on a ' +
+                    'request from a host.')
+    parser.add_argument('host', help='the host sending the request')
+    parser.add_argument('vm_uuids', nargs='*',
+                        help='the VMs to migrate from an overloaded host, ' +
+                             'none for an underloaded host')
+    args = parser.parse_args(args)
+    config = read_and_validate_config([DEFAILT_CONFIG_PATH, CONFIG_PATH],
+                                      REQUIRED_FIELDS)
+    print format_report(request_dry_run(config, args.host, args.vm_uuids))
+
+
+@contract
+def request_dry_run(config, host, vm_uuids):
+    """ Request the global manager to process a request in the dry-run mode.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param host: The name of the host.
+     :type host: str
+
+    :param vm_uuids: The VMs to migrate, [] for an underloaded host.
+     :type vm_uuids: list(str)
+
+    :return: The report of the global manager.
+     :rtype: dict
+    """
+    # Requests is only loaded by the command, not by the global manager
+    import requests
+
+    params = {'username': sha1(config['os_admin_user']).hexdigest(),
+              'password': sha1(config['os_admin_password']).hexdigest(),
+              'host': host,
+              'reason': 1 if vm_uuids else 0}
+    if vm_uuids:
+        params['vm_uuids'] = ','.join(vm_uuids)
+    response = requests.get('http://' + config['global_manager_host'] +
+                            ':' + config['global_manager_port'] +
+                            '/dry-run', params=params)
+    response.raise_for_status()
+    return json.loads(response.content)
+
+
+@contract
+def format_report(report):
+    """ Format a dry-run report for printing.
+
+    :param report: A report returned by the global manager.
+     :type report: dict
+
+    :return: The formatted report.
+     :rtype: str
+    """
+    lines = ['Placement:']
+    for vm, host in sorted(report['placement'].items()):
+        lines.append('  {0} -> {1}'.format(vm, host))
+    if not report['placement']:
+        lines.append('  none')
+    lines.append('Migration plan:')
+    for i, (placement, sources, dependencies) in enumerate(report['plan']):
+        lines.append('  Phase {0}:'.format(i + 1))
+        for vm, host in sorted(placement.items()):
+            line = '    {0}: {1} -> {2}'.format(vm, sources[vm], host)
+            if dependencies.get(vm):
+                line += ' after ' + ', '.join(sorted(dependencies[vm]))
+            lines.append(line)
+    if report['unplanned']:
+        lines.append('Cannot be migrated: ' +
+                     ', '.join(sorted(report['unplanned'])))
+    lines.append('Hosts to switch on: ' +
+                 (', '.join(report['hosts_to_activate']) or 'none'))
+    lines.append('Hosts to switch off: ' +
+                 (', '.join(report['hosts_to_deactivate']) or 'none'))
+    lines.append('Processing times:')
+    for phase in PHASES + ['total']:
+        lines.append('  {0:10} {1:8.3f} s'.format(
+            phase, report['timings'].get(phase, 0.)))
+    return '\n'.join(str(x) for x in lines)
@@ -0,0 +1,175 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Forecasting of the aggregate CPU demand of the cluster.
+
+Inactive hosts are normally switched on only once an overload has
+occurred, so the VMs to migrate wait for the resume of the hosts. The
+forecaster allows the global manager to switch on hosts ahead of the
+projected peaks of demand, and to avoid switching off hosts that will
+be needed soon.
+
+The demand of the cluster is the sum of the CPU usage of all the hosts
+and VMs collected in the `host_resource_usage` and `vm_resource_usage`
+tables, aggregated in buckets of the data collection interval. As the
+database keeps only a short history, the forecaster reads only the new
+records on each update, and maintains a time-of-day seasonal profile:
+the demand of each bucket is exponentially smoothed with the demand in
+the same bucket of the previous periods. The forecast peak demand over
+a horizon is the maximum of the seasonal profile over the buckets of
+the horizon and the latest observed demand.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+import calendar
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class DemandForecaster(object):
+    """ A seasonal exponential smoothing model of the cluster demand.
+    """
+
+    @contract(period='int,>0',
+              interval='int,>0',
+              smoothing='number,>0,<=1')
+    def __init__(self, period, interval, smoothing):
+        """ Initialize the forecaster.
+
+        :param period: The length of the seasonal period in seconds.
+        :param interval: The length of a bucket in seconds.
+        :param smoothing: The weight of the latest observation.
+        """
+        self.period = period
+        self.interval = interval
+        self.smoothing = smoothing
+        self.seasonal = {}
+        self.buckets = {}
+        self.current = None
+        self.latest = None
+        self.host_usage_id = 0
+        self.vm_usage_id = 0
+
+    @contract
+    def slot(self, timestamp):
+        """ Get the index of the bucket within the seasonal period.
+
+        :param timestamp: A time in seconds.
+         :type timestamp: number
+
+        :return: The index of the bucket.
+         :rtype: int,>=0
+        """
+        return int(timestamp % self.period // self.interval)
+
+    @contract
+    def observe(self, samples):
+        """ Add CPU usage samples of the hosts and VMs.
+
+        :param samples: A list of timestamps, host or VM keys, and CPU MHz.
+         :type samples: list(tuple(number, *, number))
+        """
+        for timestamp, key, cpu_mhz in samples:
+            bucket = timestamp - timestamp % self.interval
+            totals = self.buckets.setdefault(bucket, {}). \
+                setdefault(key, [0, 0])
+            totals[0] += cpu_mhz
+            totals[1] += 1
+            if self.latest is None or timestamp > self.latest:
+                self.latest = timestamp
+        if self.latest is not None:
+            self.update(self.latest)
+
+    @contract
+    def update(self, now):
+        """ Fold the completed buckets into the seasonal profile.
+
+        A bucket is completed one interval after its end to account
+        for the samples arriving late.
+
+        :param now: The current time in seconds.
+         :type now: number
+        """
+        for bucket in sorted(self.buckets.keys()):
+            if bucket + 2 * self.interval > now:
+                break
+            # The demand is the sum of the mean usage of each host and VM
+            demand = float(sum(float(total) / count for total, count
+                               in self.buckets.pop(bucket).values()))
+            slot = self.slot(bucket)
+            if slot in self.seasonal:
+                self.seasonal[slot] = self.smoothing * demand + \
+                    (1 - self.smoothing) * self.seasonal[slot]
+            else:
+                self.seasonal[slot] = demand
+            self.current = demand
+
+    @contract
+    def forecast(self, horizon):
+        """ Forecast the peak demand over the horizon after the latest sample.
+
+        :param horizon: The forecasting horizon in seconds.
+         :type horizon: number,>=0
+
+        :return: The peak demand in MHz, or None if there are no data.
+         :rtype: None|float
+        """
+        if self.current is None:
+            return None
+        values = [self.current]
+        offset = 0
+        while offset <= horizon:
+            slot = self.slot(self.latest + offset)
+            if slot in self.seasonal:
+                values.append(self.seasonal[slot])
+            offset += self.interval
+        return max(values)
+
+
+@contract
+def to_seconds(timestamp):
+    """ Convert a timestamp stored in the database to seconds.
+
+    :param timestamp: A timestamp.
+     :type timestamp: datetime
+
+    :return: The number of seconds since the epoch.
+     :rtype: int
+    """
+    return calendar.timegm(timestamp.timetuple())
+
+
+@contract
+def select_hosts(deficit, hosts_cpu):
+    """ Select the largest hosts providing the required CPU capacity.
+
+    :param deficit: The required CPU capacity in MHz.
+     :type deficit: number
+
+    :param hosts_cpu: A dict of host names to the available CPU in MHz.
+     :type hosts_cpu: dict(str: number)
+
+    :return: The selected hosts, all of them if insufficient.
+     :rtype: list(str)
+    """
+    selected = []
+    for cpu, host in sorted([(-cpu, host) for host, cpu in hosts_cpu.items()]):
+        if deficit <= 0:
+            break
+        selected.append(host)
+        deficit += cpu
+    return selected
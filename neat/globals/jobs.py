@@ -0,0 +1,208 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" A queue of the jobs submitted to the global manager.
+
+Requests from local managers are not processed by the REST handler
+directly. Instead, each request is turned into a job and put into a
+queue, which is consumed by a worker thread. At most one job per host
+is pending at any time: a new request from a host replaces the pending
+job of that host, as only the latest state of the host is relevant.
+Jobs are kept in a bounded history to allow querying their status.
+The resource usage data reported with a request are kept in the job
+only until the job is finished.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+import collections
+import threading
+import time
+import uuid
+
+import logging
+log = logging.getLogger(__name__)
+
+
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+REPLACED = 'replaced'
+
+
+class JobQueue(object):
+    """ A thread-safe FIFO queue of jobs with per-host deduplication.
+    """
+
+    @contract(history_size='int,>0')
+    def __init__(self, history_size=1000):
+        """ Initialize the job queue.
+
+        :param history_size: The maximum number of jobs to keep.
+        """
+        self.condition = threading.Condition()
+        self.pending = collections.OrderedDict()
+        self.jobs = collections.OrderedDict()
+        self.history_size = history_size
+
+    @contract
+    def put(self, host, reason, vm_uuids, data=None):
+        """ Submit a new job, replacing the pending job of the same host.
+
+        :param host: The name of the host that sent the request.
+         :type host: str
+
+        :param reason: The reason of the request: 0 - underload, 1 - overload.
+         :type reason: int
+
+        :param vm_uuids: A list of VM UUIDs to migrate from the host.
+         :type vm_uuids: list(str)
+
+        :param data: The resource usage data reported by the host.
+         :type data: dict|None
+
+        :return: The submitted job.
+         :rtype: dict(str: *)
+        """
+        job = {'id': uuid.uuid4().hex,
+               'host': host,
+               'reason': reason,
+               'vm_uuids': vm_uuids,
+               'data': data or {},
+               'status': PENDING,
+               'submitted': time.time(),
+               'started': None,
+               'completed': None,
+               'replaced_by': None,
+               'error': None}
+        with self.condition:
+            previous = self.pending.pop(host, None)
+            if previous is not None:
+                previous['status'] = REPLACED
+                previous['replaced_by'] = job['id']
+                previous['completed'] = job['submitted']
+                previous['data'] = {}
+                log.info('Job %s of host %s replaced by job %s',
+                         previous['id'], host, job['id'])
+            self.pending[host] = job
+            self.jobs[job['id']] = job
+            self._trim()
+            self.condition.notify()
+        return job
+
+    @contract
+    def get(self, timeout=None):
+        """ Take the oldest pending job and mark it as running.
+
+        :param timeout: The maximum time to wait in seconds, None to block.
+         :type timeout: None|number
+
+        :return: The job, or None if no job has arrived before the timeout.
+         :rtype: None|dict(str: *)
+        """
+        with self.condition:
+            if timeout is None:
+                while not self.pending:
+                    self.condition.wait()
+            else:
+                deadline = time.time() + timeout
+                while not self.pending:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    self.condition.wait(remaining)
+            _, job = self.pending.popitem(last=False)
+            job['status'] = RUNNING
+            job['started'] = time.time()
+            return job
+
+    @contract
+    def get_all(self):
+        """ Take all the pending jobs without waiting.
+
+        :return: The list of jobs in the order of submission.
+         :rtype: list(dict(str: *))
+        """
+        with self.condition:
+            jobs = self.pending.values()
+            self.pending.clear()
+            now = time.time()
+            for job in jobs:
+                job['status'] = RUNNING
+                job['started'] = now
+            return jobs
+
+    @contract
+    def replace(self, job, replaced_by):
+        """ Mark a taken job as replaced by a newer job of the same host.
+
+        :param job: A job returned by get() or get_all().
+         :type job: dict(str: *)
+
+        :param replaced_by: The job replacing it.
+         :type replaced_by: dict(str: *)
+        """
+        with self.condition:
+            job['status'] = REPLACED
+            job['replaced_by'] = replaced_by['id']
+            job['completed'] = time.time()
+            job['data'] = {}
+        log.info('Job %s of host %s replaced by job %s',
+                 job['id'], job['host'], replaced_by['id'])
+
+    @contract
+    def complete(self, job, error=None):
+        """ Mark a job as completed or failed.
+
+        :param job: A job returned by get().
+         :type job: dict(str: *)
+
+        :param error: The error message if the job has failed.
+         :type error: None|str
+        """
+        with self.condition:
+            job['status'] = COMPLETED if error is None else FAILED
+            job['error'] = error
+            job['completed'] = time.time()
+            job['data'] = {}
+
+    @contract
+    def status(self, job_id):
+        """ Get a copy of the job with the specified ID.
+
+        :param job_id: The ID of a job.
+         :type job_id: str
+
+        :return: A copy of the job without the data, or None if not found.
+         :rtype: None|dict(str: *)
+        """
+        with self.condition:
+            if job_id not in self.jobs:
+                return None
+            job = dict(self.jobs[job_id])
+            del job['data']
+            return job
+
+    def _trim(self):
+        """ Drop the oldest finished jobs exceeding the history size.
+        """
+        excess = len(self.jobs) - self.history_size
+        for job_id in list(self.jobs.keys()):
+            if excess <= 0:
+                break
+            if self.jobs[job_id]['status'] not in (PENDING, RUNNING):
+                del self.jobs[job_id]
+                excess -= 1
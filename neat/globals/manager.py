@@ -53,6 +53,59 @@ request from a local manager, the following steps will be performed:
 4. Call the Nova API to migrate the VMs according to the placement
    determined by the `algorithm_vm_placement_factory` algorithm.
 
+These steps are not performed by the request handler itself. A
+validated request is turned into a job and put into a queue, and the
+handler immediately responds with the status code 202 and the ID of
+the job. The jobs are processed by a worker thread. A new request from
+a host replaces the pending job of that host, if there is one. The
+status of a job can be obtained by a GET request to /jobs/<job_id>.
+
+The requests are served by the WSGI server specified in the
+`global_manager_server` option. By default, the threaded server of
+`neat.globals.server` is used, which handles the requests of the
+hosts concurrently and keeps their connections open. The requests of
+the same host are serialized, and a request older than the latest
+accepted request of the host is rejected.
+
+A GET request to /dry-run with the host, reason and vm_uuids
+parameters processes a request in the dry-run mode: the response
+contains the placement, the migration plan, the hosts that would be
+switched on and off, and the time spent in each phase of processing,
+while no VMs are migrated. A dry run does not wait for the running
+jobs, and its timings are not recorded in the metrics. The
+`neat-dry-run` command sends such requests from the command line.
+
+Besides the form-encoded requests, the global manager accepts batches
+of events encoded in JSON or msgpack at /v1/events, as defined in
+`neat.protocol`. The events can carry the recent CPU usage of the VMs
+of the host, which is then used instead of reading it from the
+database.
+
+When a load spike hits, many hosts may report overloads within a few
+seconds. To avoid running a separate placement for each of them, the
+worker waits for `global_manager_coalescing_window` seconds after the
+submission of a job and then processes all the jobs submitted in the
+meantime jointly: a single snapshot of the hosts and VMs is taken, and
+the VMs to migrate from all the reporting hosts are placed together.
+
+The metrics of the global manager, such as the time spent in each
+phase of processing, the database queries, the hits of the caches,
+and the migrations in progress, are served in the Prometheus text
+format at /metrics, as described in `neat.metrics`.
+
+To avoid O(VMs) Nova API calls per request, the data about the hosts
+and VMs are obtained from a cached model of the cluster implemented in
+`neat.globals.cluster`, which is refreshed according to the
+`cluster_model_ttl` option and updated by the migrations initiated by
+the global manager.
+
+To avoid waiting for hosts to resume when an overload has already
+occurred, the global manager forecasts the aggregate CPU demand of the
+cluster using a time-of-day seasonal model implemented in
+`neat.globals.forecast`. The hosts required by the demand forecast
+over the `forecast_horizon` are switched on in advance, and are not
+switched off when idle.
+
 When a host needs to be switched to the sleep mode, the global manager
 will use the account credentials from the `compute_user` and
 `compute_password` configuration options to open an SSH connection
@@ -62,9 +115,11 @@ with the target host and then invoke the command specified in the
 When a host needs to be re-activated from the sleep mode, the global
 manager will leverage the Wake-on-LAN technology and send a magic
 packet to the target host using the `ether-wake` program and passing
-the corresponding MAC address as an argument. The mapping between the
-IP addresses of the hosts and their MAC addresses is initialized in
-the beginning of the global manager's execution.
+the corresponding MAC address as an argument. The MAC addresses of
+the hosts are stored in the database. The unknown MAC addresses are
+discovered in the beginning of the global manager's execution by
+reading the kernel ARP table, and pinging in parallel only the hosts
+missing in it.
 """
 
 from contracts import contract
@@ -72,15 +127,28 @@ from neat.contracts_primitive import *
 from neat.contracts_extra import *
 
 import bottle
+import contextlib
+import copy
 from hashlib import sha1
-import novaclient
-from novaclient.v2 import client
+import os
+import socket
+import threading
 import time
 import subprocess
 
 import neat.common as common
 from neat.config import *
 from neat.db_utils import *
+from neat.globals.cluster import ClusterModel
+from neat.globals.dry_run import PHASES
+import neat.globals.forecast as forecast
+from neat.globals.jobs import JobQueue
+from neat.globals.power import PowerManager
+import neat.globals.migration as migration
+from neat.globals.server import HostLocks, ThreadingServer
+import neat.metrics as metrics
+import neat.profiler as profiler
+import neat.protocol as protocol
 
 import logging
 log = logging.getLogger(__name__)
@@ -93,16 +161,23 @@ else:
     etherwake = 'etherwake'
 
 
+# The kernel ARP table used to discover the MAC addresses of the hosts
+ARP_TABLE = '/proc/net/arp'
+
+
 ERRORS = {
     400: 'Bad input parameter: incorrect or missing parameters',
     401: 'Unauthorized: user credentials are missing',
     403: 'Forbidden: user credentials do not much the ones ' +
          'specified in the configuration file',
+    404: 'Not found: there is no job with the specified ID',
     405: 'Method not allowed: the request is made with ' +
          'a method other than the only supported PUT',
     412: 'Precondition failed: the request has been sent more ' +
          'than 5 seconds ago, the states of the hosts/VMs may ' +
-         'have changed - retry'}
+         'have changed - retry',
+    415: 'Unsupported media type: the request body must be ' +
+         'encoded in one of the supported formats'}
 
 
 @contract
@@ -138,12 +213,7 @@ def validate_params(user, password, params):
     :return: Whether the parameters are valid.
      :rtype: bool
     """
-    if 'username' not in params or 'password' not in params:
-        raise_error(401)
-        return False
-    if params['username'] != user or \
-       params['password'] != password:
-        raise_error(403)
+    if not validate_credentials(user, password, params):
         return False
     if 'reason' not in params or \
        'time' not in params or \
@@ -160,6 +230,32 @@ def validate_params(user, password, params):
     return True
 
 
+@contract
+def validate_credentials(user, password, params):
+    """ Validate the credentials passed in the request parameters.
+
+    :param user: A sha1-hashed user name to compare to.
+     :type user: str
+
+    :param password: A sha1-hashed password to compare to.
+     :type password: str
+
+    :param params: A dictionary of input parameters.
+     :type params: dict(str: *)
+
+    :return: Whether the credentials are valid.
+     :rtype: bool
+    """
+    if 'username' not in params or 'password' not in params:
+        raise_error(401)
+        return False
+    if params['username'] != user or \
+       params['password'] != password:
+        raise_error(403)
+        return False
+    return True
+
+
 def start():
     """ Start the global manager web service.
     """
@@ -170,13 +266,18 @@ def start():
         config['log_directory'],
         'global-manager.log',
         int(config['log_level']))
+    metrics.init_metrics(config, 'global_manager')
+    profiler.init_profiler(config, 'global-manager')
 
     state = init_state(config)
     switch_hosts_on(state['db'],
+                    state['power'],
                     config['ether_wake_interface'],
                     state['host_macs'],
                     state['compute_hosts'])
 
+    start_worker(config, state)
+
     bottle.debug(True)
     bottle.app().state = {
         'config': config,
@@ -184,8 +285,15 @@ def start():
 
     host = config['global_manager_host']
     port = config['global_manager_port']
-    log.info('Starting the global manager listening to %s:%s', host, port)
-    bottle.run(host=host, port=port)
+    server = config['global_manager_server']
+    log.info('Starting the global manager listening to %s:%s using ' +
+             'the %s server', host, port, server)
+    if server == 'threaded':
+        bottle.run(server=ThreadingServer, host=host, port=port,
+                   keepalive_timeout=float(
+                       config['global_manager_keepalive_timeout']))
+    else:
+        bottle.run(server=server, host=host, port=port)
 
 
 @contract
@@ -231,23 +339,207 @@ def service():
     log.info('Received a request from %s: %s',
              get_remote_addr(bottle.request),
              str(params))
+    job = submit_job(state['state'], params)
+    if job is None:
+        raise_error(412)
+    bottle.response.status = 202
+    return {'job': job['id'],
+            'status': job['status']}
+
+
+@bottle.put('/v1/events')
+def events():
+    state = bottle.app().state
+    content_type = bottle.request.content_type.split(';')[0].strip()
+    if content_type not in protocol.supported_content_types():
+        raise_error(415)
     try:
-        if params['reason'] == 0:
-            log.info('Processing an underload of a host %s', params['host'])
-            execute_underload(
-                state['config'],
-                state['state'],
-                params['host'])
+        message = protocol.decode(bottle.request.body.read(), content_type)
+    except ValueError:
+        raise_error(400)
+    if message.get('version') != protocol.VERSION or \
+       not isinstance(message.get('events'), list):
+        raise_error(400)
+    validate_credentials(state['state']['hashed_username'],
+                         state['state']['hashed_password'],
+                         message)
+    log.info('Received %d events from %s', len(message['events']),
+             get_remote_addr(bottle.request))
+    results = []
+    for event in message['events']:
+        error = validate_event(event)
+        if error is None:
+            job = submit_job(state['state'], event,
+                             {'host_cpu_mhz': event.get('host_cpu_mhz', []),
+                              'vm_cpu_mhz': event.get('vm_cpu_mhz', {})})
+            if job is None:
+                error = 412
+        if error is None:
+            results.append({'job': job['id'],
+                            'status': job['status']})
         else:
-            log.info('Processing an overload, VMs: %s', str(params['vm_uuids']))
-            execute_overload(
-                state['config'],
-                state['state'],
-                params['host'],
-                params['vm_uuids'])
-    except:
-        log.exception('Exception during request processing:')
-        raise
+            log.info('Rejected an event: %s', ERRORS[error])
+            results.append({'error': error})
+    # A batch of a single event is answered with the status of the event
+    if len(results) == 1 and 'error' in results[0]:
+        bottle.response.status = results[0]['error']
+    else:
+        bottle.response.status = 202
+    bottle.response.content_type = content_type
+    return protocol.encode({'version': protocol.VERSION,
+                            'jobs': results}, content_type)
+
+
+@contract
+def validate_event(event):
+    """ Validate an event received in a batch.
+
+    :param event: An event decoded from a request.
+     :type event: *
+
+    :return: None if the event is valid, or the error status code.
+     :rtype: None|int
+    """
+    integer = (int, long)
+    number = integer + (float,)
+    if not isinstance(event, dict) or \
+       not isinstance(event.get('host'), str) or \
+       not isinstance(event.get('time'), number) or \
+       event.get('reason') not in [0, 1] or \
+       not isinstance(event.get('vm_uuids', []), list) or \
+       event['reason'] == 1 and not event.get('vm_uuids') or \
+       not all(isinstance(x, str) for x in event.get('vm_uuids', [])) or \
+       not isinstance(event.get('host_cpu_mhz', []), list) or \
+       not all(isinstance(x, integer)
+               for x in event.get('host_cpu_mhz', [])) or \
+       not isinstance(event.get('vm_cpu_mhz', {}), dict) or \
+       not all(isinstance(x, list) and
+               all(isinstance(y, integer) for y in x)
+               for x in event.get('vm_cpu_mhz', {}).values()):
+        return 400
+    if event['time'] + 5 < time.time():
+        return 412
+    return None
+
+
+@contract
+def submit_job(state, params, data=None):
+    """ Queue a job for a validated request of a host.
+
+    Requests are handled concurrently, so the requests of a host may
+    arrive out of order: a request older than the latest accepted
+    request of the host must not replace its job.
+
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :param params: The parameters of the request.
+     :type params: dict(str: *)
+
+    :param data: The resource usage data reported by the host.
+     :type data: dict|None
+
+    :return: The queued job, or None if the request is out of date.
+     :rtype: None|dict(str: *)
+    """
+    host = params['host']
+    with state['host_locks'](host):
+        if params['time'] < state['request_times'].get(host, 0):
+            return None
+        state['request_times'][host] = params['time']
+        job = state['jobs'].put(host,
+                                params['reason'],
+                                params.get('vm_uuids', []),
+                                data)
+    log.info('Queued job %s for host %s', job['id'], host)
+    return job
+
+
+@bottle.get('/jobs/<job_id>')
+def job_status(job_id):
+    params = dict(bottle.request.query)
+    state = bottle.app().state
+    validate_credentials(state['state']['hashed_username'],
+                         state['state']['hashed_password'],
+                         params)
+    job = state['state']['jobs'].status(str(job_id))
+    if job is None:
+        raise_error(404)
+    return job
+
+
+@bottle.get('/dry-run')
+def dry_run_service():
+    params = dict(bottle.request.query)
+    state = bottle.app().state
+    validate_credentials(state['state']['hashed_username'],
+                         state['state']['hashed_password'],
+                         params)
+    try:
+        reason = int(params.get('reason'))
+    except (TypeError, ValueError):
+        reason = None
+    vm_uuids = [x for x in params.get('vm_uuids', '').split(',') if x]
+    if 'host' not in params or \
+       reason not in [0, 1] or \
+       reason == 1 and not vm_uuids:
+        raise_error(400)
+    log.info('Received a dry-run request from %s: %s',
+             get_remote_addr(bottle.request), str(params))
+    return dry_run(state['config'], state['state'],
+                   params['host'], reason, vm_uuids)
+
+
+@contract
+def dry_run(config, state, host, reason, vm_uuids):
+    """ Process a request in the dry-run mode and report the decisions.
+
+    The request is processed against the current cluster model without
+    migrating VMs or switching hosts. It is processed on a snapshot of
+    the state without taking the execution lock, so it does not wait
+    for the running jobs: the state of the VM placement algorithm is
+    copied, and a separate database connection is used.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :param host: The name of the host.
+     :type host: str
+
+    :param reason: The reason of the request: 0 - underload, 1 - overload.
+     :type reason: int
+
+    :param vm_uuids: A list of VM UUIDs to migrate from the host.
+     :type vm_uuids: list(str)
+
+    :return: The report of the placement, actions and timings.
+     :rtype: dict(str: *)
+    """
+    if reason == 0:
+        underloaded_hosts, overloaded_vms = [host], {}
+    else:
+        underloaded_hosts, overloaded_vms = [], {host: vm_uuids}
+    report = {}
+    snapshot = dict(state)
+    if 'vm_placement_state' in state:
+        snapshot['vm_placement_state'] = \
+            copy.deepcopy(state['vm_placement_state'])
+    snapshot['db'] = state['db'].copy()
+    try:
+        execute_joint(config, snapshot, underloaded_hosts, overloaded_vms,
+                      None, report)
+    finally:
+        snapshot['db'].connection.close()
+    return report
+
+
+@bottle.get('/metrics')
+def metrics_service():
+    bottle.response.content_type = 'text/plain; version=0.0.4'
+    return metrics.REGISTRY.render()
 
 
 @bottle.route('/', method='ANY')
@@ -268,33 +560,72 @@ def init_state(config):
     :return: A dict containing the initial state of the global managerr.
      :rtype: dict
     """
+    # The Nova client is only loaded when the manager is started
+    from novaclient.v2 import client
+
+    db = init_db(config['sql_connection'])
+    nova = client.Client(config['os_admin_user'],
+                         config['os_admin_password'],
+                         config['os_admin_tenant_name'],
+                         config['os_auth_url'],
+                         service_type="compute")
+    power = PowerManager(int(config['power_probe_port']),
+                         float(config['power_probe_interval']),
+                         float(config['power_command_timeout']),
+                         float(config['power_ready_timeout']))
+    power.set_resume_latencies(db.select_host_power_latencies()[1])
     return {'previous_time': 0,
-            'db': init_db(config['sql_connection']),
-            'nova': client.Client(config['os_admin_user'],
-                                  config['os_admin_password'],
-                                  config['os_admin_tenant_name'],
-                                  config['os_auth_url'],
-                                  service_type="compute"),
+            'db': db,
+            'nova': nova,
+            'cluster': ClusterModel(nova, db,
+                                    float(config['cluster_model_ttl'])),
             'hashed_username': sha1(config['os_admin_user']).hexdigest(),
             'hashed_password': sha1(config['os_admin_password']).hexdigest(),
             'compute_hosts': common.parse_compute_hosts(
                                         config['compute_hosts']),
-            'host_macs': {}}
+            'host_macs': db.select_host_macs(),
+            'jobs': JobQueue(),
+            'execution_lock': threading.Lock(),
+            'host_locks': HostLocks(),
+            'request_times': {},
+            'forecaster': forecast.DemandForecaster(
+                int(config['forecast_period']),
+                int(config['data_collector_interval']),
+                float(config['forecast_smoothing'])),
+            'power': power}
 
 
 @contract
-def execute_underload(config, state, host):
-    """ Process an underloaded host: migrate all VMs from the host.
+def start_worker(config, state):
+    """ Start a daemon thread processing the queued jobs.
 
-1. Prepare the data about the current states of the hosts and VMs.
+    :param config: A config dictionary.
+     :type config: dict(str: *)
 
-2. Call the function specified in the `algorithm_vm_placement_factory`
-   configuration option and pass the data on the states of the hosts and VMs.
+    :param state: A state dictionary.
+     :type state: dict(str: *)
 
-3. Call the Nova API to migrate the VMs according to the placement
-   determined by the `algorithm_vm_placement_factory` algorithm.
+    :return: The started worker thread.
+     :rtype: *
+    """
+    worker = threading.Thread(target=process_jobs,
+                              args=(config, state),
+                              name='global-manager-worker')
+    worker.daemon = True
+    worker.start()
+    return worker
 
-4. Switch off the host at the end of the VM migration.
+
+@contract
+def process_jobs(config, state, iterations=-1):
+    """ Process the jobs from the queue in coalesced batches.
+
+    After taking a job from the queue, the worker waits until the end
+    of the coalescing window started by the submission of the job, and
+    takes all the jobs submitted in the meantime. The batch of jobs is
+    then processed as a single joint request. Between the batches, the
+    demand forecast is updated every data collection interval to
+    switch on the hosts required by the forecast peak demand.
 
     :param config: A config dictionary.
      :type config: dict(str: *)
@@ -302,155 +633,108 @@ def execute_underload(config, state, host):
     :param state: A state dictionary.
      :type state: dict(str: *)
 
-    :param host: A host name.
-     :type host: str
-
-    :return: The updated state dictionary.
-     :rtype: dict(str: *)
+    :param iterations: The number of batches to process, -1 for infinite.
+     :type iterations: int
     """
-    log.info('Started processing an underload request')
-    underloaded_host = host
-    hosts_cpu_total, _, hosts_ram_total = state['db'].select_host_characteristics()
+    window = float(config['global_manager_coalescing_window'])
+    forecast_interval = float(config['data_collector_interval'])
+    forecasting = float(config['forecast_horizon']) > 0
+    next_forecast = time.time()
+    while iterations != 0:
+        if forecasting:
+            if time.time() >= next_forecast:
+                try:
+                    # The database connection is shared with the requests
+                    with state['execution_lock']:
+                        prewake_hosts(config, state)
+                except Exception as e:
+                    log.exception('Could not pre-wake hosts: %s', str(e))
+                next_forecast = time.time() + forecast_interval
+            job = state['jobs'].get(max(next_forecast - time.time(), 0))
+            if job is None:
+                continue
+        else:
+            job = state['jobs'].get()
+        delay = job['submitted'] + window - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        profiler.run(execute_jobs, config, state,
+                     [job] + state['jobs'].get_all())
+        if iterations > 0:
+            iterations -= 1
 
-    hosts_to_vms = vms_by_hosts(state['nova'], state['compute_hosts'])
-    vms_last_cpu = state['db'].select_last_cpu_mhz_for_vms()
-    hosts_last_cpu = state['db'].select_last_cpu_mhz_for_hosts()
 
-    # Remove VMs from hosts_to_vms that are not in vms_last_cpu
-    # These VMs are new and no data have been collected from them
-    for host, vms in hosts_to_vms.items():
-        for i, vm in enumerate(vms):
-            if not vm in vms_last_cpu:
-                del hosts_to_vms[host][i]
-
-    if log.isEnabledFor(logging.DEBUG):
-        log.debug('hosts_to_vms: %s', str(hosts_to_vms))
+@contract
+def execute_jobs(config, state, jobs):
+    """ Execute a batch of jobs as a joint request.
 
-    hosts_cpu_usage = {}
-    hosts_ram_usage = {}
-    hosts_to_keep_active = set()
-    for host, vms in hosts_to_vms.items():
-        if vms:
-            host_cpu_mhz = hosts_last_cpu[host]
-            for vm in vms:
-                if vm not in vms_last_cpu:
-                    log.info('No data yet for VM: %s - skipping host %s', vm, host)
-                    hosts_to_keep_active.add(host)
-                    hosts_cpu_total.pop(host, None)
-                    hosts_ram_total.pop(host, None)
-                    hosts_cpu_usage.pop(host, None)
-                    hosts_ram_usage.pop(host, None)
-                    break
-                host_cpu_mhz += vms_last_cpu[vm]
-            else:
-                hosts_cpu_usage[host] = host_cpu_mhz
-                hosts_ram_usage[host] = host_used_ram(state['nova'], host)
-        else:
-            # Exclude inactive hosts
-            hosts_cpu_total.pop(host, None)
-            hosts_ram_total.pop(host, None)
+    :param config: A config dictionary.
+     :type config: dict(str: *)
 
-    if log.isEnabledFor(logging.DEBUG):
-        log.debug('Host CPU usage: %s', str(hosts_last_cpu))
-        log.debug('Host total CPU usage: %s', str(hosts_cpu_usage))
+    :param state: A state dictionary.
+     :type state: dict(str: *)
 
-    # Exclude the underloaded host
-    hosts_cpu_usage.pop(underloaded_host, None)
-    hosts_cpu_total.pop(underloaded_host, None)
-    hosts_ram_usage.pop(underloaded_host, None)
-    hosts_ram_total.pop(underloaded_host, None)
+    :param jobs: A list of jobs taken from the queue.
+     :type jobs: list(dict(str: *))
+    """
+    jobs_by_host = {}
+    for job in jobs:
+        if job['host'] in jobs_by_host:
+            state['jobs'].replace(jobs_by_host[job['host']], job)
+        jobs_by_host[job['host']] = job
+    underloaded_hosts = sorted(host for host, job in jobs_by_host.items()
+                               if job['reason'] == 0)
+    overloaded_vms = dict((host, job['vm_uuids'])
+                          for host, job in jobs_by_host.items()
+                          if job['reason'] == 1)
+    reported = dict((host, job['data'])
+                    for host, job in jobs_by_host.items()
+                    if job['data'])
+
+    log.info('Started jobs %s', str(sorted(x['id']
+                                           for x in jobs_by_host.values())))
+    error = None
+    try:
+        with state['execution_lock']:
+            execute_joint(config, state, underloaded_hosts, overloaded_vms,
+                          reported)
+    except Exception as e:
+        log.exception('Exception during request processing:')
+        error = str(e)
+    for job in jobs_by_host.values():
+        state['jobs'].complete(job, error)
+    if error is None:
+        log.info('Completed jobs %s', str(sorted(jobs_by_host.keys())))
+    metrics.export()
 
-    if log.isEnabledFor(logging.DEBUG):
-        log.debug('Excluded the underloaded host %s', underloaded_host)
-        log.debug('Host CPU usage: %s', str(hosts_last_cpu))
-        log.debug('Host total CPU usage: %s', str(hosts_cpu_usage))
 
-    vms_to_migrate = vms_by_host(state['nova'], underloaded_host)
-    vms_cpu = {}
-    for vm in vms_to_migrate:
-        if vm not in vms_last_cpu:
-            log.info('No data yet for VM: %s - dropping the request', vm)
-            log.info('Skipped an underload request')
-            return state
-        vms_cpu[vm] = state['db'].select_cpu_mhz_for_vm(
-            vm,
-            int(config['data_collector_data_length']))
-    vms_ram = vms_ram_limit(state['nova'], vms_to_migrate)
+@contract
+def execute_underload(config, state, host):
+    """ Process an underloaded host: migrate all VMs from the host.
 
-    # Remove VMs that are not in vms_ram
-    # These instances might have been deleted
-    for i, vm in enumerate(vms_to_migrate):
-        if not vm in vms_ram:
-            del vms_to_migrate[i]
+1. Prepare the data about the current states of the hosts and VMs.
 
-    if not vms_to_migrate:
-        log.info('No VMs to migrate - completed the underload request')
-        return state
+2. Call the function specified in the `algorithm_vm_placement_factory`
+   configuration option and pass the data on the states of the hosts and VMs.
 
-    for vm in vms_cpu.keys():
-        if not vm in vms_ram:
-            del vms_cpu[vm]
+3. Call the Nova API to migrate the VMs according to the placement
+   determined by the `algorithm_vm_placement_factory` algorithm.
 
-    time_step = int(config['data_collector_interval'])
-    migration_time = common.calculate_migration_time(
-        vms_ram,
-        float(config['network_migration_bandwidth']))
+4. Switch off the host at the end of the VM migration.
 
-    if 'vm_placement' not in state:
-        vm_placement_params = common.parse_parameters(
-            config['algorithm_vm_placement_parameters'])
-        vm_placement_state = None
-        vm_placement = common.call_function_by_name(
-            config['algorithm_vm_placement_factory'],
-            [time_step,
-             migration_time,
-             vm_placement_params])
-        state['vm_placement'] = vm_placement
-        state['vm_placement_state'] = {}
-    else:
-        vm_placement = state['vm_placement']
-        vm_placement_state = state['vm_placement_state']
-
-    log.info('Started underload VM placement')
-    placement, vm_placement_state = vm_placement(
-        hosts_cpu_usage, hosts_cpu_total,
-        hosts_ram_usage, hosts_ram_total,
-        {}, {},
-        vms_cpu, vms_ram,
-        vm_placement_state)
-    log.info('Completed underload VM placement')
-    state['vm_placement_state'] = vm_placement_state
+    :param config: A config dictionary.
+     :type config: dict(str: *)
 
-    if log.isEnabledFor(logging.INFO):
-        log.info('Underload: obtained a new placement %s', str(placement))
+    :param state: A state dictionary.
+     :type state: dict(str: *)
 
-    active_hosts = hosts_cpu_total.keys()
-    inactive_hosts = set(state['compute_hosts']) - set(active_hosts)
-    prev_inactive_hosts = set(state['db'].select_inactive_hosts())
-    hosts_to_deactivate = list(inactive_hosts
-                               - prev_inactive_hosts
-                               - hosts_to_keep_active)
+    :param host: A host name.
+     :type host: str
 
-    if not placement:
-        log.info('Nothing to migrate')
-        if underloaded_host in hosts_to_deactivate:
-            hosts_to_deactivate.remove(underloaded_host)
-    else:
-        log.info('Started underload VM migrations')
-        migrate_vms(state['db'],
-                    state['nova'],
-                    config['vm_instance_directory'],
-                    placement,
-                    bool(config['block_migration']))
-        log.info('Completed underload VM migrations')
-
-    if hosts_to_deactivate:
-        switch_hosts_off(state['db'],
-                         config['sleep_command'],
-                         hosts_to_deactivate)
-
-    log.info('Completed processing an underload request')
-    return state
+    :return: The updated state dictionary.
+     :rtype: dict(str: *)
+    """
+    return execute_joint(config, state, [host], {})
 
 
 @contract
@@ -482,331 +766,785 @@ def execute_overload(config, state, host, vm_uuids):
     :return: The updated state dictionary.
      :rtype: dict(str: *)
     """
-    log.info('Started processing an overload request')
-    overloaded_host = host
-    hosts_cpu_total, _, hosts_ram_total = state['db'].select_host_characteristics()
-    hosts_to_vms = vms_by_hosts(state['nova'], state['compute_hosts'])
-    vms_last_cpu = state['db'].select_last_cpu_mhz_for_vms()
-    hosts_last_cpu = state['db'].select_last_cpu_mhz_for_hosts()
+    return execute_joint(config, state, [], {host: vm_uuids})
 
-    # Remove VMs from hosts_to_vms that are not in vms_last_cpu
-    # These VMs are new and no data have been collected from them
-    for host, vms in hosts_to_vms.items():
-        for i, vm in enumerate(vms):
-            if not vm in vms_last_cpu:
-                del hosts_to_vms[host][i]
+
+@contract
+def execute_joint(config, state, underloaded_hosts, overloaded_vms,
+                  reported=None, report=None):
+    """ Process a set of underloaded and overloaded hosts jointly.
+
+1. Prepare a single snapshot of the states of the hosts and VMs. The
+   underloaded and overloaded hosts are excluded from the destinations.
+
+2. Place the VMs selected for migration from the overloaded hosts
+   using the function specified in the `algorithm_vm_placement_factory`
+   configuration option, allowing inactive hosts to be switched on.
+
+3. Place all the VMs from the underloaded hosts on the active hosts,
+   taking into account the resources allocated at step 2. If the VMs
+   cannot be placed all together, place the VMs of each underloaded
+   host separately.
+
+4. Switch on the inactive hosts required to accommodate the VMs, turn
+   the placement into a migration plan respecting the free RAM of the
+   hosts, and call the Nova API to migrate the VMs according to the plan.
+
+5. Switch off the evacuated underloaded hosts and idle hosts.
+
+The time spent in the DB, the Nova API, the VM placement, the migration
+planning, the migrations and the power management is measured for
+each request. If a report dict is passed, the request is processed in
+the dry-run mode: the steps 4 and 5 only plan the actions, and the
+report is filled with the placement, the migration plan, the hosts to
+switch on and off, and the time of each phase.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :param underloaded_hosts: A list of underloaded host names.
+     :type underloaded_hosts: list(str)
+
+    :param overloaded_vms: A map of overloaded hosts to VM UUIDs to migrate.
+     :type overloaded_vms: dict(str: list(str))
+
+    :param reported: A map of hosts to the resource usage data they reported.
+     :type reported: None|dict(str: dict)
+
+    :param report: A dict to fill in the dry-run mode, None to act.
+     :type report: None|dict
+
+    :return: The updated state dictionary.
+     :rtype: dict(str: *)
+    """
+    log.info('Started processing a request: underloaded hosts %s, ' +
+             'overloaded hosts %s', str(underloaded_hosts),
+             str(sorted(overloaded_vms.keys())))
+    start_time = time.time()
+    timings = {}
+    if report is not None:
+        log.info('Processing the request in the dry-run mode')
+        timings = dict((phase, 0.) for phase in PHASES)
+        report.update({'placement': {},
+                       'plan': [],
+                       'unplanned': [],
+                       'hosts_to_activate': [],
+                       'hosts_to_deactivate': [],
+                       'timings': timings})
+    source_hosts = set(underloaded_hosts).union(overloaded_vms.keys())
+    cluster = state['cluster']
+    with timed(timings, 'db'):
+        hosts_cpu_total, _, hosts_ram_total = cluster.host_characteristics()
+    hosts_cpu_capacity = dict(hosts_cpu_total)
+    with timed(timings, 'nova'):
+        hosts_to_vms = cluster.vms_by_hosts(state['compute_hosts'])
+    with timed(timings, 'db'):
+        vms_last_cpu = state['db'].select_last_cpu_mhz_for_vms()
+        hosts_last_cpu = state['db'].select_last_cpu_mhz_for_hosts()
+
+    # The histories reported by the source hosts replace the DB reads
+    reported_vms_cpu = {}
+    for host, data in (reported or {}).items():
+        if host in source_hosts:
+            reported_vms_cpu.update(data.get('vm_cpu_mhz', {}))
+    vms_last_cpu.update((vm, cpu[-1])
+                        for vm, cpu in reported_vms_cpu.items() if cpu)
 
     hosts_cpu_usage = {}
     hosts_ram_usage = {}
     inactive_hosts_cpu = {}
     inactive_hosts_ram = {}
+    hosts_to_keep_active = set()
     for host, vms in hosts_to_vms.items():
-        if vms:
-            host_cpu_mhz = hosts_last_cpu[host]
-            for vm in vms:
-                if vm not in vms_last_cpu:
-                    log.info('No data yet for VM: %s - skipping host %s', vm, host)
-                    hosts_cpu_total.pop(host, None)
-                    hosts_ram_total.pop(host, None)
-                    hosts_cpu_usage.pop(host, None)
-                    hosts_ram_usage.pop(host, None)
-                    break
-                host_cpu_mhz += vms_last_cpu[vm]
-            else:
-                hosts_cpu_usage[host] = host_cpu_mhz
-                hosts_ram_usage[host] = host_used_ram(state['nova'], host)
-        else:
+        if host in source_hosts:
+            continue
+        if not vms:
             inactive_hosts_cpu[host] = hosts_cpu_total[host]
             inactive_hosts_ram[host] = hosts_ram_total[host]
-            hosts_cpu_total.pop(host, None)
-            hosts_ram_total.pop(host, None)
-
-    # Exclude the overloaded host
-    hosts_cpu_usage.pop(overloaded_host, None)
-    hosts_cpu_total.pop(overloaded_host, None)
-    hosts_ram_usage.pop(overloaded_host, None)
-    hosts_ram_total.pop(overloaded_host, None)
+            continue
+        new_vms = [vm for vm in vms if vm not in vms_last_cpu]
+        if new_vms:
+            # These VMs are new and no data have been collected from them
+            log.info('No data yet for VMs: %s - skipping host %s',
+                     str(new_vms), host)
+            hosts_to_keep_active.add(host)
+            continue
+        hosts_cpu_usage[host] = hosts_last_cpu[host] + \
+            sum(vms_last_cpu[vm] for vm in vms)
+        with timed(timings, 'nova'):
+            hosts_ram_usage[host] = cluster.host_used_ram(host)
+    hosts_cpu_total = dict((host, hosts_cpu_total[host])
+                           for host in hosts_cpu_usage)
+    hosts_ram_total = dict((host, hosts_ram_total[host])
+                           for host in hosts_cpu_usage)
 
     if log.isEnabledFor(logging.DEBUG):
+        log.debug('hosts_to_vms: %s', str(hosts_to_vms))
         log.debug('Host CPU usage: %s', str(hosts_last_cpu))
         log.debug('Host total CPU usage: %s', str(hosts_cpu_usage))
 
-    vms_to_migrate = vm_uuids
-    vms_cpu = {}
-    for vm in vms_to_migrate:
-        if vm not in vms_last_cpu:
-            log.info('No data yet for VM: %s - dropping the request', vm)
-            log.info('Skipped an underload request')
-            return state
-        vms_cpu[vm] = state['db'].select_cpu_mhz_for_vm(
-            vm,
-            int(config['data_collector_data_length']))
-    vms_ram = vms_ram_limit(state['nova'], vms_to_migrate)
-
+    underload_vms = {}
+    for host in underloaded_hosts:
+        underload_vms[host] = hosts_to_vms.get(host, [])
+    overload_vms = dict(overloaded_vms)
+    for host_vms in [underload_vms, overload_vms]:
+        for host, vms in host_vms.items():
+            new_vms = [vm for vm in vms if vm not in vms_last_cpu]
+            if new_vms:
+                log.info('No data yet for VMs: %s - dropping the ' +
+                         'request of host %s', str(new_vms), host)
+                hosts_to_keep_active.add(host)
+                del host_vms[host]
+
+    with timed(timings, 'nova'):
+        vms_ram = cluster.vms_ram_limit([vm for host_vms in [overload_vms,
+                                                             underload_vms]
+                                         for vms in host_vms.values()
+                                         for vm in vms])
     # Remove VMs that are not in vms_ram
     # These instances might have been deleted
-    for i, vm in enumerate(vms_to_migrate):
-        if not vm in vms_ram:
-            del vms_to_migrate[i]
+    for host_vms in [underload_vms, overload_vms]:
+        for host, vms in host_vms.items():
+            vms = [vm for vm in vms if vm in vms_ram]
+            if vms:
+                host_vms[host] = vms
+            else:
+                del host_vms[host]
 
-    if not vms_to_migrate:
-        log.info('No VMs to migrate - completed the overload request')
+    if not vms_ram:
+        log.info('No VMs to migrate - completed the request')
+        log_timings(timings, start_time, report is None)
         return state
 
-    for vm in vms_cpu.keys():
-        if not vm in vms_ram:
-            del vms_cpu[vm]
-
-    time_step = int(config['data_collector_interval'])
-    migration_time = common.calculate_migration_time(
-        vms_ram,
-        float(config['network_migration_bandwidth']))
-
-    if 'vm_placement' not in state:
-        vm_placement_params = common.parse_parameters(
-            config['algorithm_vm_placement_parameters'])
-        vm_placement_state = None
-        vm_placement = common.call_function_by_name(
-            config['algorithm_vm_placement_factory'],
-            [time_step,
-             migration_time,
-             vm_placement_params])
-        state['vm_placement'] = vm_placement
-        state['vm_placement_state'] = {}
-    else:
-        vm_placement = state['vm_placement']
-        vm_placement_state = state['vm_placement_state']
-
-    log.info('Started overload VM placement')
-    placement, vm_placement_state = vm_placement(
-        hosts_cpu_usage, hosts_cpu_total,
-        hosts_ram_usage, hosts_ram_total,
-        inactive_hosts_cpu, inactive_hosts_ram,
-        vms_cpu, vms_ram,
-        vm_placement_state)
-    log.info('Completed overload VM placement')
-    state['vm_placement_state'] = vm_placement_state
+    data_length = int(config['data_collector_data_length'])
+    vms_cpu = {}
+    with timed(timings, 'db'):
+        for vm in vms_ram:
+            if reported_vms_cpu.get(vm):
+                vms_cpu[vm] = reported_vms_cpu[vm][-data_length:]
+            else:
+                vms_cpu[vm] = state['db'].select_cpu_mhz_for_vm(
+                    vm, data_length)
+    vm_placement = get_vm_placement(
+        config, state,
+        common.calculate_migration_time(
+            vms_ram, float(config['network_migration_bandwidth'])))
+
+    # The free RAM of the hosts before the migrations, the placement
+    # adds the activated hosts to the active ones
+    active_hosts = set(hosts_ram_usage)
+    hosts_free_ram = dict((host, hosts_ram_total[host] -
+                           hosts_ram_usage[host])
+                          for host in hosts_ram_usage)
+    hosts_free_ram.update(inactive_hosts_ram)
+
+    placement = {}
+    hosts_to_activate = []
+    if overload_vms:
+        log.info('Started overload VM placement')
+        inactive_hosts = set(inactive_hosts_cpu.keys())
+        with timed(timings, 'placement'):
+            placement.update(place_vms(
+                state, vm_placement,
+                [vm for vms in overload_vms.values() for vm in vms],
+                vms_cpu, vms_ram, vms_last_cpu,
+                hosts_cpu_usage, hosts_cpu_total,
+                hosts_ram_usage, hosts_ram_total,
+                inactive_hosts_cpu, inactive_hosts_ram))
+        log.info('Completed overload VM placement')
+        hosts_to_activate = sorted(
+            inactive_hosts.intersection(placement.values()))
+
+    evacuated_hosts = set()
+    if underload_vms:
+        log.info('Started underload VM placement')
+        with timed(timings, 'placement'):
+            underload_placement = place_vms(
+                state, vm_placement,
+                [vm for vms in underload_vms.values() for vm in vms],
+                vms_cpu, vms_ram, vms_last_cpu,
+                hosts_cpu_usage, hosts_cpu_total,
+                hosts_ram_usage, hosts_ram_total,
+                {}, {})
+            if underload_placement:
+                evacuated_hosts.update(underload_vms.keys())
+            elif len(underload_vms) > 1:
+                log.info('Joint underload VM placement failed - ' +
+                         'placing the VMs of each host separately')
+                for host in sorted(underload_vms.keys()):
+                    host_placement = place_vms(
+                        state, vm_placement, underload_vms[host],
+                        vms_cpu, vms_ram, vms_last_cpu,
+                        hosts_cpu_usage, hosts_cpu_total,
+                        hosts_ram_usage, hosts_ram_total,
+                        {}, {})
+                    if host_placement:
+                        evacuated_hosts.add(host)
+                        underload_placement.update(host_placement)
+        placement.update(underload_placement)
+        log.info('Completed underload VM placement')
 
     if log.isEnabledFor(logging.INFO):
-        log.info('Overload: obtained a new placement %s', str(placement))
+        log.info('Obtained a new placement %s', str(placement))
+
+    hosts_to_deactivate = []
+    if underloaded_hosts:
+        with timed(timings, 'db'):
+            prev_inactive_hosts = set(state['db'].select_inactive_hosts())
+        hosts_to_deactivate = sorted(
+            set(state['compute_hosts'])
+            - set(hosts_cpu_usage.keys())
+            - set(overloaded_vms.keys())
+            - (set(underloaded_hosts) - evacuated_hosts)
+            - hosts_to_keep_active
+            - prev_inactive_hosts)
+        hosts_to_keep = forecast_hosts_to_keep(
+            config, state, hosts_to_deactivate,
+            hosts_cpu_capacity, prev_inactive_hosts)
+        if hosts_to_keep:
+            log.info('Keeping hosts %s active for the forecast demand',
+                     str(hosts_to_keep))
+            hosts_to_deactivate = [host for host in hosts_to_deactivate
+                                   if host not in hosts_to_keep]
 
     if not placement:
         log.info('Nothing to migrate')
     else:
-        hosts_to_activate = list(
-            set(inactive_hosts_cpu.keys()).intersection(
-                set(placement.values())))
-        if hosts_to_activate:
-            switch_hosts_on(state['db'],
-                            config['ether_wake_interface'],
-                            state['host_macs'],
-                            hosts_to_activate)
-        log.info('Started overload VM migrations')
-        migrate_vms(state['db'],
-                    state['nova'],
-                    config['vm_instance_directory'],
-                    placement,
-                    bool(config['block_migration']))
-        log.info('Completed overload VM migrations')
-    log.info('Completed processing an overload request')
+        vms_sources = dict((vm, host)
+                           for host_vms in [underload_vms, overload_vms]
+                           for host, vms in host_vms.items()
+                           for vm in vms)
+        # Only the hosts active before the placement can be used as
+        # temporary hosts
+        hosts_free_ram = dict((host, ram)
+                              for host, ram in hosts_free_ram.items()
+                              if host in active_hosts)
+        unavailable_vms = []
+        if report is None and hosts_to_activate:
+            with timed(timings, 'power'):
+                activated = switch_hosts_on(state['db'],
+                                            state['power'],
+                                            config['ether_wake_interface'],
+                                            state['host_macs'],
+                                            hosts_to_activate)
+            unavailable_hosts = set(hosts_to_activate) - set(activated)
+            hosts_to_activate = activated
+            # The VMs cannot be migrated to the hosts that cannot be woken
+            unavailable_vms = sorted(vm for vm, host in placement.items()
+                                     if host in unavailable_hosts)
+            if unavailable_vms:
+                log.error('Cannot migrate VMs %s to the hosts that ' +
+                          'cannot be switched on: %s',
+                          str(unavailable_vms), str(unavailable_hosts))
+                placement = dict((vm, host)
+                                 for vm, host in placement.items()
+                                 if host not in unavailable_hosts)
+        with timed(timings, 'plan'):
+            plan, failed = migration.plan_migrations(
+                placement, vms_sources, vms_ram, hosts_free_ram)
+        failed.extend(unavailable_vms)
+        if report is not None:
+            report.update({'placement': placement,
+                           'plan': plan,
+                           'unplanned': failed,
+                           'hosts_to_activate': hosts_to_activate})
+        else:
+            for host in evacuated_hosts:
+                metrics.inc('neat_decisions_total',
+                            {'host': host, 'decision': 'evacuate'})
+            log.info('Started VM migrations')
+            with timed(timings, 'migration'):
+                failed.extend(migrate_vms(
+                    config, state, plan,
+                    migration.estimate_migration_times(
+                        vms_ram,
+                        float(config['network_migration_bandwidth']))))
+            placement = dict((vm, host) for vm, host in placement.items()
+                             if vm not in failed)
+            cluster.record_migrations(placement)
+            log.info('Completed VM migrations')
+        failed_sources = set(vms_sources.get(vm) for vm in failed)
+        hosts_to_deactivate = [host for host in hosts_to_deactivate
+                               if host not in failed_sources]
+
+    if report is not None:
+        report['hosts_to_deactivate'] = hosts_to_deactivate
+    else:
+        for host in hosts_to_activate:
+            metrics.inc('neat_decisions_total',
+                        {'host': host, 'decision': 'activate'})
+        for host in hosts_to_deactivate:
+            metrics.inc('neat_decisions_total',
+                        {'host': host, 'decision': 'deactivate'})
+        with timed(timings, 'power'):
+            if hosts_to_deactivate:
+                switch_hosts_off(state['db'],
+                                 state['power'],
+                                 config['sleep_command'],
+                                 hosts_to_deactivate)
+            record_power_latencies(state['db'], state['power'])
+
+    log_timings(timings, start_time, report is None)
+    log.info('Completed processing a request')
     return state
 
 
-@contract
-def flavors_ram(nova):
-    """ Get a dict of flavor IDs to the RAM limits.
+@contextlib.contextmanager
+def timed(timings, phase):
+    """ Measure the time of a block and add it to the time of a phase.
 
-    :param nova: A Nova client.
-     :type nova: *
+    :param timings: A map of phases to their time in seconds.
+     :type timings: dict(str: float)
 
-    :return: A dict of flavor IDs to the RAM limits.
-     :rtype: dict(str: int)
+    :param phase: The name of the phase.
+     :type phase: str
     """
-    return dict((str(fl.id), fl.ram) for fl in nova.flavors.list())
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.) + time.time() - start
 
 
 @contract
-def vms_ram_limit(nova, vms):
-    """ Get the RAM limit from the flavors of the VMs.
+def log_timings(timings, start_time, observe):
+    """ Set the total processing time of a request and log the timings.
 
-    :param nova: A Nova client.
-     :type nova: *
+    The time of each phase of a request processed in the normal mode
+    is recorded in the metrics, the dry runs are not recorded.
 
-    :param vms: A list of VM UUIDs.
-     :type vms: list(str)
+    :param timings: A map of phases to their time in seconds.
+     :type timings: dict(str: float)
+
+    :param start_time: The time when the processing started.
+     :type start_time: float
 
-    :return: A dict of VM UUIDs to the RAM limits.
-     :rtype: dict(str: int)
+    :param observe: Whether to record the timings in the metrics.
+     :type observe: bool
     """
-    flavors_to_ram = flavors_ram(nova)
-    vms_ram = {}
-    for uuid in vms:
-        try:
-            vm = nova.servers.get(uuid)
-            vms_ram[uuid] = flavors_to_ram[vm.flavor['id']]
-        except novaclient.exceptions.NotFound:
-            pass
-    return vms_ram
+    if observe:
+        for phase in PHASES:
+            if phase in timings:
+                metrics.observe('neat_phase_seconds', timings[phase],
+                                {'phase': phase})
+    timings['total'] = time.time() - start_time
+    log.info('Processing times: %s', ', '.join(
+        '{0} {1:.3f}s'.format(phase, timings.get(phase, 0.))
+        for phase in PHASES + ['total']))
 
 
 @contract
-def host_used_ram(nova, host):
-    """ Get the used RAM of the host using the Nova API.
+def update_forecast(state):
+    """ Feed the new resource usage records to the demand forecaster.
 
-    :param nova: A Nova client.
-     :type nova: *
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+    """
+    forecaster = state['forecaster']
+    host_rows, vm_rows = state['db'].select_cpu_mhz_since(
+        forecaster.host_usage_id, forecaster.vm_usage_id)
+    if host_rows:
+        forecaster.host_usage_id = host_rows[-1][0]
+    if vm_rows:
+        forecaster.vm_usage_id = vm_rows[-1][0]
+    forecaster.observe(
+        [(forecast.to_seconds(timestamp), ('host', host_id), cpu_mhz)
+         for _, host_id, timestamp, cpu_mhz in host_rows] +
+        [(forecast.to_seconds(timestamp), ('vm', vm_id), cpu_mhz)
+         for _, vm_id, timestamp, cpu_mhz in vm_rows])
 
-    :param host: A host name.
-     :type host: str
 
-    :return: The used RAM of the host.
-     :rtype: int
+@contract
+def forecast_required_cpu(config, state):
+    """ Forecast the CPU capacity of the active hosts required soon.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :return: The required CPU capacity in MHz, or None if unknown.
+     :rtype: None|float
     """
-    data = nova.hosts.get(host)
-    if len(data) > 2 and data[2].memory_mb != 0:
-        return data[2].memory_mb
-    return data[1].memory_mb
+    horizon = float(config['forecast_horizon'])
+    if horizon <= 0:
+        return None
+    peak = state['forecaster'].forecast(horizon)
+    if peak is None:
+        return None
+    return peak / float(config['host_cpu_overload_threshold'])
 
 
 @contract
-def host_mac(host):
-    """ Get mac address of a host.
+def prewake_hosts(config, state):
+    """ Switch on the inactive hosts required by the forecast demand.
 
-    :param host: A host name.
-     :type host: str
+    :param config: A config dictionary.
+     :type config: dict(str: *)
 
-    :return: The mac address of the host.
-     :rtype: str
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :return: The list of hosts switched on.
+     :rtype: list(str)
     """
-    mac = subprocess.Popen(
-        ("ping -c 1 {0} > /dev/null;" +
-         "arp -a {0} | awk '{{print $4}}'").format(host),
-        stdout=subprocess.PIPE,
-        shell=True).communicate()[0].strip()
-    if len(mac) != 17:
-        log.warning('Received a wrong mac address for %s: %s',
-                    host, mac)
-        return ''
-    return mac
+    update_forecast(state)
+    required = forecast_required_cpu(config, state)
+    if required is None:
+        return []
+    hosts_cpu_total = state['cluster'].host_characteristics()[0]
+    inactive_hosts = set(state['db'].select_inactive_hosts())
+    hosts = [host for host in state['compute_hosts']
+             if host in hosts_cpu_total]
+    active_cpu = sum(hosts_cpu_total[host] for host in hosts
+                     if host not in inactive_hosts)
+    hosts_to_activate = sorted(forecast.select_hosts(
+        required - active_cpu,
+        dict((host, hosts_cpu_total[host]) for host in hosts
+             if host in inactive_hosts)))
+    if hosts_to_activate:
+        log.info('Pre-waking hosts %s for the forecast demand: ' +
+                 'required %d MHz, active %d MHz',
+                 str(hosts_to_activate), required, active_cpu)
+        hosts_to_activate = switch_hosts_on(state['db'],
+                                            state['power'],
+                                            config['ether_wake_interface'],
+                                            state['host_macs'],
+                                            hosts_to_activate)
+    return hosts_to_activate
 
 
 @contract
-def vms_by_host(nova, host):
-    """ Get VMs from the specified host using the Nova API.
+def forecast_hosts_to_keep(config, state, hosts_to_deactivate,
+                           hosts_cpu_total, inactive_hosts):
+    """ Select the hosts to keep active for the forecast demand.
 
-    :param nova: A Nova client.
-     :type nova: *
+    :param config: A config dictionary.
+     :type config: dict(str: *)
 
-    :param host: A host name.
-     :type host: str
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :param hosts_to_deactivate: A list of hosts to be switched off.
+     :type hosts_to_deactivate: list(str)
 
-    :return: A list of VM UUIDs from the specified host.
+    :param hosts_cpu_total: A dict of host names to the total CPU in MHz.
+     :type hosts_cpu_total: dict(str: int)
+
+    :param inactive_hosts: A set of the inactive hosts.
+     :type inactive_hosts: set(str)
+
+    :return: The hosts that should not be switched off.
      :rtype: list(str)
     """
-    return [str(vm.id) for vm in nova.servers.list()
-            if vm_hostname(vm) == host]
+    if not hosts_to_deactivate:
+        return []
+    required = forecast_required_cpu(config, state)
+    if required is None:
+        return []
+    remaining_cpu = sum(hosts_cpu_total.get(host, 0)
+                        for host in state['compute_hosts']
+                        if host not in inactive_hosts and
+                        host not in hosts_to_deactivate)
+    return sorted(forecast.select_hosts(
+        required - remaining_cpu,
+        dict((host, hosts_cpu_total.get(host, 0))
+             for host in hosts_to_deactivate)))
 
 
 @contract
-def vms_by_hosts(nova, hosts):
-    """ Get a map of host names to VMs using the Nova API.
+def get_vm_placement(config, state, migration_time):
+    """ Get the VM placement algorithm, creating it on the first call.
 
-    :param nova: A Nova client.
-     :type nova: *
+    :param config: A config dictionary.
+     :type config: dict(str: *)
 
-    :param hosts: A list of host names.
-     :type hosts: list(str)
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :param migration_time: The VM migration time in seconds.
+     :type migration_time: float,>=0
 
-    :return: A dict of host names to lists of VM UUIDs.
-     :rtype: dict(str: list(str))
+    :return: A function implementing the VM placement algorithm.
+     :rtype: function
     """
-    result = dict((host, []) for host in hosts)
-    for vm in nova.servers.list():
-        result[vm_hostname(vm)].append(str(vm.id))
-    return result
+    if 'vm_placement' not in state:
+        vm_placement_params = common.parse_parameters(
+            config['algorithm_vm_placement_parameters'])
+        state['vm_placement'] = common.call_function_by_name(
+            config['algorithm_vm_placement_factory'],
+            [int(config['data_collector_interval']),
+             migration_time,
+             vm_placement_params])
+        state['vm_placement_state'] = {}
+    return state['vm_placement']
 
 
 @contract
-def vm_hostname(vm):
-    """ Get the name of the host where VM is running.
+def place_vms(state, vm_placement, vms, vms_cpu, vms_ram, vms_last_cpu,
+              hosts_cpu_usage, hosts_cpu_total,
+              hosts_ram_usage, hosts_ram_total,
+              inactive_hosts_cpu, inactive_hosts_ram):
+    """ Place a set of VMs and account the placement in the host usage.
 
-    :param vm: A Nova VM object.
-     :type vm: *
+    The host dicts are updated in place: the CPU and RAM usage of the
+    VMs is added to their destination hosts, and the activated hosts
+    are moved from the inactive to the active hosts.
 
-    :return: The hostname.
-     :rtype: str
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :param vm_placement: A function implementing the VM placement algorithm.
+     :type vm_placement: function
+
+    :param vms: A list of VM UUIDs to place.
+     :type vms: list(str)
+
+    :param vms_cpu: A map of VM UUIDs to their CPU utilization histories.
+     :type vms_cpu: dict(str: list(int))
+
+    :param vms_ram: A map of VM UUIDs to their RAM usage in MB.
+     :type vms_ram: dict(str: int)
+
+    :param vms_last_cpu: A map of VM UUIDs to their last CPU MHz values.
+     :type vms_last_cpu: dict(str: int)
+
+    :param hosts_cpu_usage: A map of active hosts to their CPU usage in MHz.
+     :type hosts_cpu_usage: dict(str: int)
+
+    :param hosts_cpu_total: A map of active hosts to their total CPU in MHz.
+     :type hosts_cpu_total: dict(str: int)
+
+    :param hosts_ram_usage: A map of active hosts to their RAM usage in MB.
+     :type hosts_ram_usage: dict(str: int)
+
+    :param hosts_ram_total: A map of active hosts to their total RAM in MB.
+     :type hosts_ram_total: dict(str: int)
+
+    :param inactive_hosts_cpu: A map of inactive hosts to their CPU in MHz.
+     :type inactive_hosts_cpu: dict(str: int)
+
+    :param inactive_hosts_ram: A map of inactive hosts to their RAM in MB.
+     :type inactive_hosts_ram: dict(str: int)
+
+    :return: A map of VM UUIDs to host names, or {} if cannot be solved.
+     :rtype: dict(str: str)
+    """
+    placement, state['vm_placement_state'] = vm_placement(
+        dict(hosts_cpu_usage), dict(hosts_cpu_total),
+        dict(hosts_ram_usage), dict(hosts_ram_total),
+        dict(inactive_hosts_cpu), dict(inactive_hosts_ram),
+        dict((vm, vms_cpu[vm]) for vm in vms),
+        dict((vm, vms_ram[vm]) for vm in vms),
+        state['vm_placement_state'])
+    for vm, host in placement.items():
+        if host in inactive_hosts_cpu:
+            hosts_cpu_usage[host] = 0
+            hosts_ram_usage[host] = 0
+            hosts_cpu_total[host] = inactive_hosts_cpu.pop(host)
+            hosts_ram_total[host] = inactive_hosts_ram.pop(host)
+        hosts_cpu_usage[host] += vms_last_cpu[vm]
+        hosts_ram_usage[host] += vms_ram[vm]
+    return placement
+
+
+@contract
+def arp_table(path):
+    """ Read the IP to MAC address mapping from the kernel ARP table.
+
+    :param path: A path to the ARP table, e.g., /proc/net/arp.
+     :type path: str
+
+    :return: A dict of IP addresses to MAC addresses.
+     :rtype: dict(str: str)
+    """
+    table = {}
+    try:
+        with open(path, 'r') as f:
+            # Skip the header: IP address, HW type, Flags, HW address, ...
+            f.readline()
+            for line in f:
+                fields = line.split()
+                # The flags 0x0 mean an incomplete entry
+                if len(fields) >= 4 and fields[2] != '0x0' and \
+                        len(fields[3]) == 17 and \
+                        fields[3] != '00:00:00:00:00:00':
+                    table[fields[0]] = fields[3]
+    except IOError as e:
+        log.warning('Could not read the ARP table %s: %s', path, str(e))
+    return table
+
+
+@contract
+def discover_host_macs(hosts):
+    """ Discover the MAC addresses of hosts using the ARP table.
+
+    The ARP table is read once, and only the hosts missing in it are
+    pinged in parallel to populate the table before reading it again.
+
+    :param hosts: A list of host names.
+     :type hosts: list(str)
+
+    :return: A dict of host names to the discovered MAC addresses.
+     :rtype: dict(str: str)
     """
-    return str(getattr(vm, 'OS-EXT-SRV-ATTR:host'))
+    hosts_ips = {}
+    for host in hosts:
+        try:
+            hosts_ips[host] = socket.gethostbyname(host)
+        except socket.error:
+            log.warning('Could not resolve the IP address of %s', host)
+    table = arp_table(ARP_TABLE)
+    missing = [host for host, ip in hosts_ips.items() if ip not in table]
+    if missing:
+        pings = [subprocess.Popen(['ping', '-c', '1', '-W', '1', host],
+                                  stdout=open(os.devnull, 'w'),
+                                  stderr=subprocess.STDOUT)
+                 for host in missing]
+        for ping in pings:
+            ping.wait()
+        table = arp_table(ARP_TABLE)
+    macs = dict((host, table[ip]) for host, ip in hosts_ips.items()
+                if ip in table)
+    not_found = sorted(set(hosts) - set(macs.keys()))
+    if not_found:
+        log.warning('Could not discover the MAC addresses of %s',
+                    str(not_found))
+    return macs
 
 
 @contract
-def migrate_vms(db, nova, vm_instance_directory, placement, block_migration):
-    """ Synchronously live migrate a set of VMs.
+def resolve_host_macs(db, host_macs, hosts):
+    """ Make sure the MAC addresses of the hosts are known.
+
+    The MAC addresses are looked up in the in-memory cache, then in the
+    database, and finally discovered and stored in the database.
 
     :param db: The database object.
      :type db: Database
 
-    :param nova: A Nova client.
-     :type nova: *
+    :param host_macs: A dict of host names to MAC addresses to update.
+     :type host_macs: dict(str: str)
 
-    :param vm_instance_directory: The VM instance directory.
-     :type vm_instance_directory: str
+    :param hosts: A list of host names.
+     :type hosts: list(str)
+
+    :return: The list of hosts with unknown MAC addresses.
+     :rtype: list(str)
+    """
+    missing = [host for host in hosts if host not in host_macs]
+    metrics.cache_requests('host_macs', True, len(hosts) - len(missing))
+    metrics.cache_requests('host_macs', False, len(missing))
+    if missing:
+        host_macs.update(db.select_host_macs())
+        missing = [host for host in missing if host not in host_macs]
+    if missing:
+        discovered = discover_host_macs(missing)
+        if discovered:
+            db.update_host_macs(discovered)
+            host_macs.update(discovered)
+        missing = [host for host in missing if host not in discovered]
+    return missing
+
+
+@contract
+def migrate_vms(config, state, plan, migration_times):
+    """ Synchronously live migrate VMs according to a migration plan.
+
+    The phases of the plan are executed one after another. The VMs
+    whose migration has failed in a phase are excluded from the
+    following phases.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :param plan: A list of placements, source hosts, and dependencies.
+     :type plan: list(tuple(dict, dict, dict))
+
+    :param migration_times: A dict of VM UUIDs to estimated migration times.
+     :type migration_times: dict(str: float)
+
+    :return: The list of VMs that could not be migrated.
+     :rtype: list(str)
+    """
+    failed = set()
+    for placement, sources, dependencies in plan:
+        placement = dict((vm, host) for vm, host in placement.items()
+                         if vm not in failed)
+        failed.update(migrate_phase(config, state, placement, sources,
+                                    dependencies, migration_times))
+    return sorted(failed)
+
+
+@contract
+def migrate_phase(config, state, placement, sources,
+                  dependencies, migration_times):
+    """ Synchronously live migrate a set of VMs concurrently.
+
+    Failed migrations are retried up to the configured number of times.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param state: A state dictionary.
+     :type state: dict(str: *)
 
     :param placement: A dict of VM UUIDs to host names.
      :type placement: dict(str: str)
 
-    :param block_migration: Whether to use block migration.
-     :type block_migration: bool
-    """
-    retry_placement = {}
-    vms = placement.keys()
-    # Migrate only 2 VMs at a time, as otherwise migrations may fail
-    #vm_pairs = [vms[x:x + 2] for x in xrange(0, len(vms), 2)]
-    # Temporary migrates VMs one by one
-    vm_pairs = [vms[x:x + 1] for x in xrange(0, len(vms), 1)]
-    for vm_pair in vm_pairs:
-        start_time = time.time()
-        for vm_uuid in vm_pair:
-            migrate_vm(nova, vm_instance_directory, vm_uuid,
-                       placement[vm_uuid], block_migration)
-
-        time.sleep(10)
-
-        while True:
-            for vm_uuid in list(vm_pair):
-                vm = nova.servers.get(vm_uuid)
-                if log.isEnabledFor(logging.DEBUG):
-                    log.debug('VM %s: %s, %s',
-                              vm_uuid,
-                              vm_hostname(vm),
-                              vm.status)
-                if vm_hostname(vm) == placement[vm_uuid] and \
-                    vm.status == u'ACTIVE':
-                    vm_pair.remove(vm_uuid)
-                    db.insert_vm_migration(vm_uuid, placement[vm_uuid])
-                    if log.isEnabledFor(logging.INFO):
-                        log.info('Completed migration of VM %s to %s',
-                                 vm_uuid, placement[vm_uuid])
-                elif time.time() - start_time > 300 and \
-                    vm_hostname(vm) != placement[vm_uuid] and \
-                    vm.status == u'ACTIVE':
-                    vm_pair.remove(vm_uuid)
-                    retry_placement[vm_uuid] = placement[vm_uuid]
-                    if log.isEnabledFor(logging.WARNING):
-                        log.warning('Time-out for migration of VM %s to %s, ' +
-                                    'will retry', vm_uuid, placement[vm_uuid])
-                else:
-                    break
-            else:
-                break
-            time.sleep(3)
+    :param sources: A dict of VM UUIDs to source host names.
+     :type sources: dict(str: str)
 
-    if retry_placement:
-        if log.isEnabledFor(logging.INFO):
-            log.info('Retrying the following migrations: %s',
-                     str(retry_placement))
-        migrate_vms(db, nova, vm_instance_directory,
-                    retry_placement, block_migration)
+    :param dependencies: A dict of VMs to the VMs to be migrated first.
+     :type dependencies: dict(str: list(str))
+
+    :param migration_times: A dict of VM UUIDs to estimated migration times.
+     :type migration_times: dict(str: float)
+
+    :return: The list of VMs that could not be migrated.
+     :rtype: list(str)
+    """
+    db = state['db']
+    nova = state['nova']
+    vm_instance_directory = config['vm_instance_directory']
+    block_migration = bool(config['block_migration'])
+    retries = int(config['migration_retries'])
+    remaining = dict(placement)
+    for attempt in xrange(retries + 1):
+        if attempt > 0 and log.isEnabledFor(logging.INFO):
+            log.info('Retrying the following migrations (attempt %d): %s',
+                     attempt, str(remaining))
+        completed, failed = migration.schedule_migrations(
+            nova, remaining, sources, migration_times,
+            int(config['migration_max_per_source']),
+            int(config['migration_max_per_destination']),
+            int(config['migration_max_total']),
+            lambda vm, host: migrate_vm(nova, vm_instance_directory,
+                                        vm, host, block_migration),
+            float(config['migration_poll_interval_min']),
+            float(config['migration_poll_interval_max']),
+            float(config['migration_timeout']),
+            dict((vm, [x for x in dependencies.get(vm, [])
+                       if x in remaining])
+                 for vm in remaining),
+            state['power'].is_ready)
+        for vm_uuid in completed:
+            db.insert_vm_migration(vm_uuid, remaining[vm_uuid])
+        if completed and log.isEnabledFor(logging.INFO):
+            log.info('Migration durations: %s', str(completed))
+        remaining = dict((vm, remaining[vm]) for vm in failed)
+        if not remaining:
+            break
+    if remaining:
+        log.error('Could not migrate the following VMs: %s', str(remaining))
+    return sorted(remaining.keys())
 
 
 @contract
@@ -837,12 +1575,15 @@ def migrate_vm(nova, vm_instance_directory, vm, host, block_migration):
 
 
 @contract
-def switch_hosts_off(db, sleep_command, hosts):
-    """ Switch hosts to a low-power mode.
+def switch_hosts_off(db, power, sleep_command, hosts):
+    """ Switch hosts to a low-power mode in parallel.
 
     :param db: The database object.
      :type db: Database
 
+    :param power: The power manager.
+     :type power: *
+
     :param sleep_command: A Shell command to switch off a host.
      :type sleep_command: str
 
@@ -850,24 +1591,28 @@ def switch_hosts_off(db, sleep_command, hosts):
      :type hosts: list(str)
     """
     if sleep_command:
-        for host in hosts:
-            command = 'ssh {0} "{1}"'. \
-                format(host, sleep_command)
-            if log.isEnabledFor(logging.DEBUG):
-                log.debug('Calling: %s', command)
-            subprocess.call(command, shell=True)
+        hosts = power.suspend(dict(
+            (host, 'ssh {0} "{1}"'.format(host, sleep_command))
+            for host in hosts))
     if log.isEnabledFor(logging.INFO):
         log.info('Switched off hosts: %s', str(hosts))
-    db.insert_host_states(dict((x, 0) for x in hosts))
+    if hosts:
+        db.insert_host_states(dict((x, 0) for x in hosts))
 
 
 @contract
-def switch_hosts_on(db, ether_wake_interface, host_macs, hosts):
+def switch_hosts_on(db, power, ether_wake_interface, host_macs, hosts):
     """ Switch hosts to the active mode.
 
+    The hosts are woken up in the background, the power manager tracks
+    when they become ready to accept VMs.
+
     :param db: The database object.
      :type db: Database
 
+    :param power: The power manager.
+     :type power: *
+
     :param ether_wake_interface: An interface to send a magic packet.
      :type ether_wake_interface: str
 
@@ -876,17 +1621,40 @@ def switch_hosts_on(db, ether_wake_interface, host_macs, hosts):
 
     :param hosts: A list of hosts to switch on.
      :type hosts: list(str)
+
+    :return: The hosts switched on, excluding the unknown MAC addresses.
+     :rtype: list(str)
     """
-    for host in hosts:
-        if host not in host_macs:
-            host_macs[host] = host_mac(host)
-        command = '{0} -i {1} {2}'.format(
-            etherwake,
-            ether_wake_interface,
-            host_macs[host])
-        if log.isEnabledFor(logging.DEBUG):
-            log.debug('Calling: %s', command)
-        subprocess.call(command, shell=True)
+    missing = resolve_host_macs(db, host_macs, hosts)
+    if missing:
+        log.error('Cannot wake up hosts with unknown MAC addresses: %s',
+                  str(missing))
+    hosts = [host for host in hosts if host not in missing]
+    power.wake(dict(
+        (host, '{0} -i {1} {2}'.format(etherwake,
+                                       ether_wake_interface,
+                                       host_macs[host]))
+        for host in hosts))
     if log.isEnabledFor(logging.INFO):
         log.info('Switched on hosts: %s', str(hosts))
     db.insert_host_states(dict((x, 1) for x in hosts))
+    return hosts
+
+
+@contract
+def record_power_latencies(db, power):
+    """ Store the measured latencies of power state transitions.
+
+    The power manager is updated with the new mean resume latencies.
+
+    :param db: The database object.
+     :type db: Database
+
+    :param power: The power manager.
+     :type power: *
+    """
+    latencies = power.pop_latencies()
+    for host, state, latency in latencies:
+        db.insert_host_power_latency(host, state, latency)
+    if any(x[1] == 1 for x in latencies):
+        power.set_resume_latencies(db.select_host_power_latencies()[1])
@@ -0,0 +1,357 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" A scheduler of concurrent VM live migrations.
+
+Migrating VMs one by one makes the evacuation of a host take tens of
+minutes, while starting all the migrations at once saturates the
+network links of the hosts and makes migrations fail. The scheduler
+runs migrations concurrently within configurable limits on the number
+of simultaneous migrations per source host, per destination host, and
+in total. Migrations are started in the order of their estimated
+duration, shortest first, which minimizes the mean completion time.
+
+The states of all the VMs being migrated are obtained using a single
+`servers.list()` call per poll restricted by the `changes-since`
+filter. The poll interval adapts to the estimated completion time of
+the earliest in-flight migration within the configured bounds. Each
+migration has its own deadline derived from its estimated duration.
+
+Before being executed, a placement is turned into a migration plan.
+A VM may be sent to a host only once the host has enough free RAM for
+it, which may require other VMs to leave the host first. The plan is a
+DAG of migrations, in which each migration depends on the migrations
+from its destination host that free the required RAM. The scheduler
+starts a migration as soon as all its dependencies have completed. A
+cycle of migrations is broken by moving a VM through a temporary host
+having enough free RAM, and completing the move in a following phase.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+from neat.contracts_extra import *
+
+import datetime
+import time
+
+from neat.globals.cluster import CHANGES_SINCE_MARGIN
+import neat.metrics as metrics
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# The migration deadline in estimated migration times, if it exceeds
+# the minimum timeout
+TIMEOUT_FACTOR = 3
+
+
+@contract
+def estimate_migration_times(vms_ram, bandwidth):
+    """ Estimate the migration time of each VM from its RAM.
+
+    :param vms_ram: A map of VM UUIDs to the corresponding maximum RAM in MB.
+     :type vms_ram: dict(str: number)
+
+    :param bandwidth: The network bandwidth in MB/s.
+     :type bandwidth: float,>0
+
+    :return: A map of VM UUIDs to the estimated migration times in seconds.
+     :rtype: dict(str: float)
+    """
+    return dict((vm, float(ram) / bandwidth) for vm, ram in vms_ram.items())
+
+
+@contract
+def plan_migrations(placement, sources, vms_ram, hosts_free_ram,
+                    allow_temporary=True):
+    """ Turn a placement into a dependency-aware migration plan.
+
+    A plan consists of phases executed one after another, each phase
+    is a tuple of a placement, the source hosts of the VMs, and a dict
+    of VM UUIDs to the lists of VMs that must leave the destination
+    host of the VM before its migration. The capacity of the hosts
+    missing in the free RAM dict is not restricted.
+
+    :param placement: A dict of VM UUIDs to destination host names.
+     :type placement: dict(str: str)
+
+    :param sources: A dict of VM UUIDs to source host names.
+     :type sources: dict(str: str)
+
+    :param vms_ram: A dict of VM UUIDs to the RAM limits in MB.
+     :type vms_ram: dict(str: number)
+
+    :param hosts_free_ram: A dict of host names to the free RAM in MB.
+     :type hosts_free_ram: dict(str: number)
+
+    :param allow_temporary: Whether cycles can be broken through other hosts.
+     :type allow_temporary: bool
+
+    :return: The migration phases, and the VMs that cannot be migrated.
+     :rtype: tuple(list(tuple(dict, dict, dict)), list(str))
+    """
+    free = dict(hosts_free_ram)
+    departed = {}
+    remaining = sorted(placement.keys(),
+                       key=lambda vm: (vms_ram.get(vm, 0), vm))
+    phase_placement = {}
+    phase_sources = {}
+    dependencies = {}
+    next_placement = {}
+    next_sources = {}
+    unplanned = []
+
+    while remaining:
+        stage_placement = {}
+        for vm in remaining:
+            destination = placement[vm]
+            if destination in free:
+                if free[destination] < vms_ram.get(vm, 0):
+                    continue
+                free[destination] -= vms_ram.get(vm, 0)
+            stage_placement[vm] = destination
+        if not stage_placement:
+            # No VM fits: either there is a cycle, or the placement
+            # exceeds the capacity of the hosts
+            vm = remaining[0]
+            candidates = sorted(
+                [(-ram, host) for host, ram in free.items()
+                 if host not in (placement[vm], sources.get(vm)) and
+                 ram >= vms_ram.get(vm, 0)])
+            remaining.remove(vm)
+            if not candidates or not allow_temporary:
+                log.warning('No capacity to migrate VM %s to %s',
+                            vm, placement[vm])
+                unplanned.append(vm)
+                continue
+            temporary_host = candidates[0][1]
+            free[temporary_host] -= vms_ram.get(vm, 0)
+            log.info('Breaking a migration cycle: moving VM %s to %s ' +
+                     'through %s', vm, placement[vm], temporary_host)
+            next_placement[vm] = placement[vm]
+            next_sources[vm] = temporary_host
+            stage_placement = {vm: temporary_host}
+        for vm, destination in stage_placement.items():
+            phase_placement[vm] = destination
+            phase_sources[vm] = sources.get(vm)
+            dependencies[vm] = list(departed.get(destination, []))
+            if vm in remaining:
+                remaining.remove(vm)
+        for vm in stage_placement:
+            source = sources.get(vm)
+            if source in free:
+                free[source] += vms_ram.get(vm, 0)
+            departed.setdefault(source, []).append(vm)
+
+    phases = []
+    if phase_placement:
+        phases.append((phase_placement, phase_sources, dependencies))
+    if next_placement:
+        next_phases, next_unplanned = plan_migrations(
+            next_placement, next_sources, vms_ram, free, False)
+        phases.extend(next_phases)
+        unplanned.extend(next_unplanned)
+    return phases, unplanned
+
+
+@contract
+def schedule_migrations(nova, placement, sources, migration_times,
+                        max_per_source, max_per_destination, max_total,
+                        start_migration, min_poll_interval,
+                        max_poll_interval, timeout, dependencies=None,
+                        host_ready=None):
+    """ Run a set of live migrations concurrently within the limits.
+
+    A migration is started once the migrations it depends on have
+    completed, and its destination host is ready: the host readiness
+    function returns True if the host is ready, False if the host has
+    failed to become ready, and None if the host is still waking up.
+
+    :param nova: A Nova client.
+     :type nova: *
+
+    :param placement: A dict of VM UUIDs to destination host names.
+     :type placement: dict(str: str)
+
+    :param sources: A dict of VM UUIDs to source host names.
+     :type sources: dict(str: str)
+
+    :param migration_times: A dict of VM UUIDs to estimated migration times.
+     :type migration_times: dict(str: float)
+
+    :param max_per_source: The maximum migrations from a host at a time.
+     :type max_per_source: int,>0
+
+    :param max_per_destination: The maximum migrations to a host at a time.
+     :type max_per_destination: int,>0
+
+    :param max_total: The maximum number of migrations at a time.
+     :type max_total: int,>0
+
+    :param start_migration: A function starting a migration of a VM to a host.
+     :type start_migration: function
+
+    :param min_poll_interval: The minimum time between polls in seconds.
+     :type min_poll_interval: number,>=0
+
+    :param max_poll_interval: The maximum time between polls in seconds.
+     :type max_poll_interval: number,>=0
+
+    :param timeout: The minimum time after which a migration is failed.
+     :type timeout: number,>0
+
+    :param dependencies: A dict of VMs to the VMs to be migrated first.
+     :type dependencies: None|dict(str: list(str))
+
+    :param host_ready: A function checking whether a host accepts VMs.
+     :type host_ready: None|function
+
+    :return: The durations of completed migrations, and the failed VMs.
+     :rtype: tuple(dict(str: float), list(str))
+    """
+    changes_since = datetime.datetime.utcfromtimestamp(
+        time.time() - CHANGES_SINCE_MARGIN).strftime('%Y-%m-%dT%H:%M:%SZ')
+    queue = sorted(placement.keys(),
+                   key=lambda vm: (migration_times.get(vm, 0.), vm))
+    in_flight = {}
+    deadlines = {}
+    from_source = dict((host, 0) for host in sources.values())
+    to_destination = dict((host, 0) for host in placement.values())
+    completed = {}
+    failed = []
+
+    if dependencies is None:
+        dependencies = {}
+
+    while queue or in_flight:
+        for vm in list(queue):
+            if len(in_flight) >= max_total:
+                break
+            vm_dependencies = dependencies.get(vm, [])
+            if any(x in failed for x in vm_dependencies):
+                log.warning('Not migrating VM %s to %s as the migrations ' +
+                            'it depends on have failed', vm, placement[vm])
+                queue.remove(vm)
+                failed.append(vm)
+                continue
+            if not all(x in completed or x not in placement
+                       for x in vm_dependencies):
+                continue
+            source = sources.get(vm)
+            destination = placement[vm]
+            if from_source.get(source, 0) >= max_per_source or \
+                    to_destination[destination] >= max_per_destination:
+                continue
+            if host_ready is not None:
+                ready = host_ready(destination)
+                if ready is None:
+                    continue
+                if not ready:
+                    log.warning('Not migrating VM %s as host %s is ' +
+                                'not available', vm, destination)
+                    queue.remove(vm)
+                    failed.append(vm)
+                    continue
+            queue.remove(vm)
+            try:
+                start_migration(vm, destination)
+            except Exception as e:
+                log.warning('Could not start migration of VM %s to %s: %s',
+                            vm, destination, str(e))
+                failed.append(vm)
+                metrics.inc('neat_migrations_total', {'result': 'failed'})
+                continue
+            start_time = time.time()
+            in_flight[vm] = start_time
+            deadlines[vm] = start_time + max(
+                timeout, TIMEOUT_FACTOR * migration_times.get(vm, 0.))
+            from_source[source] = from_source.get(source, 0) + 1
+            to_destination[destination] += 1
+            metrics.gauge('neat_migrations_in_flight', len(in_flight))
+
+        if not in_flight:
+            if queue:
+                # Waiting for the destination hosts to become ready
+                time.sleep(min_poll_interval)
+            continue
+        time.sleep(poll_interval(in_flight, migration_times,
+                                 min_poll_interval, max_poll_interval))
+
+        servers = dict((str(server.id), server)
+                       for server in nova.servers.list(
+                           search_opts={'changes-since': changes_since}))
+        now = time.time()
+        for vm, start_time in in_flight.items():
+            server = servers.get(vm)
+            duration = now - start_time
+            if server is not None:
+                host = str(getattr(server, 'OS-EXT-SRV-ATTR:host'))
+                status = server.status
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug('VM %s: %s, %s', vm, host, status)
+            else:
+                host = status = None
+            if host == placement[vm] and status == u'ACTIVE':
+                completed[vm] = duration
+                metrics.inc('neat_migrations_total', {'result': 'completed'})
+                if log.isEnabledFor(logging.INFO):
+                    log.info('Completed migration of VM %s to %s ' +
+                             'in %.1f seconds (estimated %.1f)',
+                             vm, placement[vm], duration,
+                             migration_times.get(vm, 0.))
+            elif status == u'ERROR' or \
+                    now > deadlines[vm] and status in (None, u'ACTIVE'):
+                failed.append(vm)
+                metrics.inc('neat_migrations_total', {'result': 'failed'})
+                if log.isEnabledFor(logging.WARNING):
+                    log.warning('Migration of VM %s to %s failed ' +
+                                'after %.1f seconds, status %s',
+                                vm, placement[vm], duration, status)
+            else:
+                continue
+            del in_flight[vm]
+            from_source[sources.get(vm)] -= 1
+            to_destination[placement[vm]] -= 1
+            metrics.gauge('neat_migrations_in_flight', len(in_flight))
+
+    return completed, failed
+
+
+@contract
+def poll_interval(in_flight, migration_times, min_interval, max_interval):
+    """ Calculate the time until the next poll of the migration states.
+
+    The next poll is scheduled at the estimated completion time of the
+    earliest in-flight migration, bounded by the minimum and maximum
+    intervals.
+
+    :param in_flight: A dict of VM UUIDs to the migration start times.
+     :type in_flight: dict(str: number)
+
+    :param migration_times: A dict of VM UUIDs to estimated migration times.
+     :type migration_times: dict(str: float)
+
+    :param min_interval: The minimum time between polls in seconds.
+     :type min_interval: number,>=0
+
+    :param max_interval: The maximum time between polls in seconds.
+     :type max_interval: number,>=0
+
+    :return: The time to sleep before the next poll in seconds.
+     :rtype: number,>=0
+    """
+    expected = min(start + migration_times.get(vm, 0.)
+                   for vm, start in in_flight.items())
+    return min(max(expected - time.time(), min_interval), max_interval)
@@ -0,0 +1,300 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Parallel power state transitions of the compute hosts.
+
+Hosts are switched on and off by running shell commands: sending a
+Wake-on-LAN packet, or running a sleep command over SSH. The power
+manager runs the commands for all the hosts in parallel threads and
+kills the commands exceeding the timeout.
+
+A host is considered ready to accept VMs once a TCP connection can be
+established to the probed port, e.g., SSH or libvirt. Waking up hosts
+does not block: the readiness of each woken host is tracked in the
+background, which allows migrations to wait only for their destination
+host. The host is considered suspended once the port stops accepting
+connections. The measured suspend and resume latencies are buffered
+to be stored in the database by the global manager.
+
+A host that has been woken up before is given a multiple of its mean
+resume latency to become ready, bounded by the configured timeout, so
+that a failed resume is detected without waiting for the slowest host.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+import socket
+import subprocess
+import threading
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# The interval in seconds between checks of running commands
+COMMAND_POLL_INTERVAL = 0.05
+
+# The multiple of the mean resume latency of a host given to it to wake up
+READY_TIMEOUT_FACTOR = 3
+
+
+class PowerManager(object):
+    """ Runs power state transitions and tracks the readiness of hosts.
+    """
+
+    @contract(probe_port='int,>0',
+              probe_interval='number,>0',
+              command_timeout='number,>0',
+              ready_timeout='number,>0')
+    def __init__(self, probe_port, probe_interval,
+                 command_timeout, ready_timeout):
+        """ Initialize the power manager.
+
+        :param probe_port: The TCP port probed to check a host.
+        :param probe_interval: The time between probes in seconds.
+        :param command_timeout: The maximum time to run a command.
+        :param ready_timeout: The maximum time for a host to wake up.
+        """
+        self.probe_port = probe_port
+        self.probe_interval = probe_interval
+        self.command_timeout = command_timeout
+        self.ready_timeout = ready_timeout
+        self.condition = threading.Condition()
+        self.ready = {}
+        self.latencies = []
+        self.resume_latencies = {}
+
+    @contract
+    def wake(self, commands):
+        """ Start waking up hosts without waiting for them.
+
+        :param commands: A dict of host names to the wake up commands.
+         :type commands: dict(str: str)
+        """
+        with self.condition:
+            for host in commands:
+                self.ready[host] = None
+        for host, command in commands.items():
+            thread = threading.Thread(target=self._wake,
+                                      args=(host, command))
+            thread.daemon = True
+            thread.start()
+
+    def _wake(self, host, command):
+        """ Wake up a host and wait until it accepts connections.
+
+        :param host: A host name.
+        :param command: The wake up command.
+        """
+        start = time.time()
+        timeout = self.host_ready_timeout(host)
+        latency = None
+        if probe_port(host, self.probe_port, self.probe_interval):
+            ready = True
+        else:
+            run_command(command, self.command_timeout)
+            ready = wait_for_port(host, self.probe_port, True,
+                                  start + timeout,
+                                  self.probe_interval)
+            if ready:
+                latency = time.time() - start
+        with self.condition:
+            self.ready[host] = ready
+            if latency is not None:
+                self.latencies.append((host, 1, latency))
+            self.condition.notify_all()
+        if not ready:
+            log.warning('Host %s has not woken up in %.1f seconds',
+                        host, timeout)
+        elif latency is not None:
+            log.info('Host %s has woken up in %.1f seconds', host, latency)
+
+    @contract
+    def set_resume_latencies(self, latencies):
+        """ Set the mean resume latencies of the hosts.
+
+        :param latencies: A dict of host names to mean resume latencies.
+         :type latencies: dict(str: number)
+        """
+        with self.condition:
+            self.resume_latencies = dict(latencies)
+
+    @contract
+    def host_ready_timeout(self, host):
+        """ Get the maximum time for a host to wake up.
+
+        :param host: A host name.
+         :type host: str
+
+        :return: The timeout in seconds.
+         :rtype: number,>0
+        """
+        with self.condition:
+            latency = self.resume_latencies.get(host)
+        if not latency:
+            return self.ready_timeout
+        return min(self.ready_timeout, READY_TIMEOUT_FACTOR * latency)
+
+    @contract
+    def suspend(self, commands):
+        """ Suspend hosts in parallel and wait for the results.
+
+        :param commands: A dict of host names to the suspend commands.
+         :type commands: dict(str: str)
+
+        :return: The list of hosts that have been suspended.
+         :rtype: list(str)
+        """
+        with self.condition:
+            for host in commands:
+                self.ready[host] = False
+        suspended = []
+        threads = [threading.Thread(target=self._suspend,
+                                    args=(host, command, suspended))
+                   for host, command in commands.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(suspended)
+
+    def _suspend(self, host, command, suspended):
+        """ Suspend a host and wait until it stops accepting connections.
+
+        :param host: A host name.
+        :param command: The suspend command.
+        :param suspended: A list to add the host to if it is suspended.
+        """
+        start = time.time()
+        deadline = start + self.command_timeout
+        run_command(command, self.command_timeout)
+        down = wait_for_port(host, self.probe_port, False,
+                             deadline, self.probe_interval)
+        with self.condition:
+            if down:
+                suspended.append(host)
+                self.latencies.append((host, 0, time.time() - start))
+            else:
+                self.ready[host] = True
+        if not down:
+            log.warning('Host %s has not been suspended in %.1f seconds',
+                        host, self.command_timeout)
+
+    @contract
+    def is_ready(self, host):
+        """ Check whether a host is ready to accept VMs.
+
+        :param host: A host name.
+         :type host: str
+
+        :return: True if ready, False if failed, None if waking up.
+         :rtype: None|bool
+        """
+        with self.condition:
+            return self.ready.get(host, True)
+
+    @contract
+    def pop_latencies(self):
+        """ Take the measured latencies of power state transitions.
+
+        :return: A list of host names, target states, and latencies.
+         :rtype: list(tuple(str, int, float))
+        """
+        with self.condition:
+            latencies = self.latencies
+            self.latencies = []
+            return latencies
+
+
+@contract
+def run_command(command, timeout):
+    """ Run a shell command, killing it if it exceeds the timeout.
+
+    :param command: A shell command.
+     :type command: str
+
+    :param timeout: The maximum time to run the command in seconds.
+     :type timeout: number,>0
+
+    :return: The return code, or None if the command has timed out.
+     :rtype: None|int
+    """
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug('Calling: %s', command)
+    process = subprocess.Popen(command, shell=True)
+    deadline = time.time() + timeout
+    while process.poll() is None:
+        if time.time() >= deadline:
+            process.kill()
+            process.wait()
+            log.warning('Command timed out: %s', command)
+            return None
+        time.sleep(COMMAND_POLL_INTERVAL)
+    return process.returncode
+
+
+@contract
+def probe_port(host, port, timeout):
+    """ Check whether a host accepts TCP connections on a port.
+
+    :param host: A host name.
+     :type host: str
+
+    :param port: A TCP port.
+     :type port: int,>0
+
+    :param timeout: The connection timeout in seconds.
+     :type timeout: number,>0
+
+    :return: Whether a connection has been established.
+     :rtype: bool
+    """
+    try:
+        connection = socket.create_connection((host, port), timeout)
+        connection.close()
+        return True
+    except (socket.error, socket.timeout):
+        return False
+
+
+@contract
+def wait_for_port(host, port, reachable, deadline, interval):
+    """ Wait until a port of a host becomes reachable or unreachable.
+
+    :param host: A host name.
+     :type host: str
+
+    :param port: A TCP port.
+     :type port: int,>0
+
+    :param reachable: Whether to wait for the port to become reachable.
+     :type reachable: bool
+
+    :param deadline: The time to stop waiting.
+     :type deadline: number
+
+    :param interval: The time between probes in seconds.
+     :type interval: number,>0
+
+    :return: Whether the port has reached the required state.
+     :rtype: bool
+    """
+    while True:
+        if probe_port(host, port, interval) == reachable:
+            return True
+        if time.time() >= deadline:
+            return False
+        time.sleep(interval)
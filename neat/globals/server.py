@@ -0,0 +1,154 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" A concurrent WSGI server for the global manager REST API.
+
+The default server of Bottle is single-threaded and closes the
+connection after each request, which serializes the requests of all
+the compute hosts. The threaded server handles each connection in a
+separate thread and supports HTTP/1.1 persistent connections, so that
+a local manager can reuse its connection to the global manager.
+Connections idle for longer than the keep-alive timeout are closed.
+
+Requests are handled concurrently, and the requests of the same host
+are serialized using per-host locks.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+import bottle
+import SocketServer
+import StringIO
+import threading
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, \
+    ServerHandler, make_server
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class HostLocks(object):
+    """ A set of locks created on demand, one per host.
+    """
+
+    def __init__(self):
+        """ Initialize the set of locks.
+        """
+        self.lock = threading.Lock()
+        self.locks = {}
+
+    @contract
+    def __call__(self, host):
+        """ Get the lock of a host.
+
+        :param host: A host name.
+         :type host: str
+
+        :return: The lock of the host.
+         :rtype: *
+        """
+        with self.lock:
+            if host not in self.locks:
+                self.locks[host] = threading.Lock()
+            return self.locks[host]
+
+
+class ThreadingWSGIServer(SocketServer.ThreadingMixIn, WSGIServer):
+    """ A WSGI server handling each connection in a separate thread.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class KeepAliveServerHandler(ServerHandler):
+    """ A WSGI handler responding with HTTP/1.1.
+    """
+
+    http_version = '1.1'
+    keep_alive = False
+
+    def close(self):
+        """ Check whether the connection can be kept open and finish.
+        """
+        # The headers are reset when the response is closed
+        self.keep_alive = self.headers is not None and \
+            'Content-Length' in self.headers and \
+            self.headers.get('Connection', '').lower() != 'close'
+        ServerHandler.close(self)
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """ A request handler serving multiple requests per connection.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        """ Handle the requests until the connection is closed.
+        """
+        self.close_connection = 1
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        """ Handle a single request of a persistent connection.
+        """
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except Exception:
+            # The keep-alive timeout has expired or the client has gone
+            self.close_connection = 1
+            return
+        if not self.raw_requestline or len(self.raw_requestline) > 65536:
+            self.close_connection = 1
+            return
+        if not self.parse_request():
+            return
+        if 'chunked' in self.headers.get('Transfer-Encoding', ''):
+            self.close_connection = 1
+        # The body is read completely to keep the connection consistent
+        # even if the application does not read it
+        length = int(self.headers.get('Content-Length') or 0)
+        body = StringIO.StringIO(self.rfile.read(length) if length else '')
+        handler = KeepAliveServerHandler(
+            body, self.wfile, self.get_stderr(), self.get_environ())
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+        if not handler.keep_alive:
+            self.close_connection = 1
+
+    def log_message(self, format, *args):
+        """ Log the requests using the logging module.
+        """
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('%s - %s', self.client_address[0], format % args)
+
+
+class ThreadingServer(bottle.ServerAdapter):
+    """ A Bottle server adapter for the threaded keep-alive server.
+    """
+
+    def run(self, app):
+        keepalive_timeout = self.options.get('keepalive_timeout', 15)
+
+        class Handler(KeepAliveRequestHandler):
+            timeout = keepalive_timeout
+
+        self.server = make_server(self.host, self.port, app,
+                                  ThreadingWSGIServer, Handler)
+        self.port = self.server.server_port
+        self.server.serve_forever()
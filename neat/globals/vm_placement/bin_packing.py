@@ -19,6 +19,8 @@ from contracts import contract
 from neat.contracts_primitive import *
 from neat.contracts_extra import *
 
+import numpy
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -60,6 +62,44 @@ def best_fit_decreasing_factory(time_step, migration_time, params):
          {})
 
 
+@contract
+def percentile_best_fit_decreasing_factory(time_step, migration_time, params):
+    """ Creates the time series aware Best Fit Decreasing heuristic.
+
+    :param time_step: The length of the simulation time step in seconds.
+     :type time_step: int,>=0
+
+    :param migration_time: The VM migration time in time seconds.
+     :type migration_time: float,>=0
+
+    :param params: A dictionary containing the algorithm's parameters.
+     :type params: dict(str: *)
+
+    :return: A function implementing the percentile BFD algorithm.
+     :rtype: function
+    """
+    return lambda hosts_cpu_usage, hosts_cpu_total, \
+                  hosts_ram_usage, hosts_ram_total, \
+                  inactive_hosts_cpu, inactive_hosts_ram, \
+                  vms_cpu, vms_ram, state=None: \
+        (percentile_best_fit_decreasing(
+            params['last_n_vm_cpu'],
+            params['percentile'],
+            get_available_resources(
+                    params['cpu_threshold'],
+                    hosts_cpu_usage,
+                    hosts_cpu_total),
+            get_available_resources(
+                    params['ram_threshold'],
+                    hosts_ram_usage,
+                    hosts_ram_total),
+            inactive_hosts_cpu,
+            inactive_hosts_ram,
+            vms_cpu,
+            vms_ram),
+         {})
+
+
 @contract
 def get_available_resources(threshold, usage, total):
     """ Get a map of the available resource capacity.
@@ -158,3 +198,121 @@ def best_fit_decreasing(last_n_vm_cpu, hosts_cpu, hosts_ram,
     if len(vms) == len(mapping):
         return mapping
     return {}
+
+
+@contract
+def vms_cpu_matrix(last_n_vm_cpu, vms_cpu):
+    """ Build a matrix of aligned CPU utilization histories of VMs.
+
+    Histories shorter than the required length are padded on the left
+    with their mean value.
+
+    :param last_n_vm_cpu: The number of last VM CPU usage values to use.
+     :type last_n_vm_cpu: int,>0
+
+    :param vms_cpu: A list of non-empty VM CPU utilization histories in MHz.
+     :type vms_cpu: list(list(int))
+
+    :return: A matrix with a row of the length last_n_vm_cpu for each VM.
+     :rtype: array[NxM]
+    """
+    length = min(last_n_vm_cpu, max([len(x) for x in vms_cpu] + [1]))
+    matrix = numpy.zeros((len(vms_cpu), length))
+    for i, cpu in enumerate(vms_cpu):
+        series = cpu[-length:]
+        matrix[i, :length - len(series)] = float(sum(series)) / len(series)
+        matrix[i, length - len(series):] = series
+    return matrix
+
+
+@contract
+def percentile_best_fit_decreasing(last_n_vm_cpu, percentile,
+                                   hosts_cpu, hosts_ram,
+                                   inactive_hosts_cpu, inactive_hosts_ram,
+                                   vms_cpu, vms_ram):
+    """ The time series aware Best Fit Decreasing heuristic.
+
+    Instead of reducing a VM's history to its mean, the full series of
+    the last n values is kept for every VM and host. A VM fits a host
+    if the given percentile of the element-wise sum of the series of
+    the VMs already placed on the host and the VM's series does not
+    exceed the host's available CPU. Therefore, VMs with coinciding
+    peaks are not packed together, while VMs with non-coinciding peaks
+    can share a host.
+
+    :param last_n_vm_cpu: The number of last VM CPU usage values to use.
+     :type last_n_vm_cpu: int,>0
+
+    :param percentile: The percentile of the series to check, e.g., 95.
+     :type percentile: number,>=0,<=100
+
+    :param hosts_cpu: A map of host names and their available CPU in MHz.
+     :type hosts_cpu: dict(str: int)
+
+    :param hosts_ram: A map of host names and their available RAM in MB.
+     :type hosts_ram: dict(str: int)
+
+    :param inactive_hosts_cpu: A map of inactive hosts and available CPU MHz.
+     :type inactive_hosts_cpu: dict(str: int)
+
+    :param inactive_hosts_ram: A map of inactive hosts and available RAM MB.
+     :type inactive_hosts_ram: dict(str: int)
+
+    :param vms_cpu: A map of VM UUID and their CPU utilization in MHz.
+     :type vms_cpu: dict(str: list(int))
+
+    :param vms_ram: A map of VM UUID and their RAM usage in MB.
+     :type vms_ram: dict(str: int)
+
+    :return: A map of VM UUIDs to host names, or {} if cannot be solved.
+     :rtype: dict(str: str)
+    """
+    vms = []
+    for vm, cpu in vms_cpu.items():
+        if cpu:
+            vms.append(vm)
+        else:
+            log.warning('No CPU data for VM: %s - skipping', vm)
+    if not vms:
+        return {}
+
+    vms_series = vms_cpu_matrix(last_n_vm_cpu, [vms_cpu[vm] for vm in vms])
+    vms_peak = numpy.percentile(vms_series, percentile, axis=1)
+    order = sorted(((vms_peak[i], vms_ram[vm], vm, i)
+                    for i, vm in enumerate(vms)), reverse=True)
+
+    hosts = sorted(hosts_cpu.keys())
+    hosts_cpu_available = numpy.array([hosts_cpu[x] for x in hosts],
+                                      dtype=float)
+    hosts_ram_available = numpy.array([hosts_ram[x] for x in hosts],
+                                      dtype=float)
+    hosts_series = numpy.zeros((len(hosts), vms_series.shape[1]))
+    inactive_hosts = sorted(((v, inactive_hosts_ram[k], k)
+                             for k, v in inactive_hosts_cpu.items()))
+
+    mapping = {}
+    for _, vm_ram, vm_uuid, i in order:
+        while True:
+            candidate_series = hosts_series + vms_series[i]
+            slack = hosts_cpu_available - numpy.percentile(
+                candidate_series, percentile, axis=1)
+            fits = numpy.logical_and(slack >= 0,
+                                     hosts_ram_available >= vm_ram)
+            if fits.any():
+                j = int(numpy.argmin(numpy.where(fits, slack, numpy.inf)))
+                hosts_series[j] = candidate_series[j]
+                hosts_ram_available[j] -= vm_ram
+                mapping[vm_uuid] = hosts[j]
+                break
+            if not inactive_hosts:
+                break
+            cpu, ram, host = inactive_hosts.pop(0)
+            hosts.append(host)
+            hosts_cpu_available = numpy.append(hosts_cpu_available, cpu)
+            hosts_ram_available = numpy.append(hosts_ram_available, ram)
+            hosts_series = numpy.vstack(
+                (hosts_series, numpy.zeros(vms_series.shape[1])))
+
+    if len(vms) == len(mapping):
+        return mapping
+    return {}
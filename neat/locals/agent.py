@@ -0,0 +1,249 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" The local agent combining the data collector and local manager.
+
+By default, the data collector and local manager run as two separate
+processes on every compute host, which exchange the collected data
+through the files in the local data directory. As an alternative, the
+local agent runs both of them in a single process: the collected data
+are kept in memory in a History object shared by the data collector
+and local manager, which also share a single libvirt connection and
+database connection.
+
+The local agent performs a data collection iteration every
+data_collector_interval seconds aligned to the data_collector_phase,
+and an iteration of the local manager right after every n-th data
+collection, where n is the ratio of the local_manager_interval to the
+data_collector_interval, but at least 1. The local data directory is
+not used by the local agent, and the local_manager_trigger and
+local_manager_phase options are ignored.
+
+The local agent is started using the neat-local-agent command instead
+of the data collector and local manager.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+from neat.contracts_extra import *
+
+from collections import deque
+
+import neat.common as common
+from neat.config import *
+import neat.locals.collector as collector
+import neat.locals.manager as manager
+import neat.locals.vm_cache as vm_cache
+import neat.metrics as metrics
+import neat.profiler as profiler
+from neat.scheduler import monotonic
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class History(object):
+    """ The in-memory histories of the CPU usage by the VMs and host.
+
+    The methods correspond to the functions used by the data collector
+    and local manager to access the local data directory.
+    """
+
+    @contract(length='int,>=0')
+    def __init__(self, length):
+        """ Initialize empty histories.
+
+        :param length: The maximum length of the histories.
+        """
+        self.length = length
+        self.vms = {}
+        self.host = deque(maxlen=length)
+        self.sample_time = None
+        self.samples = 0
+
+    @contract
+    def get_vms(self):
+        """ Get the UUIDs of the VMs having a history.
+
+        :return: A list of VM UUIDs.
+         :rtype: list(str)
+        """
+        return self.vms.keys()
+
+    @contract
+    def write_vm_data(self, data):
+        """ Replace the histories of a set of VMs.
+
+        :param data: A map of VM UUIDs onto the corresponing CPU MHz history.
+         :type data: dict(str : list(int))
+        """
+        for uuid, values in data.items():
+            self.vms[uuid] = deque(values, self.length)
+
+    @contract
+    def cleanup_vm_data(self, uuids):
+        """ Delete the histories of the removed VMs.
+
+        :param uuids: A list of removed VM UUIDs.
+         :type uuids: list(str)
+        """
+        for uuid in uuids:
+            self.vms.pop(uuid, None)
+
+    @contract
+    def append_vm_data(self, data):
+        """ Append a CPU MHz value for each out of a set of VMs.
+
+        :param data: A map of VM UUIDs onto the corresponing CPU MHz values.
+         :type data: dict(str : int)
+        """
+        for uuid, value in data.items():
+            if uuid not in self.vms:
+                self.vms[uuid] = deque(maxlen=self.length)
+            self.vms[uuid].append(value)
+
+    @contract
+    def write_host_data(self, data):
+        """ Replace the history of the host.
+
+        :param data: A CPU MHz history of the host.
+         :type data: list(int)
+        """
+        self.host = deque(data, self.length)
+
+    @contract
+    def append_host_data(self, cpu_mhz):
+        """ Append a CPU MHz value for the host, which completes a sample.
+
+        :param cpu_mhz: A CPU MHz value.
+         :type cpu_mhz: int,>=0
+        """
+        self.host.append(cpu_mhz)
+        self.sample_time = monotonic()
+        self.samples += 1
+
+    @contract
+    def get_vm_data(self):
+        """ Get a copy of the histories of the VMs.
+
+        :return: A map of VM UUIDs onto the corresponing CPU MHz values.
+         :rtype: dict(str : list(int))
+        """
+        return dict((uuid, list(values))
+                    for uuid, values in self.vms.items())
+
+    @contract
+    def get_host_data(self):
+        """ Get a copy of the history of the host.
+
+        :return: A history of the host CPU usage in MHz.
+         :rtype: list(int)
+        """
+        return list(self.host)
+
+
+@contract
+def start():
+    """ Start the local agent loop.
+
+    :return: The final state.
+     :rtype: dict(str: *)
+    """
+    config = read_and_validate_config([DEFAILT_CONFIG_PATH, CONFIG_PATH],
+                                      REQUIRED_FIELDS)
+
+    common.init_logging(
+        config['log_directory'],
+        'local-agent.log',
+        int(config['log_level']))
+    metrics.init_metrics(config, 'local_agent')
+    profiler.init_profiler(config, 'local-agent')
+
+    interval = config['data_collector_interval']
+    log.info('Starting the local agent, ' +
+             'iterations every %s seconds', interval)
+    return common.start(
+        init_state,
+        execute,
+        config,
+        int(interval),
+        phase=common.parse_phase(config['data_collector_phase']))
+
+
+@contract
+def init_state(config):
+    """ Initialize a dict for storing the state of the local agent.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :return: A dict containing the initial state of the local agent.
+     :rtype: dict
+    """
+    history = History(int(config['data_collector_data_length']))
+    # The event loop must be started before opening the connection
+    vm_cache.init_event_loop()
+    collector_state = collector.init_state(config)
+    collector_state['history'] = history
+    manager_state = manager.init_state(config,
+                                       collector_state['vir_connection'],
+                                       collector_state['db'])
+    manager_state['history'] = history
+    return {'collector': collector_state,
+            'manager': manager_state,
+            'iterations': 0,
+            'manager_period': get_manager_period(
+                int(config['data_collector_interval']),
+                int(config['local_manager_interval']))}
+
+
+@contract
+def get_manager_period(data_collector_interval, local_manager_interval):
+    """ Get the number of data collections per local manager iteration.
+
+    :param data_collector_interval: The data collector interval in seconds.
+     :type data_collector_interval: int,>=0
+
+    :param local_manager_interval: The local manager interval in seconds.
+     :type local_manager_interval: int,>=0
+
+    :return: The number of data collections per local manager iteration.
+     :rtype: int,>=1
+    """
+    if data_collector_interval == 0:
+        return 1
+    return max(int(round(float(local_manager_interval) /
+                         data_collector_interval)), 1)
+
+
+def execute(config, state):
+    """ Execute an iteration of the local agent.
+
+    A data collection iteration is executed, followed by an iteration
+    of the local manager every manager_period iterations.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :return: The updated state dictionary.
+     :rtype: dict(str: *)
+    """
+    state['collector'] = collector.execute(config, state['collector'])
+    state['iterations'] += 1
+    if state['iterations'] % state['manager_period'] == 0:
+        state['manager'] = manager.execute(config, state['manager'])
+    return state
@@ -71,9 +71,12 @@ invoked, the component performs the following steps:
    corresponding to the VMs that have been removed from the host.
 
 5. Fetch the latest data_collector_data_length data values from the
-   central database for each newly added VM using the database
-   connection information specified in the sql_connection option and
-   save the data in the <local_data_directory>/vm directory.
+   central database for all the newly added VMs in a single query
+   using the database connection information specified in the
+   sql_connection option and save the data in the
+   <local_data_directory>/vm directory. At the first data collection,
+   the data of the host are also fetched, so that the history of the
+   host is restored after a restart.
 
 6. Call the Libvirt API to obtain the CPU time for each VM active on
    the host.
@@ -95,13 +98,16 @@ from neat.contracts_primitive import *
 from neat.contracts_extra import *
 
 import os
-import time
 from collections import deque
 import libvirt
 
 import neat.common as common
 from neat.config import *
 from neat.db_utils import *
+import neat.locals.samples as samples
+import neat.metrics as metrics
+import neat.profiler as profiler
+from neat.scheduler import monotonic
 
 import logging
 log = logging.getLogger(__name__)
@@ -121,6 +127,8 @@ def start():
         config['log_directory'],
         'data-collector.log',
         int(config['log_level']))
+    metrics.init_metrics(config, 'data_collector')
+    profiler.init_profiler(config, 'data-collector')
 
     vm_path = common.build_local_vm_path(config['local_data_directory'])
     if not os.access(vm_path, os.F_OK):
@@ -138,7 +146,8 @@ def start():
         init_state,
         execute,
         config,
-        int(interval))
+        int(interval),
+        phase=common.parse_phase(config['data_collector_phase']))
 
 
 @contract
@@ -228,8 +237,26 @@ def execute(config, state):
     vm_path = common.build_local_vm_path(config['local_data_directory'])
     host_path = common.build_local_host_path(config['local_data_directory'])
     data_length = int(config['data_collector_data_length'])
-    vms_previous = get_previous_vms(vm_path)
-    vms_current = get_current_vms(state['vir_connection'])
+    history = state.get('history')
+    if history is None:
+        with metrics.phase('file'):
+            vms_previous = get_previous_vms(vm_path)
+    else:
+        vms_previous = history.get_vms()
+
+    if state['previous_time'] == 0:
+        # The local data have been cleaned up at the start, so the
+        # history of the host is restored from the central database
+        with metrics.phase('db'):
+            host_data = state['db'].select_cpu_mhz_for_host(
+                state['hostname'], data_length)
+        if history is None:
+            with metrics.phase('file'):
+                write_host_data_locally(host_path, host_data, data_length)
+        else:
+            history.write_host_data(host_data)
+    with metrics.phase('libvirt'):
+        vms_current = get_current_vms(state['vir_connection'])
 
     vms_added = get_added_vms(vms_previous, vms_current.keys())
     added_vm_data = dict()
@@ -244,55 +271,84 @@ def execute(config, state):
                 if log.isEnabledFor(logging.DEBUG):
                     log.debug('Added VM %s skipped as migrating in', vm)
 
-        added_vm_data = fetch_remote_data(state['db'],
-                                          data_length,
-                                          vms_added)
+        with metrics.phase('db'):
+            added_vm_data = fetch_remote_data(state['db'],
+                                              data_length,
+                                              vms_added)
         if log.isEnabledFor(logging.DEBUG):
             log.debug('Fetched remote data: %s', str(added_vm_data))
-        write_vm_data_locally(vm_path, added_vm_data, data_length)
+        if history is None:
+            with metrics.phase('file'):
+                write_vm_data_locally(vm_path, added_vm_data, data_length)
+        else:
+            history.write_vm_data(added_vm_data)
 
     vms_removed = get_removed_vms(vms_previous, vms_current.keys())
     if vms_removed:
         if log.isEnabledFor(logging.DEBUG):
             log.debug('Removed VMs: %s', str(vms_removed))
-        cleanup_local_vm_data(vm_path, vms_removed)
+        if history is None:
+            with metrics.phase('file'):
+                cleanup_local_vm_data(vm_path, vms_removed)
+        else:
+            history.cleanup_vm_data(vms_removed)
         for vm in vms_removed:
             del state['previous_cpu_time'][vm]
             del state['previous_cpu_mhz'][vm]
 
     log.info('Started VM data collection')
-    current_time = time.time()
-    (cpu_time, cpu_mhz) = get_cpu_mhz(state['vir_connection'],
-                                      state['physical_core_mhz'],
-                                      state['previous_cpu_time'],
-                                      state['previous_time'],
-                                      current_time,
-                                      vms_current.keys(),
-                                      state['previous_cpu_mhz'],
-                                      added_vm_data)
+    # The CPU time is measured over intervals of the monotonic clock,
+    # which is not affected by changes of the system time
+    current_time = monotonic()
+    with metrics.phase('libvirt'):
+        (cpu_time, cpu_mhz) = get_cpu_mhz(state['vir_connection'],
+                                          state['physical_core_mhz'],
+                                          state['previous_cpu_time'],
+                                          state['previous_time'],
+                                          current_time,
+                                          vms_current.keys(),
+                                          state['previous_cpu_mhz'],
+                                          added_vm_data)
     log.info('Completed VM data collection')
 
     log.info('Started host data collection')
-    (host_cpu_time_total,
-     host_cpu_time_busy,
-     host_cpu_mhz) = get_host_cpu_mhz(state['physical_cpu_mhz'],
-                                      state['previous_host_cpu_time_total'],
-                                      state['previous_host_cpu_time_busy'])
+    with metrics.phase('file'):
+        (host_cpu_time_total,
+         host_cpu_time_busy,
+         host_cpu_mhz) = get_host_cpu_mhz(
+            state['physical_cpu_mhz'],
+            state['previous_host_cpu_time_total'],
+            state['previous_host_cpu_time_busy'])
     log.info('Completed host data collection')
 
     if state['previous_time'] > 0:
-        append_vm_data_locally(vm_path, cpu_mhz, data_length)
-        append_vm_data_remotely(state['db'], cpu_mhz)
+        if history is None:
+            with metrics.phase('file'):
+                append_vm_data_locally(vm_path, cpu_mhz, data_length)
+        else:
+            history.append_vm_data(cpu_mhz)
+        with metrics.phase('db'):
+            append_vm_data_remotely(state['db'], cpu_mhz)
 
         total_vms_cpu_mhz = sum(cpu_mhz.values())
         host_cpu_mhz_hypervisor = host_cpu_mhz - total_vms_cpu_mhz
         if host_cpu_mhz_hypervisor < 0:
             host_cpu_mhz_hypervisor = 0
         total_cpu_mhz = total_vms_cpu_mhz + host_cpu_mhz_hypervisor
-        append_host_data_locally(host_path, host_cpu_mhz_hypervisor, data_length)
-        append_host_data_remotely(state['db'],
-                                  state['hostname'],
-                                  host_cpu_mhz_hypervisor)
+        if history is None:
+            with metrics.phase('file'):
+                append_host_data_locally(host_path, host_cpu_mhz_hypervisor,
+                                         data_length)
+                samples.increment_counter(samples.build_counter_path(
+                    config['local_data_directory']))
+            samples.notify(samples.build_socket_path(
+                config['local_data_directory']))
+        else:
+            history.append_host_data(host_cpu_mhz_hypervisor)
+        with metrics.phase('db'):
+            append_host_data_remotely(state['db'],
+                                      state['hostname'],
+                                      host_cpu_mhz_hypervisor)
 
         if log.isEnabledFor(logging.DEBUG):
             log.debug('Collected VM CPU MHz: %s', str(cpu_mhz))
@@ -301,13 +357,14 @@ def execute(config, state):
             log.debug('Collected host CPU MHz: %s', str(host_cpu_mhz))
             log.debug('Collected total CPU MHz: %s', str(total_cpu_mhz))
 
-        state['previous_overload'] = log_host_overload(
-            state['db'],
-            state['host_cpu_overload_threshold'],
-            state['hostname'],
-            state['previous_overload'],
-            state['physical_cpu_mhz'],
-            total_cpu_mhz)
+        with metrics.phase('db'):
+            state['previous_overload'] = log_host_overload(
+                state['db'],
+                state['host_cpu_overload_threshold'],
+                state['hostname'],
+                state['previous_overload'],
+                state['physical_cpu_mhz'],
+                total_cpu_mhz)
 
     state['previous_time'] = current_time
     state['previous_cpu_time'] = cpu_time
@@ -444,10 +501,7 @@ def fetch_remote_data(db, data_length, uuids):
     :return: A dictionary of VM UUIDs and the corresponding data.
      :rtype: dict(str : list(int))
     """
-    result = dict()
-    for uuid in uuids:
-        result[uuid] = db.select_cpu_mhz_for_vm(uuid, data_length)
-    return result
+    return db.select_cpu_mhz_for_vms(uuids, data_length)
 
 
 @contract
@@ -510,6 +564,25 @@ def append_vm_data_remotely(db, data):
     db.insert_vm_cpu_mhz(data)
 
 
+@contract
+def write_host_data_locally(path, data, data_length):
+    """ Write a set of CPU MHz values for the host.
+
+    :param path: A path to write the data to.
+     :type path: str
+
+    :param data: A CPU MHz history of the host.
+     :type data: list(int)
+
+    :param data_length: The maximum allowed length of the data.
+     :type data_length: int
+    """
+    with open(path, 'w') as f:
+        if data_length > 0 and data:
+            f.write('\n'.join([str(x)
+                               for x in data[-data_length:]]) + '\n')
+
+
 @contract
 def append_host_data_locally(path, cpu_mhz, data_length):
     """ Write a CPU MHz value for the host.
@@ -54,7 +54,9 @@ pre-defined interface to enable configuration-driven substitution of
 difference implementations. The configured algorithm is invoked by the
 local manager and accepts historical data on the resource usage by VMs
 running on the host as an input. An overload detection algorithm
-returns a decision of whether the host is overloaded.
+returns a decision of whether the host is overloaded. The interface
+of the underload and overload detection algorithms is described in
+`neat.locals.plugins`.
 
 If a host is overloaded, it is necessary to select VMs to migrate from
 the host to avoid performance degradation. This is done by a specified
@@ -98,19 +100,47 @@ local manager performs the following steps:
    the reason for migration as being 1.
 
 7. Schedule the next execution after local_manager_interval seconds.
+
+The requests are sent over a persistent HTTP session by a background
+sender described in `neat.locals.notifier`, so that an unavailable
+global manager does not delay the iterations. The sender retries the
+failed requests, and replaces an undelivered request once the host
+state changes. Depending on the global_manager_protocol option, a
+request is either form-encoded, or encoded in JSON or msgpack
+according to `neat.protocol`, in which case it also carries the recent
+CPU usage of the host and VMs, so that the global manager does not
+need to read it from the database.
+
+The maximum RAM of the VMs is looked up in libvirt only for the VMs
+that have appeared since the previous iteration, as described in
+`neat.locals.vm_cache`.
+
+If the local_manager_trigger option is set to sample, an iteration is
+performed as soon as the data collector has stored a new sample, as
+described in `neat.locals.samples`. In both modes, an iteration is
+skipped if no new sample has been stored since the previous one.
 """
 
 from contracts import contract
 from neat.contracts_primitive import *
 from neat.contracts_extra import *
 
+import libvirt
 import requests
 from hashlib import sha1
 import time
 
 import neat.common as common
+import neat.locals.notifier as notifier
+import neat.locals.plugins as plugins
+import neat.locals.samples as samples
+import neat.locals.snapshot as snapshot
+import neat.locals.vm_cache as vm_cache
+import neat.protocol as protocol
 from neat.config import *
 from neat.db_utils import *
+import neat.metrics as metrics
+import neat.profiler as profiler
 
 import logging
 log = logging.getLogger(__name__)
@@ -130,44 +160,100 @@ def start():
         config['log_directory'],
         'local-manager.log',
         int(config['log_level']))
+    metrics.init_metrics(config, 'local_manager')
+    profiler.init_profiler(config, 'local-manager')
 
     interval = config['local_manager_interval']
-    if log.isEnabledFor(logging.INFO):
+    wait = None
+    if config['local_manager_trigger'] == 'sample':
+        listener = samples.Listener(samples.build_socket_path(
+            config['local_data_directory']))
+        wait = lambda state, timeout: listener.wait(timeout)
+        if log.isEnabledFor(logging.INFO):
+            log.info('Starting the local manager, iterations on new ' +
+                     'samples or every %s seconds', interval)
+    elif log.isEnabledFor(logging.INFO):
         log.info('Starting the local manager, ' +
                  'iterations every %s seconds', interval)
     return common.start(
         init_state,
         execute,
         config,
-        int(interval))
+        int(interval),
+        phase=common.parse_phase(config['local_manager_phase']),
+        wait=wait)
 
 
 @contract
-def init_state(config):
+def init_state(config, vir_connection=None, db=None):
     """ Initialize a dict for storing the state of the local manager.
 
     :param config: A config dictionary.
      :type config: dict(str: *)
 
+    :param vir_connection: A libvirt connection to share, None to open one.
+     :type vir_connection: None|virConnect
+
+    :param db: A database object to share, None to connect.
+     :type db: None|Database
+
     :return: A dictionary containing the initial state of the local manager.
      :rtype: dict
     """
-    vir_connection = libvirt.openReadOnly(None)
     if vir_connection is None:
-        message = 'Failed to open a connection to the hypervisor'
-        log.critical(message)
-        raise OSError(message)
+        # The event loop must be started before opening the connection
+        vm_cache.init_event_loop()
+        vir_connection = libvirt.openReadOnly(None)
+        if vir_connection is None:
+            message = 'Failed to open a connection to the hypervisor'
+            log.critical(message)
+            raise OSError(message)
+    if db is None:
+        db = init_db(config['sql_connection'])
 
     physical_cpu_mhz_total = int(
         common.physical_cpu_mhz_total(vir_connection) *
         float(config['host_cpu_usable_by_vms']))
-    return {'previous_time': 0.,
-            'vir_connection': vir_connection,
-            'db': init_db(config['sql_connection']),
-            'physical_cpu_mhz_total': physical_cpu_mhz_total,
-            'hostname': vir_connection.getHostname(),
-            'hashed_username': sha1(config['os_admin_user']).hexdigest(),
-            'hashed_password': sha1(config['os_admin_password']).hexdigest()}
+    state = {'previous_time': 0.,
+             'sample_time': None,
+             'vir_connection': vir_connection,
+             'db': db,
+             'physical_cpu_mhz_total': physical_cpu_mhz_total,
+             'hostname': vir_connection.getHostname(),
+             'hashed_username': sha1(config['os_admin_user']).hexdigest(),
+             'hashed_password': sha1(config['os_admin_password']).hexdigest(),
+             'session': requests.Session(),
+             'vm_cache': vm_cache.VmCache(vir_connection)}
+    state['notifier'] = init_notifier(config, state)
+    state['notifier'].start()
+    return state
+
+
+@contract
+def init_notifier(config, state):
+    """ Create a background sender of the requests to the global manager.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :return: A notifier delivering the events to the global manager.
+     :rtype: *
+    """
+    def send(event):
+        with metrics.phase('notification'):
+            return notify_global_manager(
+                config, state, event['reason'], event['vm_uuids'],
+                event['host_cpu_mhz'], event['vm_cpu_mhz'])
+
+    return notifier.Notifier(
+        send,
+        notifier.build_outbox_path(config['local_data_directory']),
+        int(config['notification_retries']),
+        float(config['notification_backoff']),
+        int(config['local_manager_interval']))
 
 
 @contract
@@ -211,9 +297,26 @@ def execute(config, state):
      :rtype: dict(str: *)
     """
     log.info('Started an iteration')
-    vm_path = common.build_local_vm_path(config['local_data_directory'])
-    vm_cpu_mhz = get_local_vm_data(vm_path)
-    vm_ram = get_ram(state['vir_connection'], vm_cpu_mhz.keys())
+    history = state.get('history')
+    host_path = common.build_local_host_path(config['local_data_directory'])
+    if history is None:
+        sample_time = get_sample_time(host_path)
+    else:
+        sample_time = history.sample_time
+    if sample_time is not None and sample_time == state.get('sample_time'):
+        log.info('No new data since the previous iteration')
+        log.info('Skipped an iteration')
+        return state
+    state['sample_time'] = sample_time
+
+    if history is None:
+        vm_path = common.build_local_vm_path(config['local_data_directory'])
+        with metrics.phase('file'):
+            vm_cpu_mhz = get_local_vm_data(vm_path)
+    else:
+        vm_cpu_mhz = history.get_vm_data()
+    with metrics.phase('libvirt'):
+        vm_ram = state['vm_cache'].get_ram(vm_cpu_mhz.keys())
     vm_cpu_mhz = cleanup_vm_data(vm_cpu_mhz, vm_ram.keys())
 
     if not vm_cpu_mhz:
@@ -222,8 +325,11 @@ def execute(config, state):
         log.info('Skipped an iteration')
         return state
 
-    host_path = common.build_local_host_path(config['local_data_directory'])
-    host_cpu_mhz = get_local_host_data(host_path)
+    if history is None:
+        with metrics.phase('file'):
+            host_cpu_mhz = get_local_host_data(host_path)
+    else:
+        host_cpu_mhz = history.get_host_data()
 
     host_cpu_utilization = vm_mhz_to_percentage(
         vm_cpu_mhz.values(),
@@ -241,29 +347,32 @@ def execute(config, state):
         return state
 
     time_step = int(config['data_collector_interval'])
-    migration_time = common.calculate_migration_time(
-        vm_ram, float(config['network_migration_bandwidth']))
 
     if 'underload_detection' not in state:
+        migration_time = common.calculate_migration_time(
+            vm_ram, float(config['network_migration_bandwidth']))
         underload_detection_params = common.parse_parameters(
             config['algorithm_underload_detection_parameters'])
-        underload_detection = common.call_function_by_name(
+        underload_detection = plugins.load(
+            plugins.UNDERLOAD_DETECTION,
             config['algorithm_underload_detection_factory'],
-            [time_step,
-             migration_time,
-             underload_detection_params])
+            time_step,
+            migration_time,
+            underload_detection_params)
         state['underload_detection'] = underload_detection
         state['underload_detection_state'] = {}
 
         overload_detection_params = common.parse_parameters(
             config['algorithm_overload_detection_parameters'])
-        overload_detection = common.call_function_by_name(
+        overload_detection = plugins.load(
+            plugins.OVERLOAD_DETECTION,
             config['algorithm_overload_detection_factory'],
-            [time_step,
-             migration_time,
-             overload_detection_params])
+            time_step,
+            migration_time,
+            overload_detection_params)
         state['overload_detection'] = overload_detection
         state['overload_detection_state'] = {}
+        state['detection_samples'] = None
 
         vm_selection_params = common.parse_parameters(
             config['algorithm_vm_selection_parameters'])
@@ -274,41 +383,69 @@ def execute(config, state):
              vm_selection_params])
         state['vm_selection'] = vm_selection
         state['vm_selection_state'] = {}
+
+        max_age = int(config['detector_state_max_age'])
+        if max_age > 0:
+            state['snapshot_path'] = snapshot.build_snapshot_path(
+                config['local_data_directory'])
+            state['snapshot_parameters'] = snapshot.build_parameters(config)
+            states = snapshot.load(state['snapshot_path'],
+                                   state['snapshot_parameters'],
+                                   max_age)
+            if states is not None:
+                state.update(states)
+                underload_detection.restore(
+                    state['underload_detection_state'])
+                overload_detection.restore(
+                    state['overload_detection_state'])
     else:
         underload_detection = state['underload_detection']
         overload_detection = state['overload_detection']
         vm_selection = state['vm_selection']
 
+    if history is None:
+        sample_count = samples.read_counter(samples.build_counter_path(
+            config['local_data_directory']))
+    else:
+        sample_count = history.samples
+    new_samples = plugins.count_new_samples(state['detection_samples'],
+                                            sample_count,
+                                            len(host_cpu_utilization))
+    state['detection_samples'] = sample_count
+
     if log.isEnabledFor(logging.INFO):
         log.info('Started underload detection')
-    underload, state['underload_detection_state'] = underload_detection(
-        host_cpu_utilization, state['underload_detection_state'])
+    with metrics.phase('detection'):
+        underload = underload_detection.update(host_cpu_utilization,
+                                               new_samples)
+        state['underload_detection_state'] = underload_detection.snapshot()
     if log.isEnabledFor(logging.INFO):
         log.info('Completed underload detection')
 
     if log.isEnabledFor(logging.INFO):
         log.info('Started overload detection')
-    overload, state['overload_detection_state'] = overload_detection(
-        host_cpu_utilization, state['overload_detection_state'])
+    with metrics.phase('detection'):
+        overload = overload_detection.update(host_cpu_utilization,
+                                             new_samples)
+        state['overload_detection_state'] = overload_detection.snapshot()
     if log.isEnabledFor(logging.INFO):
         log.info('Completed overload detection')
 
+    if underload:
+        decision = 'underload'
+    elif overload:
+        decision = 'overload'
+    else:
+        decision = 'none'
+    metrics.inc('neat_decisions_total', {'host': state['hostname'],
+                                         'decision': decision})
+
     if underload:
         if log.isEnabledFor(logging.INFO):
             log.info('Underload detected')
-        try:
-            r = requests.put('http://' + config['global_manager_host'] +
-                             ':' + config['global_manager_port'],
-                             {'username': state['hashed_username'],
-                              'password': state['hashed_password'],
-                              'time': time.time(),
-                              'host': state['hostname'],
-                              'reason': 0})
-            if log.isEnabledFor(logging.INFO):
-                log.info('Received response: [%s] %s',
-                         r.status_code, r.content)
-        except requests.exceptions.ConnectionError:
-            log.exception('Exception at underload request:')
+        state['notifier'].submit(protocol.event(
+            state['hostname'], time.time(), 0, [],
+            host_cpu_mhz, vm_cpu_mhz))
 
     else:
         if overload:
@@ -316,29 +453,26 @@ def execute(config, state):
                 log.info('Overload detected')
 
             log.info('Started VM selection')
-            vm_uuids, state['vm_selection_state'] = vm_selection(
-                vm_cpu_mhz, vm_ram, state['vm_selection_state'])
+            with metrics.phase('selection'):
+                vm_uuids, state['vm_selection_state'] = vm_selection(
+                    vm_cpu_mhz, vm_ram, state['vm_selection_state'])
             log.info('Completed VM selection')
 
             if log.isEnabledFor(logging.INFO):
                 log.info('Selected VMs to migrate: %s', str(vm_uuids))
-            try:
-                r = requests.put('http://' + config['global_manager_host'] +
-                                 ':' + config['global_manager_port'],
-                                 {'username': state['hashed_username'],
-                                  'password': state['hashed_password'],
-                                  'time': time.time(),
-                                  'host': state['hostname'],
-                                  'reason': 1,
-                                  'vm_uuids': ','.join(vm_uuids)})
-                if log.isEnabledFor(logging.INFO):
-                    log.info('Received response: [%s] %s',
-                             r.status_code, r.content)
-            except requests.exceptions.ConnectionError:
-                log.exception('Exception at overload request:')
+            state['notifier'].submit(protocol.event(
+                state['hostname'], time.time(), 1, vm_uuids, host_cpu_mhz,
+                dict((vm, vm_cpu_mhz[vm]) for vm in vm_uuids)))
         else:
             if log.isEnabledFor(logging.INFO):
                 log.info('No underload or overload detected')
+            state['notifier'].cancel()
+
+    if 'snapshot_path' in state:
+        with metrics.phase('file'):
+            snapshot.save(state['snapshot_path'],
+                          state['snapshot_parameters'],
+                          state)
 
     if log.isEnabledFor(logging.INFO):
         log.info('Completed an iteration')
@@ -346,6 +480,77 @@ def execute(config, state):
     return state
 
 
+@contract
+def notify_global_manager(config, state, reason, vm_uuids,
+                          host_cpu_mhz, vm_cpu_mhz):
+    """ Send an underload or overload request to the global manager.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param state: A state dictionary.
+     :type state: dict(str: *)
+
+    :param reason: The reason of the request: 0 - underload, 1 - overload.
+     :type reason: int
+
+    :param vm_uuids: A list of VM UUIDs to migrate from the host.
+     :type vm_uuids: list(str)
+
+    :param host_cpu_mhz: A history of the CPU usage by the host in MHz.
+     :type host_cpu_mhz: list(int)
+
+    :param vm_cpu_mhz: A map of VM UUIDs to their CPU usage histories.
+     :type vm_cpu_mhz: dict(str: list(int))
+
+    :return: The response of the global manager.
+     :rtype: *
+    """
+    url = 'http://' + config['global_manager_host'] + \
+          ':' + config['global_manager_port']
+    format = config['global_manager_protocol']
+    timeout = float(config['global_manager_timeout'])
+    if format == 'form':
+        params = {'username': state['hashed_username'],
+                  'password': state['hashed_password'],
+                  'time': time.time(),
+                  'host': state['hostname'],
+                  'reason': reason}
+        if reason == 1:
+            params['vm_uuids'] = ','.join(vm_uuids)
+        return state['session'].put(url, params, timeout=timeout)
+    content_type = protocol.content_type(format)
+    message = protocol.message(
+        state['hashed_username'],
+        state['hashed_password'],
+        [protocol.event(state['hostname'], time.time(), reason,
+                        vm_uuids, host_cpu_mhz, vm_cpu_mhz)])
+    return state['session'].put(url + '/v1/events',
+                                protocol.encode(message, content_type),
+                                headers={'Content-Type': content_type},
+                                timeout=timeout)
+
+
+@contract
+def get_sample_time(path):
+    """ Get the time the latest sample has been stored locally.
+
+    The data collector appends a sample to the host data file at every
+    iteration, so the modification time of the file identifies the
+    latest sample.
+
+    :param path: A path to the host data file.
+     :type path: str
+
+    :return: The modification time of the file, or None if not found.
+     :rtype: None|float
+    """
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
 @contract
 def get_local_vm_data(path):
     """ Read the data about VMs from the local storage.
@@ -399,48 +604,6 @@ def cleanup_vm_data(vm_data, uuids):
     return vm_data
 
 
-@contract
-def get_ram(vir_connection, vms):
-    """ Get the maximum RAM for a set of VM UUIDs.
-
-    :param vir_connection: A libvirt connection object.
-     :type vir_connection: virConnect
-
-    :param vms: A list of VM UUIDs.
-     :type vms: list(str)
-
-    :return: The maximum RAM for the VM UUIDs.
-     :rtype: dict(str : long)
-    """
-    vms_ram = {}
-    for uuid in vms:
-        ram = get_max_ram(vir_connection, uuid)
-        if ram:
-            vms_ram[uuid] = ram
-
-    return vms_ram
-
-
-@contract
-def get_max_ram(vir_connection, uuid):
-    """ Get the max RAM allocated to a VM UUID using libvirt.
-
-    :param vir_connection: A libvirt connection object.
-     :type vir_connection: virConnect
-
-    :param uuid: The UUID of a VM.
-     :type uuid: str[36]
-
-    :return: The maximum RAM of the VM in MB.
-     :rtype: long|None
-    """
-    try:
-        domain = vir_connection.lookupByUUIDString(uuid)
-        return domain.maxMemory() / 1024
-    except libvirt.libvirtError:
-        return None
-
-
 @contract
 def vm_mhz_to_percentage(vm_mhz_history, host_mhz_history, physical_cpu_mhz):
     """ Convert VM CPU utilization to the host's CPU utilization.
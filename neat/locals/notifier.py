@@ -0,0 +1,311 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Asynchronous delivery of the events of the local manager.
+
+The local manager does not wait for the global manager to receive its
+underload and overload events. An event is submitted to a Notifier,
+which delivers it to the global manager from a background thread,
+while the local manager continues its iterations.
+
+At most one event of the host is pending at a time: if the host state
+changes before the pending event has been delivered, the stale event
+is replaced by the new one, or cancelled if the host is neither
+underloaded nor overloaded anymore. An event is also discarded once it
+is older than the local_manager_interval, as a newer decision has
+been made by then.
+
+A failed delivery due to a connection error, timeout, or a server
+error is retried up to the notification_retries option times, waiting
+for notification_backoff seconds before the first retry and twice as
+long before each next one. A new event interrupts the waiting.
+
+The pending event is stored in <local_data_directory>/outbox, so that
+it is delivered after a restart of the local manager.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+import os
+import threading
+import time
+
+import requests
+
+import neat.metrics as metrics
+import neat.protocol as protocol
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# The outbox is encoded in the same way as the requests
+CONTENT_TYPE = protocol.CONTENT_TYPES['json']
+
+DELIVERED = 'delivered'
+RETRY = 'retry'
+REJECTED = 'rejected'
+
+
+@contract
+def build_outbox_path(local_data_directory):
+    """ Build the path to the outbox of the events.
+
+    :param local_data_directory: The base local data path.
+     :type local_data_directory: str
+
+    :return: The path to the outbox.
+     :rtype: str
+    """
+    return os.path.join(local_data_directory, 'outbox')
+
+
+class Notifier(object):
+    """ A background sender of the events of the host.
+    """
+
+    @contract(path='None|str',
+              retries='int,>=0',
+              backoff='number,>=0',
+              max_age='number,>=0')
+    def __init__(self, send, path, retries, backoff, max_age,
+                 clock=time.time):
+        """ Initialize the notifier and load the event from the outbox.
+
+        :param send: A function sending an event and returning the response.
+        :param path: The path to the outbox, None to keep it in memory.
+        :param retries: The maximum number of retries of a delivery.
+        :param backoff: The delay before the first retry in seconds.
+        :param max_age: The maximum age of an event in seconds, 0 for none.
+        :param clock: A function returning the system time.
+        """
+        self.send = send
+        self.path = path
+        self.retries = retries
+        self.backoff = backoff
+        self.max_age = max_age
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.event = None
+        self.attempts = 0
+        self.thread = None
+        self.load()
+
+    def start(self):
+        """ Start delivering the events in a daemon thread.
+        """
+        self.thread = threading.Thread(target=self.run,
+                                       name='neat-notifier')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        """ Deliver the events until the process exits.
+        """
+        while True:
+            try:
+                self.process()
+            except Exception:
+                log.exception('Exception at delivering an event:')
+
+    @contract
+    def submit(self, event):
+        """ Submit an event replacing the pending one.
+
+        :param event: An event created by `neat.protocol.event`.
+         :type event: dict(str: *)
+        """
+        with self.condition:
+            if self.event is not None:
+                log.info('Replaced a stale undelivered event')
+                metrics.inc('neat_notifications_total',
+                            {'result': 'replaced'})
+            self.event = event
+            self.attempts = 0
+            self.save()
+            self.condition.notify()
+
+    def cancel(self):
+        """ Cancel the pending event, if any.
+        """
+        with self.condition:
+            if self.event is not None:
+                log.info('Cancelled a stale undelivered event')
+                metrics.inc('neat_notifications_total',
+                            {'result': 'cancelled'})
+                self.event = None
+                self.save()
+                self.condition.notify()
+
+    @contract
+    def pending(self):
+        """ Get the pending event.
+
+        :return: The pending event, or None.
+         :rtype: None|dict(str: *)
+        """
+        with self.condition:
+            return self.event
+
+    def process(self):
+        """ Wait for a pending event and make an attempt to deliver it.
+        """
+        with self.condition:
+            while self.event is None:
+                self.condition.wait()
+            event = self.event
+            if self.expired(event):
+                self.discard('The event has expired')
+                return
+
+        result = self.deliver(event)
+
+        with self.condition:
+            if self.event is not event:
+                # Replaced or cancelled during the delivery
+                return
+            if result == DELIVERED:
+                metrics.inc('neat_notifications_total',
+                            {'result': 'delivered'})
+                self.event = None
+                self.save()
+            elif result == REJECTED:
+                self.discard('The event has been rejected')
+            elif self.attempts >= self.retries:
+                self.discard('The delivery has failed %d times' %
+                             (self.attempts + 1))
+            else:
+                self.attempts += 1
+                metrics.inc('neat_notifications_total', {'result': 'retry'})
+                self.condition.wait(
+                    self.backoff * 2 ** (self.attempts - 1))
+
+    @contract
+    def deliver(self, event):
+        """ Make an attempt to deliver an event.
+
+        :param event: An event created by `neat.protocol.event`.
+         :type event: dict(str: *)
+
+        :return: The result: delivered, retry, or rejected.
+         :rtype: str
+        """
+        try:
+            response = self.send(event)
+        except requests.exceptions.RequestException as e:
+            log.warning('Could not deliver an event: %s', str(e))
+            return RETRY
+        if log.isEnabledFor(logging.INFO):
+            log.info('Received response: [%s] %s',
+                     response.status_code, response.content)
+        status = event_status(response)
+        if 200 <= status < 300:
+            return DELIVERED
+        # The global manager rejects the requests sent more than 5
+        # seconds ago, so a resent event is stamped with the current time
+        if status == 412 or status >= 500:
+            return RETRY
+        return REJECTED
+
+    @contract
+    def expired(self, event):
+        """ Check whether an event is too old to be delivered.
+
+        :param event: An event created by `neat.protocol.event`.
+         :type event: dict(str: *)
+
+        :return: Whether the event has expired.
+         :rtype: bool
+        """
+        return self.max_age > 0 and \
+            event['time'] + self.max_age < self.clock()
+
+    def discard(self, reason):
+        """ Discard the pending event, must be called holding the lock.
+
+        :param reason: The reason to log.
+        """
+        log.error('%s, discarded the event', reason)
+        metrics.inc('neat_notifications_total', {'result': 'discarded'})
+        self.event = None
+        self.save()
+
+    def save(self):
+        """ Write the pending event to the outbox, or remove the outbox.
+        """
+        if self.path is None:
+            return
+        try:
+            if self.event is None:
+                if os.access(self.path, os.F_OK):
+                    os.remove(self.path)
+                return
+            with open(self.path + '.tmp', 'w') as f:
+                f.write(protocol.encode(self.event, CONTENT_TYPE))
+            os.rename(self.path + '.tmp', self.path)
+        except (IOError, OSError) as e:
+            log.warning('Could not write the outbox %s: %s',
+                        self.path, str(e))
+
+    def load(self):
+        """ Read the pending event from the outbox, unless it has expired.
+        """
+        if self.path is None or not os.access(self.path, os.F_OK):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                event = protocol.decode(f.read(), CONTENT_TYPE)
+        except (IOError, OSError, ValueError) as e:
+            log.warning('Could not read the outbox %s: %s',
+                        self.path, str(e))
+            return
+        if self.expired(event):
+            log.info('Discarded an expired event from the outbox')
+            os.remove(self.path)
+            return
+        log.info('Loaded an undelivered event from the outbox')
+        self.event = event
+
+
+@contract
+def event_status(response):
+    """ Get the status of an event from the response of the global manager.
+
+    A batch of events is answered with the result of each event, see
+    `neat.protocol`, so an event rejected within an accepted batch is
+    reported by the error of the event rather than the response status.
+
+    :param response: A response to a request carrying a single event.
+     :type response: *
+
+    :return: The status code of the event.
+     :rtype: int
+    """
+    status = response.status_code
+    content_type = response.headers.get('Content-Type', '').split(';')[0]
+    if not 200 <= status < 300 or \
+       content_type not in protocol.supported_content_types():
+        return status
+    try:
+        message = protocol.decode(response.content, content_type)
+    except ValueError:
+        log.warning('Could not decode the response: %s', response.content)
+        return status
+    results = message.get('jobs')
+    if isinstance(results, list) and len(results) == 1 and \
+       isinstance(results[0], dict) and \
+       isinstance(results[0].get('error'), int):
+        return results[0]['error']
+    return status
@@ -19,6 +19,8 @@ from contracts import contract
 from neat.contracts_primitive import *
 from neat.contracts_extra import *
 
+from neat.locals.plugins import Detector
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -104,3 +106,72 @@ def otf(otf, threshold, limit, migration_time, utilization, state):
             (migration_time + state['total']) >= otf
 
     return (decision, state)
+
+
+class Otf(Detector):
+    """ The OTF algorithm updated in constant time per sample.
+
+    The number of all and overloaded samples is counted as they are
+    observed. The decisions are the same as of the otf function called
+    once per sample with the whole history observed so far. The limit
+    applies to the number of observed samples, whereas otf applies it
+    to the length of the history passed to it, which the local manager
+    bounds by data_collector_data_length: unlike otf, the algorithm can
+    decide that a host is overloaded if the limit exceeds that length.
+    The parameters are otf, threshold, and limit.
+    """
+
+    def __init__(self, time_step, migration_time, params):
+        """ Initialize the algorithm.
+
+        :param time_step: The length of the simulation time step in seconds.
+        :param migration_time: The VM migration time in time seconds.
+        :param params: A dictionary containing the algorithm's parameters.
+        """
+        super(Otf, self).__init__(time_step, migration_time, params)
+        self.otf = params['otf']
+        self.threshold = params['threshold']
+        self.limit = params['limit']
+        self.migration_time_normalized = float(migration_time) / time_step
+        self.state = {'overload': 0,
+                      'total': 0,
+                      'last': None}
+
+    @contract(sample='number')
+    def observe(self, sample):
+        """ Count a sample.
+
+        :param sample: The CPU utilization of the host.
+        """
+        self.state['total'] += 1
+        if sample >= self.threshold:
+            self.state['overload'] += 1
+        self.state['last'] = sample
+
+    @contract
+    def decide(self):
+        """ Compare the OTF value including the migration time with otf.
+
+        :return: A decision of whether the host is overloaded.
+         :rtype: bool
+        """
+        last = self.state['last']
+        if last is None or last < self.threshold or \
+                self.state['total'] < self.limit:
+            return False
+        return (self.migration_time_normalized + self.state['overload']) / \
+            (self.migration_time_normalized + self.state['total']) >= self.otf
+
+    def snapshot(self):
+        """ Export the counters of the samples.
+
+        :return: A dictionary containing the counters.
+        """
+        return dict(self.state)
+
+    def restore(self, state):
+        """ Import the counters of the samples.
+
+        :param state: A dictionary containing the counters.
+        """
+        self.state.update(state)
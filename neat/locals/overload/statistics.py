@@ -20,7 +20,6 @@ from neat.contracts_primitive import *
 from neat.contracts_extra import *
 
 from numpy import median
-from scipy.optimize import leastsq
 import numpy as np
 
 import logging
@@ -321,6 +320,9 @@ def loess_parameter_estimates(data):
     :return: The parameter estimates.
      :rtype: list(float)
     """
+    # SciPy is only loaded when a Loess detector is used
+    from scipy.optimize import leastsq
+
     def f(p, x, y, weights):
         return weights * (y - (p[0] + p[1] * x))
 
@@ -343,6 +345,8 @@ def loess_robust_parameter_estimates(data):
     :return: The parameter estimates.
      :rtype: list(float)
     """
+    from scipy.optimize import leastsq
+
     def f(p, x, y, weights):
         return weights * (y - (p[0] + p[1] * x))
 
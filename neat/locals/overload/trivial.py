@@ -19,6 +19,10 @@ from contracts import contract
 from neat.contracts_primitive import *
 from neat.contracts_extra import *
 
+from collections import deque
+
+from neat.locals.plugins import Detector
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -124,3 +128,58 @@ def last_n_average_threshold(threshold, n, utilization):
         utilization = utilization[-n:]
         return sum(utilization) / len(utilization) > threshold
     return False
+
+
+class LastNAverageThreshold(Detector):
+    """ The averaging threshold algorithm keeping only the last n samples.
+
+    The cost of a step does not depend on the length of the history,
+    and the decisions are the same as of last_n_average_threshold
+    applied to the observed samples. The parameters are the threshold
+    and n.
+    """
+
+    def __init__(self, time_step, migration_time, params):
+        """ Initialize the algorithm.
+
+        :param time_step: The length of the simulation time step in seconds.
+        :param migration_time: The VM migration time in time seconds.
+        :param params: A dictionary containing the algorithm's parameters.
+        """
+        super(LastNAverageThreshold, self).__init__(
+            time_step, migration_time, params)
+        self.threshold = params['threshold']
+        self.window = deque(maxlen=params['n'])
+
+    @contract(sample='number')
+    def observe(self, sample):
+        """ Add a sample to the window of the last n samples.
+
+        :param sample: The CPU utilization of the host.
+        """
+        self.window.append(sample)
+
+    @contract
+    def decide(self):
+        """ Compare the average of the last n samples with the threshold.
+
+        :return: A decision of whether the host is overloaded.
+         :rtype: bool
+        """
+        if self.window:
+            return sum(self.window) / len(self.window) > self.threshold
+        return False
+
+    def snapshot(self):
+        """ Export the window of the last n samples.
+
+        :return: A dictionary containing the window.
+        """
+        return {'window': list(self.window)}
+
+    def restore(self, state):
+        """ Import the window of the last n samples.
+
+        :param state: A dictionary containing the window.
+        """
+        self.window = deque(state.get('window', []), self.window.maxlen)
@@ -0,0 +1,285 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" The plugin interface of the underload and overload detection algorithms.
+
+An algorithm is a class derived from Detector, which is instantiated
+with the same arguments as the factories: the time step, migration
+time, and a dictionary of parameters. Instead of processing the whole
+utilization history at every iteration, the local manager passes each
+new CPU utilization sample to the observe() method, and then calls the
+decide() method to obtain the decision. The state of the algorithm is
+exported by snapshot() and imported by restore() to survive restarts
+of the local manager, see `neat.locals.snapshot`. The optional
+evaluate() method processes a whole utilization history at once, e.g.,
+to replay a recorded history offline.
+
+The algorithms are configured by the algorithm_underload_detection_factory
+and algorithm_overload_detection_factory options, which accept either a
+name registered in the neat.underload_detection or
+neat.overload_detection entry point group of a Python package, or a
+fully qualified name of a class or a factory function. The algorithms
+returned by the factory functions are wrapped in a FactoryAdapter,
+which passes the whole utilization history to the algorithm at every
+iteration as before.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+from neat.contracts_extra import *
+
+import abc
+from collections import deque
+
+import neat.common as common
+
+import logging
+log = logging.getLogger(__name__)
+
+
+UNDERLOAD_DETECTION = 'neat.underload_detection'
+OVERLOAD_DETECTION = 'neat.overload_detection'
+
+
+class Detector(object):
+    """ The base class of the underload and overload detection algorithms.
+
+    The derived classes must override observe() and decide().
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    @contract(time_step='int,>=0',
+              migration_time='float,>=0',
+              params='dict(str: *)')
+    def __init__(self, time_step, migration_time, params):
+        """ Initialize the algorithm.
+
+        :param time_step: The length of the simulation time step in seconds.
+        :param migration_time: The VM migration time in time seconds.
+        :param params: A dictionary containing the algorithm's parameters.
+        """
+        self.time_step = time_step
+        self.migration_time = migration_time
+        self.params = params
+
+    @abc.abstractmethod
+    def observe(self, sample):
+        """ Process a new CPU utilization sample of the host.
+
+        :param sample: The CPU utilization of the host.
+        """
+        pass
+
+    @abc.abstractmethod
+    def decide(self):
+        """ Make a decision based on the samples observed so far.
+
+        :return: Whether the host is underloaded or overloaded.
+        """
+        pass
+
+    def snapshot(self):
+        """ Export the state of the algorithm.
+
+        :return: A picklable state of the algorithm.
+        """
+        return {}
+
+    def restore(self, state):
+        """ Import a state exported by snapshot().
+
+        :param state: A state of the algorithm.
+        """
+        pass
+
+    @contract
+    def evaluate(self, utilization):
+        """ Process a utilization history and decide at every step.
+
+        :param utilization: The history of the host's CPU utilization.
+         :type utilization: list(float)
+
+        :return: The decisions after each sample.
+         :rtype: list(bool)
+        """
+        decisions = []
+        for sample in utilization:
+            self.observe(sample)
+            decisions.append(self.decide())
+        return decisions
+
+    @contract
+    def update(self, utilization, samples):
+        """ Process the new samples at an iteration of the local manager.
+
+        :param utilization: The history of the host's CPU utilization.
+         :type utilization: list(float)
+
+        :param samples: The number of new samples at the end of the history.
+         :type samples: int,>=0
+
+        :return: The decision of the algorithm.
+         :rtype: bool
+        """
+        for sample in utilization[len(utilization) - samples:]:
+            self.observe(sample)
+        return self.decide()
+
+
+class FactoryAdapter(Detector):
+    """ An adapter of the algorithms created by the factory functions.
+
+    The algorithms returned by the factories accept the whole
+    utilization history and a state dictionary, and return a decision
+    and the updated state.
+    """
+
+    @contract(function='function', length='None|int,>=0')
+    def __init__(self, function, length=None):
+        """ Wrap an algorithm created by a factory.
+
+        :param function: The algorithm returned by a factory.
+        :param length: The maximum length of the history, None for unlimited.
+        """
+        self.function = function
+        self.utilization = deque(maxlen=length)
+        self.state = {}
+
+    def observe(self, sample):
+        """ Append a new CPU utilization sample to the history.
+
+        :param sample: The CPU utilization of the host.
+        """
+        self.utilization.append(sample)
+
+    def decide(self):
+        """ Call the algorithm with the history.
+
+        :return: The decision of the algorithm.
+        """
+        decision, self.state = self.function(list(self.utilization),
+                                             self.state)
+        return decision
+
+    def snapshot(self):
+        """ Export the state dictionary of the algorithm.
+
+        :return: The state dictionary.
+        """
+        return self.state
+
+    def restore(self, state):
+        """ Import the state dictionary of the algorithm.
+
+        :param state: The state dictionary.
+        """
+        self.state = state
+
+    @contract
+    def update(self, utilization, samples):
+        """ Call the algorithm with the whole history.
+
+        The history is recalculated by the local manager at every
+        iteration from the data of the VMs currently running on the
+        host, so it replaces the observed samples.
+
+        :param utilization: The history of the host's CPU utilization.
+         :type utilization: list(float)
+
+        :param samples: The number of new samples at the end of the history.
+         :type samples: int,>=0
+
+        :return: The decision of the algorithm.
+         :rtype: bool
+        """
+        self.utilization = deque(utilization, self.utilization.maxlen)
+        return self.decide()
+
+
+@contract
+def find_algorithm(group, name):
+    """ Find a class or factory of an algorithm by a name.
+
+    :param group: The entry point group of the algorithm.
+     :type group: str
+
+    :param name: A registered or a fully qualified name.
+     :type name: str
+
+    :return: The class or factory function.
+     :rtype: *
+    """
+    if '.' in name:
+        return common.get_object_by_name(name)
+    import pkg_resources
+    for entry_point in pkg_resources.iter_entry_points(group, name):
+        return entry_point.load()
+    raise ValueError('Unknown algorithm ' + name + ' in ' + group)
+
+
+@contract
+def load(group, name, time_step, migration_time, params):
+    """ Create an algorithm specified by a name.
+
+    :param group: The entry point group of the algorithm.
+     :type group: str
+
+    :param name: A registered or a fully qualified name.
+     :type name: str
+
+    :param time_step: The length of the simulation time step in seconds.
+     :type time_step: int,>=0
+
+    :param migration_time: The VM migration time in time seconds.
+     :type migration_time: float,>=0
+
+    :param params: A dictionary containing the algorithm's parameters.
+     :type params: dict(str: *)
+
+    :return: The algorithm.
+     :rtype: *
+    """
+    algorithm = find_algorithm(group, name)
+    if isinstance(algorithm, type):
+        return algorithm(time_step, migration_time, params)
+    return FactoryAdapter(algorithm(time_step, migration_time, params))
+
+
+@contract
+def count_new_samples(previous_count, current_count, length):
+    """ Get the number of samples stored since the last decision.
+
+    The samples are counted by the data collector, see
+    `neat.locals.samples`, so the count does not depend on the timing
+    of the iterations of the local manager.
+
+    :param previous_count: The count at the last decision, None if none.
+     :type previous_count: None|int,>=0
+
+    :param current_count: The current count of the stored samples.
+     :type current_count: int,>=0
+
+    :param length: The length of the utilization history.
+     :type length: int,>=1
+
+    :return: The number of new samples at the end of the history.
+     :rtype: int,>=0
+    """
+    if previous_count is None:
+        return length
+    if current_count < previous_count:
+        # The count has been reset, e.g., by a restart of the local agent
+        return min(current_count, length)
+    return min(current_count - previous_count, length)
@@ -0,0 +1,194 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Notifications of the new samples stored by the data collector.
+
+Once the data collector has stored a new sample of the CPU usage in
+the local data directory, it sends a datagram to the Unix socket
+<local_data_directory>/samples.sock. If the `local_manager_trigger`
+option is set to sample, the local manager listens to the socket and
+performs an iteration as soon as a notification arrives, instead of
+waiting for its next scheduled iteration. If no notification arrives
+within the local manager interval, an iteration is performed anyway.
+
+Sending a notification never blocks the data collector: if the local
+manager is not listening, the notification is dropped.
+
+The data collector also counts the stored samples in
+<local_data_directory>/host-samples, which allows the local manager to
+pass exactly the samples stored since its previous iteration to the
+detection algorithms, regardless of the timing of the iterations.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+import errno
+import os
+import select
+import socket
+
+from neat.scheduler import monotonic
+
+import logging
+log = logging.getLogger(__name__)
+
+
+MESSAGE = 'sample'
+
+
+@contract
+def build_socket_path(local_data_directory):
+    """ Build the path to the socket of the sample notifications.
+
+    :param local_data_directory: The base local data path.
+     :type local_data_directory: str
+
+    :return: The path to the socket.
+     :rtype: str
+    """
+    return os.path.join(local_data_directory, 'samples.sock')
+
+
+@contract
+def notify(path):
+    """ Notify the local manager that a new sample has been stored.
+
+    :param path: The path to the socket of the notifications.
+     :type path: str
+
+    :return: Whether the notification has been sent.
+     :rtype: bool
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.setblocking(0)
+        sock.sendto(MESSAGE, path)
+        return True
+    except socket.error as e:
+        # Nobody is listening, or the listener has not read the
+        # previous notifications, which already cover this sample
+        if e.errno not in (errno.ENOENT, errno.ECONNREFUSED,
+                           errno.EAGAIN, errno.ENOBUFS):
+            log.warning('Could not send a sample notification: %s', str(e))
+        return False
+    finally:
+        sock.close()
+
+
+@contract
+def build_counter_path(local_data_directory):
+    """ Build the path to the count of the stored samples.
+
+    :param local_data_directory: The base local data path.
+     :type local_data_directory: str
+
+    :return: The path to the count of the samples.
+     :rtype: str
+    """
+    return os.path.join(local_data_directory, 'host-samples')
+
+
+@contract
+def read_counter(path):
+    """ Read the count of the stored samples.
+
+    :param path: The path to the count of the samples.
+     :type path: str
+
+    :return: The count of the samples, 0 if not found.
+     :rtype: int,>=0
+    """
+    try:
+        with open(path, 'r') as f:
+            return max(int(f.read().strip()), 0)
+    except (IOError, ValueError):
+        return 0
+
+
+@contract
+def increment_counter(path):
+    """ Increment the count of the stored samples.
+
+    :param path: The path to the count of the samples.
+     :type path: str
+
+    :return: The updated count of the samples.
+     :rtype: int,>=1
+    """
+    count = read_counter(path) + 1
+    with open(path + '.tmp', 'w') as f:
+        f.write(str(count) + '\n')
+    os.rename(path + '.tmp', path)
+    return count
+
+
+class Listener(object):
+    """ A receiver of the sample notifications.
+    """
+
+    @contract(path='str')
+    def __init__(self, path):
+        """ Bind the socket of the notifications.
+
+        :param path: The path to the socket of the notifications.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.access(directory, os.F_OK):
+            os.makedirs(directory)
+        if os.access(path, os.F_OK):
+            os.remove(path)
+        self.path = path
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(path)
+        self.socket.setblocking(0)
+
+    @contract
+    def wait(self, timeout):
+        """ Wait for a notification of a new sample.
+
+        All the pending notifications are consumed at once.
+
+        :param timeout: The maximum time to wait in seconds.
+         :type timeout: number,>=0
+
+        :return: Whether a notification has arrived.
+         :rtype: bool
+        """
+        deadline = monotonic() + timeout
+        while True:
+            try:
+                ready = select.select([self.socket], [], [], timeout)[0]
+                break
+            except select.error as e:
+                # Interrupted by a signal, e.g., to start profiling
+                if e.args[0] != errno.EINTR:
+                    raise
+                timeout = max(deadline - monotonic(), 0)
+        if not ready:
+            return False
+        try:
+            while True:
+                self.socket.recv(len(MESSAGE))
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        return True
+
+    def close(self):
+        """ Close and remove the socket.
+        """
+        self.socket.close()
+        if os.access(self.path, os.F_OK):
+            os.remove(self.path)
@@ -0,0 +1,162 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Snapshots of the state of the local algorithms.
+
+The underload detection, overload detection, and VM selection
+algorithms keep their state across the iterations of the local
+manager, e.g., the MHOD algorithm counts the time spent in the states
+and the OTF algorithm counts the overload steps. To avoid learning the
+state from scratch after a restart of the local manager, the state is
+saved after every iteration to <local_data_directory>/detector-state
+as a zlib-compressed pickle, and restored at the first iteration.
+
+A snapshot is restored only if it has been written by the same
+version of the snapshot format and of Neat, using the same algorithms
+and parameters, and it is not older than the detector_state_max_age
+option in seconds. Setting the option to 0 disables the snapshots.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+import cPickle as pickle
+import os
+import time
+import zlib
+
+import neat
+
+import logging
+log = logging.getLogger(__name__)
+
+
+VERSION = 2
+
+# The keys of the state of the local manager saved in the snapshots
+STATE_KEYS = ['underload_detection_state',
+              'overload_detection_state',
+              'vm_selection_state',
+              'detection_samples']
+
+# The options that need to be the same to restore a snapshot
+PARAMETER_KEYS = ['data_collector_interval',
+                  'algorithm_underload_detection_factory',
+                  'algorithm_underload_detection_parameters',
+                  'algorithm_overload_detection_factory',
+                  'algorithm_overload_detection_parameters',
+                  'algorithm_vm_selection_factory',
+                  'algorithm_vm_selection_parameters']
+
+
+@contract
+def build_snapshot_path(local_data_directory):
+    """ Build the path to the snapshot of the state of the algorithms.
+
+    :param local_data_directory: The base local data path.
+     :type local_data_directory: str
+
+    :return: The path to the snapshot.
+     :rtype: str
+    """
+    return os.path.join(local_data_directory, 'detector-state')
+
+
+@contract
+def build_parameters(config):
+    """ Extract the options determining the meaning of the state.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :return: A map of the option names to their values.
+     :rtype: dict(str: *)
+    """
+    return dict((key, config[key]) for key in PARAMETER_KEYS)
+
+
+@contract
+def save(path, parameters, state):
+    """ Write a snapshot of the state of the algorithms.
+
+    The file is replaced atomically, so that it is never read partially.
+
+    :param path: The path to the snapshot.
+     :type path: str
+
+    :param parameters: The options determining the meaning of the state.
+     :type parameters: dict(str: *)
+
+    :param state: The state dictionary of the local manager.
+     :type state: dict(str: *)
+
+    :return: Whether the snapshot has been written.
+     :rtype: bool
+    """
+    snapshot = {'version': VERSION,
+                'neat_version': neat.__version__,
+                'time': time.time(),
+                'parameters': parameters,
+                'states': dict((key, state[key]) for key in STATE_KEYS)}
+    try:
+        data = zlib.compress(pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL))
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.rename(path + '.tmp', path)
+        return True
+    except (IOError, OSError, pickle.PicklingError) as e:
+        log.warning('Could not write the state snapshot to %s: %s',
+                    path, str(e))
+        return False
+
+
+@contract
+def load(path, parameters, max_age):
+    """ Read a snapshot of the state of the algorithms, if it is valid.
+
+    :param path: The path to the snapshot.
+     :type path: str
+
+    :param parameters: The options determining the meaning of the state.
+     :type parameters: dict(str: *)
+
+    :param max_age: The maximum age of the snapshot in seconds.
+     :type max_age: number,>=0
+
+    :return: A map of the state keys to the states, or None.
+     :rtype: None|dict(str: *)
+    """
+    if not os.access(path, os.F_OK):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.loads(zlib.decompress(f.read()))
+    except Exception as e:
+        log.warning('Could not read the state snapshot from %s: %s',
+                    path, str(e))
+        return None
+    if not isinstance(snapshot, dict) or \
+            snapshot.get('version') != VERSION or \
+            snapshot.get('neat_version') != neat.__version__:
+        log.info('Discarded the state snapshot of another version')
+        return None
+    if snapshot['parameters'] != parameters:
+        log.info('Discarded the state snapshot of other parameters')
+        return None
+    age = time.time() - snapshot['time']
+    if age < 0 or age > max_age:
+        log.info('Discarded the state snapshot %d seconds old', age)
+        return None
+    log.info('Restored the state snapshot %d seconds old', age)
+    return snapshot['states']
@@ -0,0 +1,196 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" A cache of the metadata of the VMs used by the local manager.
+
+The maximum RAM of the VMs is required at every iteration of the local
+manager to determine the VMs running on the host and to calculate the
+VM migration time. Instead of looking up every VM in libvirt at every
+iteration, the local manager keeps the RAM of the VMs in a VmCache
+keyed by the VM UUID and the libvirt domain ID, so that libvirt is
+only queried for the VMs that have appeared since the previous
+iteration. An entry is invalidated when:
+
+- the VM is not running on the host anymore;
+
+- a libvirt lifecycle event of the VM is received, e.g., the VM has
+  been stopped, restarted, or migrated;
+
+- if the lifecycle events are not available, the domain ID of the VM
+  has changed, which happens when a domain is restarted or recreated.
+  In this case, the domain IDs are obtained by a single listDomainsID()
+  call per iteration.
+
+The lifecycle events require the libvirt event loop to be started by
+init_event_loop() before opening the libvirt connection.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+from neat.contracts_extra import *
+
+import libvirt
+import threading
+
+import neat.metrics as metrics
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# The thread running the libvirt event loop, None if not started
+event_loop = None
+
+
+@contract
+def init_event_loop():
+    """ Start the default libvirt event loop in a daemon thread.
+
+    :return: Whether the event loop is running.
+     :rtype: bool
+    """
+    global event_loop
+    if event_loop is not None:
+        return True
+    try:
+        libvirt.virEventRegisterDefaultImpl()
+    except (AttributeError, libvirt.libvirtError) as e:
+        log.warning('Could not start the libvirt event loop: %s', str(e))
+        return False
+
+    def run():
+        while True:
+            try:
+                libvirt.virEventRunDefaultImpl()
+            except libvirt.libvirtError:
+                log.exception('Exception in the libvirt event loop:')
+
+    event_loop = threading.Thread(target=run, name='neat-libvirt-events')
+    event_loop.daemon = True
+    event_loop.start()
+    return True
+
+
+class VmCache(object):
+    """ The maximum RAM of the VMs keyed by the VM UUID and domain ID.
+    """
+
+    def __init__(self, vir_connection):
+        """ Initialize an empty cache.
+
+        The lifecycle events are subscribed to if the event loop has
+        been started.
+
+        :param vir_connection: A libvirt connection object.
+        """
+        self.vir_connection = vir_connection
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.events = event_loop is not None and self.register_events()
+
+    @contract
+    def register_events(self):
+        """ Subscribe to the lifecycle events of the domains.
+
+        :return: Whether the subscription has succeeded.
+         :rtype: bool
+        """
+        try:
+            self.vir_connection.domainEventRegisterAny(
+                None,
+                libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                self.lifecycle_event,
+                None)
+            log.info('Subscribed to the libvirt lifecycle events')
+            return True
+        except (AttributeError, libvirt.libvirtError) as e:
+            log.warning('Could not subscribe to the libvirt lifecycle ' +
+                        'events, polling the domain IDs: %s', str(e))
+            return False
+
+    def lifecycle_event(self, connection, domain, event, detail, opaque):
+        """ Invalidate the entry of a VM on a lifecycle event.
+
+        :param connection: The libvirt connection.
+        :param domain: The domain of the VM.
+        :param event: The type of the event.
+        :param detail: The detail of the event.
+        :param opaque: Unused.
+        """
+        uuid = domain.UUIDString()
+        with self.lock:
+            if self.entries.pop(uuid, None) is not None:
+                log.debug('Invalidated VM %s on event %s', uuid, event)
+
+    @contract
+    def get_ram(self, uuids):
+        """ Get the maximum RAM for a set of VM UUIDs.
+
+        :param uuids: A list of VM UUIDs.
+         :type uuids: list(str)
+
+        :return: The maximum RAM for the VM UUIDs found on the host.
+         :rtype: dict(str : long)
+        """
+        with self.lock:
+            self.invalidate(uuids)
+            missing = [uuid for uuid in uuids if uuid not in self.entries]
+            metrics.cache_requests('vm_ram', True, len(uuids) - len(missing))
+            metrics.cache_requests('vm_ram', False, len(missing))
+            for uuid in missing:
+                entry = self.lookup(uuid)
+                if entry is not None:
+                    self.entries[uuid] = entry
+            return dict((uuid, self.entries[uuid][1])
+                        for uuid in uuids if uuid in self.entries)
+
+    @contract
+    def invalidate(self, uuids):
+        """ Drop the entries of the VMs not running anymore.
+
+        Must be called holding the lock.
+
+        :param uuids: A list of the VM UUIDs currently on the host.
+         :type uuids: list(str)
+        """
+        current = set(uuids)
+        for uuid in [uuid for uuid in self.entries if uuid not in current]:
+            del self.entries[uuid]
+        if self.events or not self.entries:
+            return
+        try:
+            ids = set(self.vir_connection.listDomainsID())
+        except libvirt.libvirtError:
+            log.exception('Could not list the domains:')
+            self.entries.clear()
+            return
+        for uuid, (domain_id, _) in self.entries.items():
+            if domain_id not in ids:
+                del self.entries[uuid]
+
+    @contract
+    def lookup(self, uuid):
+        """ Get the domain ID and the maximum RAM of a VM from libvirt.
+
+        :param uuid: The UUID of a VM.
+         :type uuid: str[36]
+
+        :return: The domain ID and the maximum RAM of the VM in MB.
+         :rtype: None|tuple(int, int|long)
+        """
+        try:
+            domain = self.vir_connection.lookupByUUIDString(uuid)
+            return domain.ID(), domain.maxMemory() / 1024
+        except libvirt.libvirtError:
+            return None
@@ -0,0 +1,387 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Metrics of the Neat services in the Prometheus text format.
+
+Each service process keeps its metrics in a registry, which is updated
+by the processing loop and the components it uses:
+
+- neat_iteration_seconds: the duration of the iterations of the loop;
+- neat_loop_overruns_total: the iterations longer than the interval;
+- neat_loop_skipped_total: the iterations skipped due to overruns;
+- neat_phase_seconds: the time spent in each phase of an iteration,
+  e.g., libvirt, file, db, detection, placement, or migration;
+- neat_db_queries_total and neat_db_query_seconds: the number and
+  latency of the database queries by the type of the statement;
+- neat_cache_requests_total: the hits and misses of the caches;
+- neat_migrations_in_flight: the number of running VM migrations;
+- neat_migrations_total: the completed and failed VM migrations;
+- neat_decisions_total: the decisions made for each host;
+- neat_notifications_total: the notifications of the global manager
+  by the result: delivered, retry, replaced, cancelled, or discarded.
+
+The metrics can be scraped from http://<host>:<port>/metrics, where
+the port is set by the `data_collector_metrics_port` and
+`local_manager_metrics_port` options, while the global manager serves
+them at /metrics of its REST API. If the `metrics_textfile_directory`
+option is set, the metrics are also written to <service>.prom in this
+directory after every iteration, e.g., for the textfile collector of
+the Prometheus node exporter.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+import BaseHTTPServer
+import contextlib
+import os
+import threading
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+METRICS = {
+    'neat_iteration_seconds':
+        (HISTOGRAM, 'The duration of the iterations of the processing loop.'),
+    'neat_loop_overruns_total':
+        (COUNTER, 'The iterations that took longer than the interval.'),
+    'neat_loop_skipped_total':
+        (COUNTER, 'The iterations skipped due to overruns.'),
+    'neat_phase_seconds':
+        (HISTOGRAM, 'The time spent in each phase of an iteration.'),
+    'neat_db_queries_total':
+        (COUNTER, 'The number of database queries.'),
+    'neat_db_query_seconds':
+        (HISTOGRAM, 'The latency of database queries.'),
+    'neat_cache_requests_total':
+        (COUNTER, 'The requests to the caches by the result.'),
+    'neat_migrations_in_flight':
+        (GAUGE, 'The number of VM migrations in progress.'),
+    'neat_migrations_total':
+        (COUNTER, 'The finished VM migrations by the result.'),
+    'neat_decisions_total':
+        (COUNTER, 'The decisions made for each host.'),
+    'neat_notifications_total':
+        (COUNTER, 'The notifications of the global manager by the result.')}
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1., 5., 10., 30., 60.,
+           300., 600., float('inf'))
+
+
+class Registry(object):
+    """ A thread-safe set of counters, gauges, and histograms.
+    """
+
+    def __init__(self):
+        """ Initialize an empty registry.
+        """
+        self.lock = threading.Lock()
+        self.values = {}
+
+    @contract
+    def inc(self, name, labels=None, value=1):
+        """ Increment a counter.
+
+        :param name: The name of the metric.
+         :type name: str
+
+        :param labels: A dict of label names to values.
+         :type labels: None|dict(str: str)
+
+        :param value: The increment.
+         :type value: number,>=0
+        """
+        key = series(labels)
+        with self.lock:
+            values = self.values.setdefault(name, {})
+            values[key] = values.get(key, 0) + value
+
+    @contract
+    def set(self, name, value, labels=None):
+        """ Set the value of a gauge.
+
+        :param name: The name of the metric.
+         :type name: str
+
+        :param value: The new value.
+         :type value: number
+
+        :param labels: A dict of label names to values.
+         :type labels: None|dict(str: str)
+        """
+        key = series(labels)
+        with self.lock:
+            self.values.setdefault(name, {})[key] = value
+
+    @contract
+    def observe(self, name, value, labels=None):
+        """ Add an observation to a histogram.
+
+        :param name: The name of the metric.
+         :type name: str
+
+        :param value: The observed value.
+         :type value: number
+
+        :param labels: A dict of label names to values.
+         :type labels: None|dict(str: str)
+        """
+        key = series(labels)
+        with self.lock:
+            values = self.values.setdefault(name, {})
+            if key not in values:
+                values[key] = [[0] * len(BUCKETS), 0., 0]
+            histogram = values[key]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextlib.contextmanager
+    def timed(self, name, labels=None):
+        """ Observe the duration of a block in a histogram.
+
+        :param name: The name of the metric.
+         :type name: str
+
+        :param labels: A dict of label names to values.
+         :type labels: None|dict(str: str)
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, labels)
+
+    @contract
+    def get(self, name, labels=None):
+        """ Get the value of a counter or gauge.
+
+        :param name: The name of the metric.
+         :type name: str
+
+        :param labels: A dict of label names to values.
+         :type labels: None|dict(str: str)
+
+        :return: The value, or None if it has not been set.
+         :rtype: *
+        """
+        with self.lock:
+            return self.values.get(name, {}).get(series(labels))
+
+    @contract
+    def render(self):
+        """ Render the metrics in the Prometheus text format.
+
+        :return: The metrics in the Prometheus text format.
+         :rtype: str
+        """
+        lines = []
+        with self.lock:
+            for name in sorted(self.values.keys()):
+                kind, description = METRICS.get(name, (GAUGE, name))
+                lines.append('# HELP {0} {1}'.format(name, description))
+                lines.append('# TYPE {0} {1}'.format(name, kind))
+                for key, value in sorted(self.values[name].items()):
+                    if kind != HISTOGRAM:
+                        lines.append(sample(name, key, value))
+                        continue
+                    buckets, total, count = value
+                    for bound, bucket in zip(BUCKETS, buckets):
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(sample(name + '_bucket',
+                                            key + (('le', le),), bucket))
+                    lines.append(sample(name + '_sum', key, total))
+                    lines.append(sample(name + '_count', key, count))
+        return '\n'.join(lines) + '\n'
+
+
+@contract
+def series(labels):
+    """ Build a hashable key of a time series from its labels.
+
+    :param labels: A dict of label names to values.
+     :type labels: None|dict(str: str)
+
+    :return: A sorted tuple of label name and value pairs.
+     :rtype: tuple
+    """
+    return tuple(sorted((labels or {}).items()))
+
+
+@contract
+def sample(name, key, value):
+    """ Format a sample of a time series.
+
+    :param name: The name of the time series.
+     :type name: str
+
+    :param key: A tuple of label name and value pairs.
+     :type key: tuple
+
+    :param value: The value of the sample.
+     :type value: number
+
+    :return: A line of the Prometheus text format.
+     :rtype: str
+    """
+    if key:
+        name += '{' + ','.join(
+            '{0}="{1}"'.format(label, str(x).replace('\\', '\\\\').
+                               replace('"', '\\"').replace('\n', '\\n'))
+            for label, x in key) + '}'
+    return '{0} {1}'.format(name, repr(float(value)))
+
+
+# The registry of the current process
+REGISTRY = Registry()
+
+# The file the metrics are written to, if any
+TEXTFILE = {'path': None}
+
+
+inc = REGISTRY.inc
+gauge = REGISTRY.set
+observe = REGISTRY.observe
+timed = REGISTRY.timed
+
+
+@contract
+def phase(name):
+    """ Measure the time spent in a phase of an iteration.
+
+    :param name: The name of the phase, e.g., libvirt or db.
+     :type name: str
+
+    :return: A context manager measuring the time of a block.
+     :rtype: *
+    """
+    return REGISTRY.timed('neat_phase_seconds', {'phase': name})
+
+
+@contract
+def cache_requests(name, hit, count=1):
+    """ Count the requests to a cache.
+
+    :param name: The name of the cache.
+     :type name: str
+
+    :param hit: Whether the requests have been served from the cache.
+     :type hit: bool
+
+    :param count: The number of requests.
+     :type count: int,>=0
+    """
+    if count > 0:
+        REGISTRY.inc('neat_cache_requests_total',
+                     {'cache': name, 'result': 'hit' if hit else 'miss'},
+                     count)
+
+
+@contract
+def init_metrics(config, service):
+    """ Start exporting the metrics of a service as configured.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param service: The name of the service, e.g., local_manager.
+     :type service: str
+
+    :return: The started HTTP server, or None if not configured.
+     :rtype: *
+    """
+    directory = config.get('metrics_textfile_directory', '')
+    if directory:
+        if not os.access(directory, os.F_OK):
+            os.makedirs(directory)
+        TEXTFILE['path'] = os.path.join(directory, service + '.prom')
+        log.info('Writing the metrics to %s', TEXTFILE['path'])
+    port = int(config.get(service + '_metrics_port', 0))
+    if port > 0:
+        return serve(port)
+    return None
+
+
+def export():
+    """ Write the metrics to the textfile, if configured.
+
+    The file is replaced atomically, so that it is never read partially.
+    """
+    path = TEXTFILE['path']
+    if path is None:
+        return
+    try:
+        with open(path + '.tmp', 'w') as f:
+            f.write(REGISTRY.render())
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError) as e:
+        log.warning('Could not write the metrics to %s: %s', path, str(e))
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ A request handler serving the metrics at /metrics.
+    """
+
+    def do_GET(self):
+        """ Respond with the metrics of the registry.
+        """
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """ Log the requests using the logging module.
+        """
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('%s - %s', self.client_address[0], format % args)
+
+
+@contract
+def serve(port, host='', registry=REGISTRY):
+    """ Serve the metrics over HTTP in a daemon thread.
+
+    :param port: The port to listen to, 0 to choose a free port.
+     :type port: int,>=0
+
+    :param host: The address to listen to, all interfaces by default.
+     :type host: str
+
+    :param registry: The registry of the metrics to serve.
+     :type registry: *
+
+    :return: The started HTTP server.
+     :rtype: *
+    """
+    server = BaseHTTPServer.HTTPServer((host, port), MetricsHandler)
+    server.registry = registry
+    thread = threading.Thread(target=server.serve_forever,
+                              name='metrics-server')
+    thread.daemon = True
+    thread.start()
+    log.info('Serving the metrics on port %d', server.server_port)
+    return server
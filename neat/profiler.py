@@ -0,0 +1,130 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Profiling of the iterations of the Neat services on demand.
+
+When a service receives the SIGUSR2 signal, the next
+`profiler_iterations` iterations of its processing loop are run under
+cProfile. The statistics of each iteration are written to the log
+directory: <service>-<time>-<n>.prof can be loaded using the pstats
+module, and <service>-<time>-<n>.txt lists the functions with the
+highest cumulative time. Sending the signal during profiling restarts
+the count. For example:
+
+    kill -USR2 $(pgrep -f neat-local-manager)
+
+When profiling is not requested, an iteration is only preceded by a
+check of a counter.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+import cProfile
+import os
+import pstats
+import signal
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# The number of the functions listed in the text summary
+SUMMARY_LENGTH = 50
+
+PROFILER = {'service': None,
+            'directory': None,
+            'iterations': 0,
+            'remaining': 0,
+            'started': None,
+            'count': 0}
+
+
+@contract
+def init_profiler(config, service):
+    """ Enable profiling of a service on receiving the SIGUSR2 signal.
+
+    This must be called from the main thread.
+
+    :param config: A config dictionary.
+     :type config: dict(str: *)
+
+    :param service: The name of the service, e.g., local-manager.
+     :type service: str
+    """
+    PROFILER['service'] = service
+    PROFILER['directory'] = config['log_directory']
+    PROFILER['iterations'] = int(config.get('profiler_iterations', 10))
+    signal.signal(signal.SIGUSR2, handle_signal)
+
+
+def handle_signal(signum, frame):
+    """ Request profiling of the next iterations.
+    """
+    request(PROFILER['iterations'])
+
+
+@contract
+def request(iterations):
+    """ Profile the next iterations.
+
+    :param iterations: The number of iterations to profile.
+     :type iterations: int,>=0
+    """
+    PROFILER['started'] = time.strftime('%Y%m%d-%H%M%S')
+    PROFILER['count'] = 0
+    PROFILER['remaining'] = iterations
+    log.info('Profiling the next %d iterations', iterations)
+
+
+def run(function, *args):
+    """ Call a function, profiling the call if profiling is requested.
+
+    :param function: The function performing an iteration.
+    :param args: The arguments of the function.
+    :return: The return value of the function.
+    """
+    if PROFILER['remaining'] <= 0:
+        return function(*args)
+    PROFILER['remaining'] -= 1
+    PROFILER['count'] += 1
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function, *args)
+    finally:
+        dump(profile, '{0}-{1}-{2}'.format(PROFILER['service'],
+                                           PROFILER['started'],
+                                           PROFILER['count']))
+
+
+@contract
+def dump(profile, name):
+    """ Write the statistics of a profile to the log directory.
+
+    :param profile: A profile of an iteration.
+     :type profile: *
+
+    :param name: The base name of the files to write.
+     :type name: str
+    """
+    path = os.path.join(PROFILER['directory'] or '.', name)
+    try:
+        profile.dump_stats(path + '.prof')
+        with open(path + '.txt', 'w') as f:
+            stats = pstats.Stats(profile, stream=f)
+            stats.sort_stats('cumulative').print_stats(SUMMARY_LENGTH)
+        log.info('Wrote the profile of an iteration to %s.prof', path)
+    except (IOError, OSError) as e:
+        log.warning('Could not write the profile to %s: %s', path, str(e))
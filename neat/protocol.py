@@ -0,0 +1,208 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" The protocol of the events sent by the local managers.
+
+Version 1 of the protocol is served by the global manager at
+/v1/events. A request carries a batch of events encoded as a single
+JSON or msgpack document of the following form:
+
+    {'version': 1,
+     'username': <sha1 hash of the admin user name>,
+     'password': <sha1 hash of the admin password>,
+     'events': [{'host': <host name>,
+                 'time': <time of the event>,
+                 'reason': <0 - underload, 1 - overload>,
+                 'vm_uuids': <UUIDs of the VMs to migrate>,
+                 'host_cpu_mhz': <recent CPU usage by the host>,
+                 'vm_cpu_mhz': {<VM UUID>: <recent CPU usage by the VM>}}]}
+
+The utilization histories are optional. When present, the global
+manager uses them instead of reading the histories of the VMs of the
+host from the database.
+
+The global manager answers with a document in the same format holding
+the result of each event in the order of the events:
+
+    {'version': 1,
+     'jobs': [{'job': <job ID>, 'status': <job status>} |
+              {'error': <status code>}]}
+
+An event is rejected with the error 400 if it is invalid, or 412 if it
+is older than the latest accepted event of the host. The status of the
+response is 202, unless the batch consists of a single rejected event,
+in which case the status is the error of the event. A client sending
+several events must check the result of each of them.
+
+The msgpack format requires the msgpack package to be installed.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+import logging
+log = logging.getLogger(__name__)
+
+
+VERSION = 1
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'msgpack': 'application/x-msgpack'}
+
+
+@contract
+def content_type(format):
+    """ Get the content type of a message format.
+
+    :param format: The name of the format: json or msgpack.
+     :type format: str
+
+    :return: The content type of the format.
+     :rtype: str
+    """
+    if format not in CONTENT_TYPES:
+        raise ValueError('Unknown message format: ' + format)
+    if format == 'msgpack' and msgpack is None:
+        raise ValueError('The msgpack format requires the msgpack package')
+    return CONTENT_TYPES[format]
+
+
+@contract
+def supported_content_types():
+    """ Get the content types of the available message formats.
+
+    :return: A list of content types.
+     :rtype: list(str)
+    """
+    return [content_type for format, content_type in CONTENT_TYPES.items()
+            if format != 'msgpack' or msgpack is not None]
+
+
+@contract
+def encode(message, content_type):
+    """ Encode a message.
+
+    :param message: A message to encode.
+     :type message: dict
+
+    :param content_type: The content type of the encoded message.
+     :type content_type: str
+
+    :return: The encoded message.
+     :rtype: str
+    """
+    if content_type == CONTENT_TYPES['json']:
+        return json.dumps(message, separators=(',', ':'))
+    if content_type == CONTENT_TYPES['msgpack'] and msgpack is not None:
+        return msgpack.packb(message)
+    raise ValueError('Unsupported content type: ' + content_type)
+
+
+@contract
+def decode(body, content_type):
+    """ Decode a message.
+
+    :param body: An encoded message.
+     :type body: str
+
+    :param content_type: The content type of the encoded message.
+     :type content_type: str
+
+    :return: The decoded message.
+     :rtype: dict
+    """
+    if content_type == CONTENT_TYPES['json']:
+        message = json.loads(body)
+    elif content_type == CONTENT_TYPES['msgpack'] and msgpack is not None:
+        message = msgpack.unpackb(body)
+    else:
+        raise ValueError('Unsupported content type: ' + content_type)
+    if not isinstance(message, dict):
+        raise ValueError('The message is not a map')
+    return _native(message)
+
+
+def _native(value):
+    """ Convert the unicode strings of a decoded message to str.
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, dict):
+        return dict((_native(k), _native(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_native(x) for x in value]
+    return value
+
+
+@contract
+def event(host, time, reason, vm_uuids, host_cpu_mhz, vm_cpu_mhz):
+    """ Create an event to send to the global manager.
+
+    :param host: The name of the host.
+     :type host: str
+
+    :param time: The time of the event.
+     :type time: number
+
+    :param reason: The reason of the event: 0 - underload, 1 - overload.
+     :type reason: int
+
+    :param vm_uuids: A list of VM UUIDs to migrate from the host.
+     :type vm_uuids: list(str)
+
+    :param host_cpu_mhz: A history of the CPU usage by the host in MHz.
+     :type host_cpu_mhz: list(int)
+
+    :param vm_cpu_mhz: A map of VM UUIDs to their CPU usage histories.
+     :type vm_cpu_mhz: dict(str: list(int))
+
+    :return: An event.
+     :rtype: dict(str: *)
+    """
+    return {'host': host,
+            'time': time,
+            'reason': reason,
+            'vm_uuids': vm_uuids,
+            'host_cpu_mhz': host_cpu_mhz,
+            'vm_cpu_mhz': vm_cpu_mhz}
+
+
+@contract
+def message(username, password, events):
+    """ Create a message carrying a batch of events.
+
+    :param username: A sha1-hashed user name.
+     :type username: str
+
+    :param password: A sha1-hashed password.
+     :type password: str
+
+    :param events: A list of events.
+     :type events: list(dict(str: *))
+
+    :return: A message.
+     :rtype: dict(str: *)
+    """
+    return {'version': VERSION,
+            'username': username,
+            'password': password,
+            'events': events}
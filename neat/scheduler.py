@@ -0,0 +1,227 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" A drift-free scheduler of the iterations of the processing loops.
+
+The iterations are scheduled at deadlines spaced by the interval on a
+monotonic clock, so that the period does not drift by the execution
+time of the iterations and is not affected by changes of the system
+time.
+
+An iteration that has not finished before the deadline of the next
+one is an overrun. The overruns are logged and counted in the
+neat_loop_overruns_total metric. The deadlines missed due to an
+overrun are handled according to the `scheduler_overrun_policy`
+option:
+
+- skip: the missed iterations are skipped, and the next iteration is
+  performed at the next deadline, so that the iterations stay on the
+  grid of deadlines; the skipped iterations are counted in the
+  neat_loop_skipped_total metric;
+
+- catch_up: the missed iterations are performed one after another
+  without waiting, at most MAX_CATCH_UP of them, the rest are skipped.
+
+The deadlines can be aligned to a phase: an offset in seconds from the
+multiples of the interval since the epoch, e.g., with the interval of
+300 seconds and the phase of 10 seconds, the iterations are performed
+at 00:00:10, 00:05:10, and so on. As the clocks of the hosts are
+synchronized, the local manager aligned to a phase slightly later
+than the phase of the data collector runs right after a new sample has
+been collected.
+
+To avoid all the compute hosts hitting the database and the global
+manager at the same time, the deadlines of each host are shifted by an
+offset within the `scheduler_phase_spread` option derived from the
+hash of the host name. The offset is deterministic, so that the data
+collector and local manager of a host are shifted equally and keep
+their relative phases. Optionally, each iteration is delayed by a
+random jitter of up to `scheduler_jitter` seconds, which does not
+shift the following deadlines.
+"""
+
+from contracts import contract
+from neat.contracts_primitive import *
+
+from hashlib import sha1
+import random
+import time
+
+import neat.metrics as metrics
+
+import logging
+log = logging.getLogger(__name__)
+
+
+SKIP = 'skip'
+CATCH_UP = 'catch_up'
+POLICIES = [SKIP, CATCH_UP]
+
+# The maximum number of missed iterations performed by catching up
+MAX_CATCH_UP = 10
+
+# The clock_gettime identifier of the monotonic clock on Linux
+CLOCK_MONOTONIC = 1
+
+
+def monotonic_clock():
+    """ Get a function returning the time of a monotonic clock.
+
+    Python 2 does not provide a monotonic clock, so clock_gettime of
+    the C library is called directly. If it is not available, the
+    system time is used instead.
+
+    :return: A function returning the time in seconds.
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    try:
+        import ctypes
+        import ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long),
+                        ('tv_nsec', ctypes.c_long)]
+
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1',
+                            use_errno=True)
+        clock_gettime = librt.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+        def monotonic():
+            t = timespec()
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, 'clock_gettime failed')
+            return t.tv_sec + t.tv_nsec * 1e-9
+
+        monotonic()
+        return monotonic
+    except (ImportError, OSError, AttributeError) as e:
+        log.warning('The monotonic clock is not available, ' +
+                    'using the system time: %s', str(e))
+        return time.time
+
+
+monotonic = monotonic_clock()
+
+
+@contract
+def host_offset(hostname, spread):
+    """ Derive a deterministic offset of a host within the spread.
+
+    :param hostname: The name of the host.
+     :type hostname: str
+
+    :param spread: The maximum offset in seconds.
+     :type spread: number,>=0
+
+    :return: The offset of the host in seconds.
+     :rtype: float,>=0
+    """
+    fraction = int(sha1(hostname).hexdigest()[:8], 16) / float(2 ** 32)
+    return fraction * spread
+
+
+class Scheduler(object):
+    """ A scheduler of iterations at fixed deadlines on a monotonic clock.
+    """
+
+    @contract(interval='number,>=0',
+              phase='None|number',
+              policy='str',
+              offset='number,>=0',
+              jitter='number,>=0')
+    def __init__(self, interval, phase=None, policy=SKIP, offset=0.,
+                 jitter=0., clock=monotonic, wall_clock=time.time,
+                 sleep=time.sleep, random=random.random):
+        """ Initialize the scheduler, the first deadline is now or the phase.
+
+        :param interval: The time interval between iterations in seconds.
+        :param phase: The offset of the deadlines in seconds, None to start now.
+        :param policy: The policy of handling overruns: skip or catch_up.
+        :param offset: The offset of the host added to the phase in seconds.
+        :param jitter: The maximum random delay of an iteration in seconds.
+        :param clock: A function returning the time of a monotonic clock.
+        :param wall_clock: A function returning the system time.
+        :param sleep: A function sleeping for a number of seconds.
+        :param random: A function returning a random number in [0, 1).
+        """
+        if policy not in POLICIES:
+            raise ValueError('Unknown overrun policy: ' + policy)
+        self.interval = interval
+        self.policy = policy
+        self.jitter = jitter
+        self.clock = clock
+        self.sleep = sleep
+        self.random = random
+        self.deadline = clock()
+        if phase is not None and interval > 0:
+            self.deadline += (phase + offset - wall_clock()) % interval
+        else:
+            self.deadline += offset
+        self.overruns = 0
+        self.skipped = 0
+        self.catching_up = False
+
+    def wait(self):
+        """ Sleep until the deadline of the next iteration.
+
+        A sleep interrupted by a signal is resumed until the deadline.
+        """
+        deadline = self.deadline
+        if self.jitter > 0:
+            deadline += self.jitter * self.random()
+        delay = deadline - self.clock()
+        while delay > 0:
+            self.sleep(delay)
+            delay = deadline - self.clock()
+
+    @contract
+    def advance(self):
+        """ Schedule the next iteration after an iteration has finished.
+
+        An iteration performed to catch up is late by design, so it is
+        not counted as an overrun.
+
+        :return: The number of deadlines missed by the iteration.
+         :rtype: int,>=0
+        """
+        if self.interval <= 0:
+            self.deadline = self.clock()
+            return 0
+        self.deadline += self.interval
+        now = self.clock()
+        catching_up = self.catching_up
+        self.catching_up = False
+        if now <= self.deadline:
+            return 0
+        late = now - self.deadline
+        missed = int(late // self.interval) + 1
+        if self.policy == CATCH_UP:
+            skipped = max(missed - MAX_CATCH_UP, 0)
+        else:
+            skipped = missed
+        self.deadline += skipped * self.interval
+        if skipped:
+            self.skipped += skipped
+            metrics.inc('neat_loop_skipped_total', value=skipped)
+        self.catching_up = self.deadline < now
+        if not catching_up:
+            self.overruns += 1
+            metrics.inc('neat_loop_overruns_total')
+            log.warning('The iteration has overrun %d deadlines by ' +
+                        '%.1f seconds, skipped %d iterations',
+                        missed, late, skipped)
+        return missed
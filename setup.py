@@ -84,16 +84,38 @@ setup(
     packages=find_packages(),
     test_suite='tests',
     tests_require=['pyqcy', 'mocktest', 'PyContracts'],
+    extras_require={
+        'msgpack': ['msgpack'],
+        },
     entry_points = {
         'console_scripts': [
             'neat-data-collector = neat.locals.collector:start',
             'neat-local-manager  = neat.locals.manager:start',
+            'neat-local-agent    = neat.locals.agent:start',
             'neat-global-manager = neat.globals.manager:start',
             'neat-db-cleaner     = neat.globals.db_cleaner:start',
-            ]
+            'neat-dry-run        = neat.globals.dry_run:start',
+            ],
+        'neat.underload_detection': [
+            'always_underloaded = neat.locals.underload.trivial:always_underloaded_factory',
+            'threshold = neat.locals.underload.trivial:threshold_factory',
+            'last_n_average_threshold = neat.locals.underload.trivial:LastNAverageThreshold',
+            ],
+        'neat.overload_detection': [
+            'never_overloaded = neat.locals.overload.trivial:never_overloaded_factory',
+            'threshold = neat.locals.overload.trivial:threshold_factory',
+            'last_n_average_threshold = neat.locals.overload.trivial:LastNAverageThreshold',
+            'otf = neat.locals.overload.otf:Otf',
+            'mhod = neat.locals.overload.mhod.core:mhod_factory',
+            'loess = neat.locals.overload.statistics:loess_factory',
+            'loess_robust = neat.locals.overload.statistics:loess_robust_factory',
+            'mad_threshold = neat.locals.overload.statistics:mad_threshold_factory',
+            'iqr_threshold = neat.locals.overload.statistics:iqr_threshold_factory',
+            ],
         },
     data_files = [('/etc/init.d', ['init.d/openstack-neat-data-collector',
                                    'init.d/openstack-neat-local-manager',
+                                   'init.d/openstack-neat-local-agent',
                                    'init.d/openstack-neat-global-manager',
                                    'init.d/openstack-neat-db-cleaner']),
                   ('/etc/neat', ['neat.conf'])],
@@ -11,3 +11,12 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+import os
+import contracts
+
+# The tests are run with the contracts checked, see neat/__init__.py.
+# The test runner may have imported the neat package before this one,
+# but not the modules defining the contracts.
+os.environ['NEAT_CONTRACTS'] = '1'
+contracts.enable_all()
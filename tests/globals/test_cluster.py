@@ -0,0 +1,171 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import novaclient.exceptions
+
+import neat.globals.cluster as cluster
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+def server(uuid, host, flavor, status=u'ACTIVE'):
+    vm = mock(uuid)
+    vm.id = uuid
+    vm.flavor = {'id': flavor}
+    vm.status = status
+    setattr(vm, 'OS-EXT-SRV-ATTR:host', host)
+    return vm
+
+
+def flavor(id, ram):
+    fl = mock('flavor' + id)
+    fl.id = id
+    fl.ram = ram
+    return fl
+
+
+class Cluster(TestCase):
+
+    def test_vms_by_hosts(self):
+        with MockTransaction:
+            nova = mock('nova')
+            nova.servers = mock('servers')
+            model = cluster.ClusterModel(nova, mock('db'), 600)
+            expect(nova.servers).list().and_return([
+                server('vm1', 'host1', '1'),
+                server('vm2', 'host2', '1'),
+                server('vm3', 'host1', '2')]).once()
+            expect(nova.servers).list(search_opts=Any).and_return([
+                server('vm2', 'host1', '1'),
+                server('vm3', 'host1', '2', u'DELETED'),
+                server('vm4', 'host3', '1')]).once()
+
+            result = model.vms_by_hosts(['host1', 'host2'])
+            assert sorted(result['host1']) == ['vm1', 'vm3']
+            assert result['host2'] == ['vm2']
+
+            result = model.vms_by_hosts(['host1', 'host2', 'host3'])
+            assert sorted(result['host1']) == ['vm1', 'vm2']
+            assert result['host2'] == []
+            assert result['host3'] == ['vm4']
+
+    def test_vms_by_hosts_expired(self):
+        with MockTransaction:
+            nova = mock('nova')
+            nova.servers = mock('servers')
+            model = cluster.ClusterModel(nova, mock('db'), 0)
+            expect(nova.servers).list().and_return([
+                server('vm1', 'host1', '1')]).twice()
+            expect(nova.servers).list(search_opts=Any).never()
+            assert model.vms_by_host('host1') == ['vm1']
+            assert model.vms_by_host('host1') == ['vm1']
+
+    def test_vms_ram_limit(self):
+        with MockTransaction:
+            nova = mock('nova')
+            nova.servers = mock('servers')
+            nova.flavors = mock('flavors')
+            model = cluster.ClusterModel(nova, mock('db'), 600)
+            expect(nova.servers).list().and_return([
+                server('vm1', 'host1', '1'),
+                server('vm2', 'host1', '2')]).once()
+            expect(nova.flavors).list().and_return([
+                flavor('1', 512),
+                flavor('2', 1024)]).once()
+            expect(nova.servers).get('vm3').and_return(
+                server('vm3', 'host2', '1')).once()
+            expect(nova.servers).get('vm4').and_raise(
+                novaclient.exceptions.NotFound(404)).once()
+            model.vms_by_hosts(['host1'])
+            assert model.vms_ram_limit(['vm1', 'vm2', 'vm3', 'vm4']) == \
+                {'vm1': 512, 'vm2': 1024, 'vm3': 512}
+            assert model.vms_ram_limit(['vm1', 'vm3']) == \
+                {'vm1': 512, 'vm3': 512}
+
+    def test_host_used_ram(self):
+        with MockTransaction:
+            nova = mock('nova')
+            nova.hosts = mock('hosts')
+            model = cluster.ClusterModel(nova, mock('db'), 600)
+            host1 = mock('host1')
+            host1.memory_mb = 4000
+            host2 = mock('host2')
+            host2.memory_mb = 3000
+            host3 = mock('host3')
+            host3.memory_mb = 3500
+            expect(nova.hosts).get('host1'). \
+                and_return([host1, host2, host3]).twice()
+            assert model.host_used_ram('host1') == 3500
+            assert model.host_used_ram('host1') == 3500
+            model.record_migrations({'vm1': 'host1'})
+            assert model.host_used_ram('host1') == 3500
+
+    def test_host_used_ram_nova(self):
+        with MockTransaction:
+            nova = mock('nova')
+            nova.hosts = mock('hosts')
+            host1 = mock('host1')
+            host1.memory_mb = 4000
+            host2 = mock('host2')
+            host2.memory_mb = 3000
+            expect(nova.hosts).get('host1'). \
+                and_return([host1, host2]).once()
+            assert cluster.host_used_ram(nova, 'host1') == 3000
+
+        with MockTransaction:
+            nova = mock('nova')
+            nova.hosts = mock('hosts')
+            host1 = mock('host1')
+            host1.memory_mb = 4000
+            host2 = mock('host2')
+            host2.memory_mb = 3000
+            host3 = mock('host3')
+            host3.memory_mb = 3500
+            expect(nova.hosts).get('host1'). \
+                and_return([host1, host2, host3]).once()
+            assert cluster.host_used_ram(nova, 'host1') == 3500
+
+    def test_host_characteristics(self):
+        with MockTransaction:
+            db = mock('db')
+            model = cluster.ClusterModel(mock('nova'), db, 600)
+            expect(db).select_host_characteristics().and_return(
+                ({'host1': 3000}, {'host1': 4}, {'host1': 4096})).once()
+            cpu, cores, ram = model.host_characteristics()
+            assert cpu == {'host1': 3000}
+            cpu.pop('host1')
+            assert model.host_characteristics() == \
+                ({'host1': 3000}, {'host1': 4}, {'host1': 4096})
+
+    def test_record_migrations(self):
+        with MockTransaction:
+            nova = mock('nova')
+            nova.servers = mock('servers')
+            nova.hosts = mock('hosts')
+            model = cluster.ClusterModel(nova, mock('db'), 600)
+            expect(nova.servers).list().and_return([
+                server('vm1', 'host1', '1')]).once()
+            expect(nova.servers).list(search_opts=Any). \
+                and_return([]).once()
+            assert model.vms_by_host('host1') == ['vm1']
+            model.hosts_ram = {'host1': (1, 0), 'host2': (2, 0),
+                               'host3': (3, 0)}
+            model.record_migrations({'vm1': 'host2'})
+            assert model.hosts_ram == {'host3': (3, 0)}
+            assert model.vms_by_hosts(['host1', 'host2']) == \
+                {'host1': [], 'host2': ['vm1']}
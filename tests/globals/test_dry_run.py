@@ -0,0 +1,96 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+from hashlib import sha1
+import requests
+
+import neat.globals.dry_run as dry_run
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+REPORT = {'placement': {'vm1': 'h3', 'vm2': 'h4'},
+          'plan': [[{'vm1': 'h3'}, {'vm1': 'h1'}, {'vm1': []}],
+                   [{'vm2': 'h4'}, {'vm2': 'h1'}, {'vm2': ['vm1']}]],
+          'unplanned': ['vm3'],
+          'hosts_to_activate': ['h4'],
+          'hosts_to_deactivate': [],
+          'timings': {'db': 0.01, 'nova': 0.25, 'placement': 0.5,
+                      'plan': 0.001, 'total': 0.8}}
+
+
+class DryRun(TestCase):
+
+    def test_request_dry_run(self):
+        config = {'os_admin_user': 'user',
+                  'os_admin_password': 'password',
+                  'global_manager_host': 'controller',
+                  'global_manager_port': '60080'}
+        response = mock('response')
+        response.content = '{"placement": {}}'
+
+        with MockTransaction:
+            expect(requests).get(
+                'http://controller:60080/dry-run',
+                params={'username': sha1('user').hexdigest(),
+                        'password': sha1('password').hexdigest(),
+                        'host': 'h1',
+                        'reason': 1,
+                        'vm_uuids': 'vm1,vm2'}). \
+                and_return(response).once()
+            expect(response).raise_for_status().once()
+            assert dry_run.request_dry_run(
+                config, 'h1', ['vm1', 'vm2']) == {'placement': {}}
+
+        with MockTransaction:
+            expect(requests).get(
+                'http://controller:60080/dry-run',
+                params={'username': sha1('user').hexdigest(),
+                        'password': sha1('password').hexdigest(),
+                        'host': 'h1',
+                        'reason': 0}). \
+                and_return(response).once()
+            expect(response).raise_for_status().once()
+            dry_run.request_dry_run(config, 'h1', [])
+
+    def test_format_report(self):
+        lines = dry_run.format_report(REPORT).splitlines()
+        assert lines[:9] == [
+            'Placement:',
+            '  vm1 -> h3',
+            '  vm2 -> h4',
+            'Migration plan:',
+            '  Phase 1:',
+            '    vm1: h1 -> h3',
+            '  Phase 2:',
+            '    vm2: h1 -> h4 after vm1',
+            'Cannot be migrated: vm3']
+        assert 'Hosts to switch on: h4' in lines
+        assert 'Hosts to switch off: none' in lines
+        assert '  nova          0.250 s' in lines
+        assert '  migration     0.000 s' in lines
+        assert lines[-1] == '  total         0.800 s'
+
+    def test_start(self):
+        config = {'option': 'value'}
+        with MockTransaction:
+            expect(dry_run).read_and_validate_config.and_return(config).once()
+            expect(dry_run).request_dry_run(config, 'h1', ['vm1']). \
+                and_return(REPORT).once()
+            expect(dry_run).format_report(REPORT).and_return('').once()
+            dry_run.start(['h1', 'vm1'])
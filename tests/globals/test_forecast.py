@@ -0,0 +1,80 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import datetime
+
+import neat.globals.forecast as forecast
+
+
+class Forecast(TestCase):
+
+    def test_slot(self):
+        forecaster = forecast.DemandForecaster(3600, 300, 0.5)
+        assert forecaster.slot(0) == 0
+        assert forecaster.slot(299) == 0
+        assert forecaster.slot(300) == 1
+        assert forecaster.slot(3599) == 11
+        assert forecaster.slot(3600) == 0
+        assert forecaster.slot(7500) == 1
+
+    def test_observe(self):
+        forecaster = forecast.DemandForecaster(3600, 300, 0.5)
+        assert forecaster.forecast(600) is None
+
+        # The buckets are completed one interval after their end
+        forecaster.observe([(0, 'h1', 100), (10, 'vm1', 200),
+                            (100, 'vm1', 400), (300, 'h1', 100)])
+        assert forecaster.seasonal == {}
+        assert forecaster.current is None
+        forecaster.observe([(600, 'h1', 50)])
+        # The demand is the sum of the mean usage of the hosts and VMs
+        assert forecaster.seasonal == {0: 400.}
+        assert forecaster.current == 400.
+        assert sorted(forecaster.buckets.keys()) == [300, 600]
+
+        # The same bucket of the next period is smoothed
+        forecaster.observe([(3600, 'h1', 200), (4200, 'h1', 0)])
+        assert forecaster.seasonal == {0: 300., 1: 100., 2: 50.}
+        assert forecaster.current == 200.
+
+    def test_forecast(self):
+        forecaster = forecast.DemandForecaster(3600, 300, 1)
+        forecaster.observe([(x * 300, 'h1', usage) for x, usage in
+                            enumerate([100, 100, 500, 900, 100, 100,
+                                       100, 100, 100, 100, 100, 100,
+                                       100, 100])])
+        assert forecaster.latest == 3900
+        assert forecaster.current == 100.
+        # The peak of the seasonal profile ahead of the latest sample
+        assert forecaster.forecast(0) == 100.
+        assert forecaster.forecast(300) == 500.
+        assert forecaster.forecast(600) == 900.
+        assert forecaster.forecast(3600) == 900.
+
+    def test_to_seconds(self):
+        assert forecast.to_seconds(datetime.datetime(1970, 1, 1)) == 0
+        assert forecast.to_seconds(
+            datetime.datetime(1970, 1, 2, 0, 5)) == 86700
+
+    def test_select_hosts(self):
+        hosts = {'h1': 1000, 'h2': 3000, 'h3': 2000}
+        assert forecast.select_hosts(0, hosts) == []
+        assert forecast.select_hosts(-100, hosts) == []
+        assert forecast.select_hosts(2500, hosts) == ['h2']
+        assert forecast.select_hosts(3500, hosts) == ['h2', 'h3']
+        assert forecast.select_hosts(10000, hosts) == ['h2', 'h3', 'h1']
+        assert forecast.select_hosts(100, {}) == []
@@ -0,0 +1,126 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import threading
+
+import neat.globals.jobs as jobs
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class Jobs(TestCase):
+
+    def test_put_get(self):
+        queue = jobs.JobQueue()
+        job1 = queue.put('host1', 0, [])
+        job2 = queue.put('host2', 1, ['vm1'])
+        assert job1['status'] == jobs.PENDING
+        assert job1['id'] != job2['id']
+
+        job = queue.get(0)
+        assert job is job1
+        assert job['status'] == jobs.RUNNING
+        assert job['started'] is not None
+        assert queue.get(0) is job2
+        assert queue.get(0) is None
+        assert queue.get(0.01) is None
+
+    def test_deduplication(self):
+        queue = jobs.JobQueue()
+        job1 = queue.put('host1', 1, ['vm1'])
+        job2 = queue.put('host2', 1, ['vm2'])
+        job3 = queue.put('host1', 0, [])
+
+        assert queue.status(job1['id'])['status'] == jobs.REPLACED
+        assert queue.status(job1['id'])['replaced_by'] == job3['id']
+        assert queue.get(0) is job2
+        assert queue.get(0) is job3
+        assert queue.get(0) is None
+
+    def test_data(self):
+        queue = jobs.JobQueue()
+        job1 = queue.put('host1', 1, ['vm1'], {'vm_cpu_mhz': {'vm1': [1]}})
+        assert job1['data'] == {'vm_cpu_mhz': {'vm1': [1]}}
+        assert 'data' not in queue.status(job1['id'])
+        job2 = queue.put('host1', 1, ['vm1'], {'vm_cpu_mhz': {'vm1': [2]}})
+        # The data of the finished jobs are dropped
+        assert job1['data'] == {}
+        assert queue.get(0) is job2
+        queue.complete(job2)
+        assert job2['data'] == {}
+        assert queue.put('host2', 0, [])['data'] == {}
+
+    def test_get_all(self):
+        queue = jobs.JobQueue()
+        assert queue.get_all() == []
+        job1 = queue.put('host1', 0, [])
+        job2 = queue.put('host2', 1, ['vm1'])
+        assert queue.get_all() == [job1, job2]
+        assert job1['status'] == jobs.RUNNING
+        assert job2['status'] == jobs.RUNNING
+        assert queue.get(0) is None
+
+    def test_replace(self):
+        queue = jobs.JobQueue()
+        job1 = queue.put('host1', 0, [])
+        queue.get(0)
+        job2 = queue.put('host1', 1, ['vm1'])
+        queue.get(0)
+        queue.replace(job1, job2)
+        assert queue.status(job1['id'])['status'] == jobs.REPLACED
+        assert queue.status(job1['id'])['replaced_by'] == job2['id']
+
+    def test_complete_status(self):
+        queue = jobs.JobQueue()
+        job = queue.put('host1', 0, [])
+        queue.get(0)
+        queue.complete(job)
+        status = queue.status(job['id'])
+        assert status['status'] == jobs.COMPLETED
+        assert status['error'] is None
+        assert status['completed'] >= status['started']
+
+        job = queue.put('host1', 0, [])
+        queue.get(0)
+        queue.complete(job, 'error')
+        assert queue.status(job['id'])['status'] == jobs.FAILED
+        assert queue.status(job['id'])['error'] == 'error'
+
+        assert queue.status('unknown') is None
+
+    def test_history_size(self):
+        queue = jobs.JobQueue(2)
+        job1 = queue.put('host1', 0, [])
+        job2 = queue.put('host2', 0, [])
+        job3 = queue.put('host3', 0, [])
+        assert queue.status(job1['id']) is not None
+
+        queue.complete(queue.get(0))
+        job4 = queue.put('host4', 0, [])
+        assert queue.status(job1['id']) is None
+        assert queue.status(job2['id']) is not None
+        assert queue.status(job4['id']) is not None
+
+    def test_get_blocking(self):
+        queue = jobs.JobQueue()
+        result = []
+        consumer = threading.Thread(target=lambda: result.append(queue.get()))
+        consumer.start()
+        job = queue.put('host1', 0, [])
+        consumer.join(5)
+        assert result == [job]
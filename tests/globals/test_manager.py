@@ -18,12 +18,22 @@ from pyqcy import *
 import bottle
 from hashlib import sha1
 from novaclient.v2 import client
+import datetime
+import os
+import socket
+import tempfile
 import time
 import subprocess
+import threading
 
 import neat.globals.manager as manager
+import neat.globals.forecast as forecast
+import neat.globals.jobs as jobs
+import neat.globals.migration as migration
+import neat.globals.server as server
 import neat.common as common
 import neat.db_utils as db_utils
+import neat.metrics as metrics
 
 import logging
 logging.disable(logging.CRITICAL)
@@ -159,9 +169,11 @@ class GlobalManager(TestCase):
         with MockTransaction:
             app = mock('app')
             db = mock('db')
+            power = mock('power')
             hosts = ['host1', 'host2']
             state = {'property': 'value',
                      'db': db,
+                     'power': power,
                      'compute_hosts': hosts,
                      'host_macs': {}}
             config = {
@@ -169,6 +181,8 @@ class GlobalManager(TestCase):
                 'log_level': 2,
                 'global_manager_host': 'localhost',
                 'global_manager_port': 8080,
+                'global_manager_server': 'threaded',
+                'global_manager_keepalive_timeout': '15',
                 'ether_wake_interface': 'eth0'}
             paths = [manager.DEFAILT_CONFIG_PATH, manager.CONFIG_PATH]
             fields = manager.REQUIRED_FIELDS
@@ -177,9 +191,25 @@ class GlobalManager(TestCase):
             expect(common).init_logging('dir', 'global-manager.log', 2).once()
             expect(manager).init_state(config). \
                 and_return(state).once()
-            expect(manager).switch_hosts_on(db, 'eth0', {}, hosts).once()
+            expect(manager).switch_hosts_on(
+                db, power, 'eth0', {}, hosts).once()
+            expect(manager).start_worker(config, state).once()
             expect(bottle).app().and_return(app).once()
-            expect(bottle).run(host='localhost', port=8080).once()
+            expect(bottle).run(server=server.ThreadingServer,
+                               host='localhost', port=8080,
+                               keepalive_timeout=15.).once()
+            manager.start()
+
+        config['global_manager_server'] = 'wsgiref'
+        with MockTransaction:
+            expect(manager).read_and_validate_config.and_return(config)
+            expect(common).init_logging
+            expect(manager).init_state.and_return(state)
+            expect(manager).switch_hosts_on
+            expect(manager).start_worker
+            expect(bottle).app().and_return(app)
+            expect(bottle).run(server='wsgiref',
+                               host='localhost', port=8080).once()
             manager.start()
 
     def test_init_state(self):
@@ -192,8 +222,19 @@ class GlobalManager(TestCase):
                       'os_admin_password': 'password',
                       'os_admin_tenant_name': 'tenant',
                       'os_auth_url': 'url',
-                      'compute_hosts': 'host1, host2'}
+                      'compute_hosts': 'host1, host2',
+                      'cluster_model_ttl': '600',
+                      'power_probe_port': '22',
+                      'power_probe_interval': '2',
+                      'power_command_timeout': '60',
+                      'power_ready_timeout': '300',
+                      'forecast_period': '86400',
+                      'data_collector_interval': '300',
+                      'forecast_smoothing': '0.3'}
             expect(manager).init_db('db').and_return(db).once()
+            expect(db).select_host_macs().and_return({'host1': 'mac1'}).once()
+            expect(db).select_host_power_latencies(). \
+                and_return(({'host1': 10.}, {'host1': 20.})).once()
             expect(client).Client(
                 'user', 'password', 'tenant', 'url',
                 service_type='compute'). \
@@ -207,12 +248,28 @@ class GlobalManager(TestCase):
             assert state['hashed_username'] == sha1('user').hexdigest()
             assert state['hashed_password'] == sha1('password').hexdigest()
             assert state['compute_hosts'] == hosts
-            assert state['host_macs'] == {}
+            assert state['host_macs'] == {'host1': 'mac1'}
+            assert isinstance(state['jobs'], jobs.JobQueue)
+            assert not state['execution_lock'].locked()
+            assert isinstance(state['host_locks'], server.HostLocks)
+            assert state['request_times'] == {}
+            assert state['cluster'].nova == nova
+            assert state['cluster'].db == db
+            assert state['cluster'].ttl == 600
+            assert state['power'].probe_port == 22
+            assert state['power'].ready_timeout == 300
+            assert state['power'].resume_latencies == {'host1': 20.}
+            assert state['forecaster'].period == 86400
+            assert state['forecaster'].interval == 300
 
     def test_service(self):
         app = mock('app')
+        queue = jobs.JobQueue()
         state = {'hashed_username': 'user',
-                 'hashed_password': 'password'}
+                 'hashed_password': 'password',
+                 'jobs': queue,
+                 'host_locks': server.HostLocks(),
+                 'request_times': {}}
         config = {'global_manager_host': 'localhost',
                   'global_manager_port': 8080}
         app.state = {'state': state,
@@ -220,189 +277,760 @@ class GlobalManager(TestCase):
 
         with MockTransaction:
             params = {'reason': 0,
+                      'time': 10.,
                       'host': 'host'}
             expect(manager).get_params(Any).and_return(params).once()
             expect(manager).get_remote_addr(Any).and_return('addr').once()
             expect(bottle).app().and_return(app).once()
             expect(manager).validate_params('user', 'password', params). \
                 and_return(True).once()
-            expect(manager).execute_underload(config, state, 'host').once()
-            manager.service()
+            expect(manager).execute_underload.never()
+            response = manager.service()
+            assert response['status'] == jobs.PENDING
+            job = queue.status(response['job'])
+            assert job['host'] == 'host'
+            assert job['reason'] == 0
+            assert job['vm_uuids'] == []
 
         with MockTransaction:
             params = {'reason': 1,
+                      'time': 11.,
                       'host': 'host',
-                      'vm_uuids': 'vm_uuids'}
+                      'vm_uuids': ['vm1', 'vm2']}
             expect(manager).get_params(Any).and_return(params).once()
             expect(manager).get_remote_addr(Any).and_return('addr').once()
             expect(bottle).app().and_return(app).once()
             expect(manager).validate_params('user', 'password', params). \
                 and_return(True).once()
-            expect(manager).execute_overload(config, state, 'host', 'vm_uuids'). \
-                once()
-            manager.service()
-
-    @qc(20)
-    def vms_by_host(
-        x=dict_(
-            keys=str_(of='abc123-', min_length=36, max_length=36),
-            values=str_(of='abc123-', min_length=10, max_length=10),
-            min_length=0, max_length=3
-        ),
-        y=list_(str_(of='abc123-', min_length=36, max_length=36),
-                min_length=0, max_length=3),
-        host=str_(of='abc123-', min_length=5, max_length=5)
-    ):
-        with MockTransaction:
-            extra_vms = {}
-            for vm in y:
-                extra_vms[vm] = host
-            x.update(extra_vms)
-            vms = []
-            for vm_uuid, h in x.items():
-                vm = mock(vm_uuid)
-                vm.id = vm_uuid
-                expect(manager).vm_hostname(vm).and_return(h).once()
-                vms.append(vm)
-            nova = mock('nova')
-            nova.servers = mock('servers')
-            expect(nova.servers).list().and_return(vms).once()
-            assert set(manager.vms_by_host(nova, host)) == set(y)
-
-    @qc(1)
-    def vms_by_hosts(
-        x=list_(str_(of='abc123-', min_length=36, max_length=36),
-                min_length=0, max_length=3),
-        y=list_(str_(of='abc123-', min_length=36, max_length=36),
-                min_length=0, max_length=3),
-        host1=str_(of='abc123-', min_length=5, max_length=10),
-        host2=str_(of='abc123-', min_length=5, max_length=10)
-    ):
-        with MockTransaction:
-            vms1 = {}
-            for vm in x:
-                vms1[vm] = host1
-            vms2 = {}
-            for vm in y:
-                vms2[vm] = host2
-            vms_all = dict(vms1)
-            vms_all.update(vms2)
-            vms = []
-            for vm_uuid, h in vms_all.items():
-                vm = mock(vm_uuid)
-                vm.id = vm_uuid
-                expect(manager).vm_hostname(vm).and_return(h).once()
-                vms.append(vm)
-            nova = mock('nova')
-            nova.servers = mock('servers')
-            expect(nova.servers).list().and_return(vms).once()
-            result = manager.vms_by_hosts(nova, [host1, host2])
-            result_sets = {}
-            for host, data in result.items():
-                result_sets[host] = set(data)
-            assert result_sets == {host1: set(x), host2: set(y)}
+            expect(manager).execute_overload.never()
+            response2 = manager.service()
+            assert queue.status(response['job'])['status'] == jobs.REPLACED
+            job = queue.get(0)
+            assert job['id'] == response2['job']
+            assert job['vm_uuids'] == ['vm1', 'vm2']
 
-    def test_host_used_ram(self):
+        # A request older than the latest one of the host is rejected
         with MockTransaction:
-            hostname = 'hosthost'
-            nova = mock('nova')
-            nova.hosts = mock('hosts')
-            host1 = mock('host1')
-            host1.memory_mb = 4000
-            host2 = mock('host2')
-            host2.memory_mb = 3000
-            expect(nova.hosts).get(hostname). \
-                and_return([host1, host2]).once()
-            assert manager.host_used_ram(nova, hostname) == 3000
+            params = {'reason': 0,
+                      'time': 10.5,
+                      'host': 'host'}
+            expect(manager).get_params(Any).and_return(params).once()
+            expect(manager).get_remote_addr(Any).and_return('addr').once()
+            expect(bottle).app().and_return(app).once()
+            expect(manager).validate_params('user', 'password', params). \
+                and_return(True).once()
+            try:
+                manager.service()
+            except bottle.HTTPResponse as e:
+                assert e.status_code == 412
+            else:
+                assert False
+            assert queue.get(0) is None
+            assert state['request_times'] == {'host': 11.}
+
+    def test_validate_event(self):
+        now = time.time()
+        event = {'host': 'host', 'time': now, 'reason': 1,
+                 'vm_uuids': ['vm1'],
+                 'host_cpu_mhz': [100],
+                 'vm_cpu_mhz': {'vm1': [100, 200]}}
+        assert manager.validate_event(event) is None
+        assert manager.validate_event(
+            {'host': 'host', 'time': now, 'reason': 0}) is None
+        assert manager.validate_event(dict(event, time=now - 6)) == 412
+        for invalid in [[], dict(event, host=1), dict(event, time='1'),
+                        dict(event, reason=2), dict(event, vm_uuids=[]),
+                        dict(event, vm_uuids=[1]),
+                        dict(event, host_cpu_mhz=['1']),
+                        dict(event, host_cpu_mhz=[1.5]),
+                        dict(event, vm_cpu_mhz=[]),
+                        dict(event, vm_cpu_mhz={'vm1': 100}),
+                        dict(event, vm_cpu_mhz={'vm1': [None]}),
+                        dict(event, vm_cpu_mhz={'vm1': [1, 2.5]})]:
+            assert manager.validate_event(invalid) == 400
+
+    def test_submit_job(self):
+        queue = jobs.JobQueue()
+        state = {'jobs': queue,
+                 'host_locks': server.HostLocks(),
+                 'request_times': {}}
+        job1 = manager.submit_job(
+            state, {'host': 'h1', 'time': 10., 'reason': 0})
+        assert job1['vm_uuids'] == []
+        assert job1['data'] == {}
+        job2 = manager.submit_job(
+            state, {'host': 'h1', 'time': 12., 'reason': 1,
+                    'vm_uuids': ['vm1']}, {'vm_cpu_mhz': {'vm1': [1]}})
+        assert job1['status'] == jobs.REPLACED
+        assert job2['data'] == {'vm_cpu_mhz': {'vm1': [1]}}
+        # An older request of the host is out of date
+        assert manager.submit_job(
+            state, {'host': 'h1', 'time': 11., 'reason': 0}) is None
+        job3 = manager.submit_job(
+            state, {'host': 'h2', 'time': 11., 'reason': 0})
+        assert state['request_times'] == {'h1': 12., 'h2': 11.}
+        assert queue.get_all() == [job2, job3]
+
+    def test_job_status(self):
+        app = mock('app')
+        queue = jobs.JobQueue()
+        job = queue.put('host', 0, [])
+        app.state = {'state': {'hashed_username': 'user',
+                               'hashed_password': 'password',
+                               'jobs': queue},
+                     'config': {}}
 
         with MockTransaction:
-            hostname = 'hosthost'
-            nova = mock('nova')
-            nova.hosts = mock('hosts')
-            host1 = mock('host1')
-            host1.memory_mb = 4000
-            host2 = mock('host2')
-            host2.memory_mb = 3000
-            host3 = mock('host3')
-            host3.memory_mb = 3500
-            expect(nova.hosts).get(hostname). \
-                and_return([host1, host2, host3]).once()
-            assert manager.host_used_ram(nova, hostname) == 3500
-
-    def test_flavors_ram(self):
+            expect(bottle).app().and_return(app).twice()
+            expect(manager).validate_credentials(
+                'user', 'password', Any).and_return(True).twice()
+            assert manager.job_status(job['id'])['host'] == 'host'
+            try:
+                manager.job_status('unknown')
+            except bottle.HTTPResponse as e:
+                assert e.status_code == 404
+            else:
+                assert False
+
+    def test_process_jobs(self):
+        config = {'global_manager_coalescing_window': '0',
+                  'data_collector_interval': '300',
+                  'forecast_horizon': '0'}
+        queue = jobs.JobQueue()
+        state = {'jobs': queue,
+                 'execution_lock': threading.Lock()}
+        job1 = queue.put('host1', 0, [])
+        job2 = queue.put('host2', 0, [])
+
         with MockTransaction:
-            nova = mock('nova')
-            nova.flavors = mock('flavors')
-            fl1 = mock('fl1')
-            fl1.id = '1'
-            fl1.ram = 1000
-            fl2 = mock('fl2')
-            fl2.id = '2'
-            fl2.ram = 2000
-            expect(nova.flavors).list().and_return([fl1, fl2]).once()
-            assert manager.flavors_ram(nova) == {'1': 1000, '2': 2000}
-
-    def test_vms_ram_limit(self):
+            expect(manager).execute_jobs(config, state, [job1, job2]).once()
+            manager.process_jobs(config, state, 1)
+
+        config = {'global_manager_coalescing_window': '0.2',
+                  'data_collector_interval': '300',
+                  'forecast_horizon': '0'}
+        job1 = queue.put('host1', 0, [])
+        result = []
+
+        def execute_jobs(config, state, jobs):
+            result.append(jobs)
+
+        with MockTransaction:
+            expect(manager).execute_jobs.then_call(execute_jobs).once()
+            worker = threading.Thread(
+                target=manager.process_jobs, args=(config, state, 1))
+            worker.start()
+            job2 = queue.put('host2', 1, ['vm1'])
+            worker.join(5)
+            assert result == [[job1, job2]]
+
+        config = {'global_manager_coalescing_window': '0',
+                  'data_collector_interval': '0.05',
+                  'forecast_horizon': '1800'}
+
+        with MockTransaction:
+            expect(manager).prewake_hosts(config, state). \
+                and_return([]).at_least(2).times()
+            expect(manager).execute_jobs.then_call(execute_jobs).once()
+            worker = threading.Thread(
+                target=manager.process_jobs, args=(config, state, 1))
+            worker.start()
+            time.sleep(0.12)
+            job = queue.put('host1', 1, ['vm1'])
+            worker.join(5)
+            assert not worker.is_alive()
+            assert result[-1] == [job]
+
+    def test_execute_jobs(self):
+        config = {'option': 'value'}
+
+        with MockTransaction:
+            queue = jobs.JobQueue()
+            state = {'jobs': queue, 'execution_lock': threading.Lock()}
+            job1 = queue.put('host1', 0, [])
+            job2 = queue.put('host2', 1, ['vm1'])
+            job3 = queue.put('host3', 0, [])
+            batch = queue.get_all()
+            job4 = queue.put('host3', 1, ['vm2'],
+                             {'vm_cpu_mhz': {'vm2': [100]}})
+            batch.append(queue.get(0))
+            expect(manager).execute_joint(
+                config, state, ['host1'],
+                {'host2': ['vm1'], 'host3': ['vm2']},
+                {'host3': {'vm_cpu_mhz': {'vm2': [100]}}}). \
+                and_return(state).once()
+            manager.execute_jobs(config, state, batch)
+            assert job1['status'] == jobs.COMPLETED
+            assert job2['status'] == jobs.COMPLETED
+            assert job3['status'] == jobs.REPLACED
+            assert job3['replaced_by'] == job4['id']
+            assert job4['status'] == jobs.COMPLETED
+
+        with MockTransaction:
+            queue = jobs.JobQueue()
+            state = {'jobs': queue, 'execution_lock': threading.Lock()}
+            job = queue.put('host1', 1, ['vm1'])
+            expect(manager).execute_joint(
+                config, state, [], {'host1': ['vm1']}, {}). \
+                and_raise(ValueError('error')).once()
+            manager.execute_jobs(config, state, queue.get_all())
+            assert job['status'] == jobs.FAILED
+            assert job['error'] == 'error'
+
+    def test_execute_underload_overload(self):
+        config = {'option': 'value'}
+        state = {'property': 'value'}
+
+        with MockTransaction:
+            expect(manager).execute_joint(config, state, ['host'], {}). \
+                and_return(state).once()
+            assert manager.execute_underload(config, state, 'host') == state
+
+        with MockTransaction:
+            expect(manager).execute_joint(
+                config, state, [], {'host': ['vm1']}). \
+                and_return(state).once()
+            assert manager.execute_overload(
+                config, state, 'host', ['vm1']) == state
+
+    def test_execute_joint(self):
+        config = {
+            'algorithm_vm_placement_factory':
+                'neat.globals.vm_placement.bin_packing.' +
+                'best_fit_decreasing_factory',
+            'algorithm_vm_placement_parameters':
+                '{"cpu_threshold": 0.8, "ram_threshold": 0.95, ' +
+                '"last_n_vm_cpu": 1}',
+            'data_collector_interval': '300',
+            'data_collector_data_length': '10',
+            'network_migration_bandwidth': '10',
+            'ether_wake_interface': 'eth0',
+            'vm_instance_directory': 'dir',
+            'block_migration': '',
+            'sleep_command': 'sleep',
+            'migration_max_per_source': '1',
+            'migration_max_per_destination': '2',
+            'migration_max_total': '4',
+            'forecast_horizon': '0'}
+        hosts = ['h1', 'h2', 'h3', 'h4']
+
+        with MockTransaction:
+            db = mock('db')
+            cluster = mock('cluster')
+            power = mock('power')
+            state = {'db': db,
+                     'nova': mock('nova'),
+                     'cluster': cluster,
+                     'power': power,
+                     'compute_hosts': ['h1', 'h2', 'h3'],
+                     'host_macs': {}}
+            expect(cluster).host_characteristics().and_return((
+                dict((x, 3000) for x in hosts),
+                dict((x, 4) for x in hosts),
+                dict((x, 4096) for x in hosts))).once()
+            expect(cluster).vms_by_hosts(['h1', 'h2', 'h3']).and_return({
+                'h1': ['vm1'], 'h2': ['vm2'], 'h3': ['vm3']}).once()
+            expect(db).select_last_cpu_mhz_for_vms().and_return({
+                'vm1': 100, 'vm2': 100, 'vm3': 100}).once()
+            expect(db).select_last_cpu_mhz_for_hosts().and_return(
+                dict((x, 100) for x in hosts)).once()
+            expect(cluster).host_used_ram('h3').and_return(1024).once()
+            expect(cluster).vms_ram_limit. \
+                and_return({'vm1': 1024, 'vm2': 1024}).once()
+            expect(db).select_cpu_mhz_for_vm.and_return([100]).twice()
+            expect(db).select_inactive_hosts().and_return([]).once()
+            expect(manager).migrate_vms.and_return(['vm2']).once()
+            expect(cluster).record_migrations(
+                {'vm1': 'h3'}).once()
+            expect(manager).switch_hosts_off(
+                db, power, 'sleep', ['h1']).once()
+            expect(manager).record_power_latencies(db, power).once()
+            manager.execute_joint(config, state, ['h1', 'h2'], {})
+
+        # The history of vm1 is either read from the DB or reported by h1,
+        # the VMs placed on a host that cannot be woken are not migrated
+        for vm1_cpu, placement, hosts_to_activate, activated, reported in [
+                (1000, {'vm1': 'h3', 'vm3': 'h3'}, [], [], None),
+                (2000, {'vm1': 'h4', 'vm3': 'h3'}, ['h4'], ['h4'], None),
+                (2000, {'vm1': 'h4', 'vm3': 'h3'}, ['h4'], ['h4'],
+                 {'h1': {'host_cpu_mhz': [100],
+                         'vm_cpu_mhz': {'vm1': [5, 2000]}}}),
+                (2000, {'vm1': 'h4', 'vm3': 'h3'}, ['h4'], [], None)]:
+            migrated = dict((vm, host) for vm, host in placement.items()
+                            if host in activated or
+                            host not in hosts_to_activate)
+            with MockTransaction:
+                db = mock('db')
+                nova = mock('nova')
+                cluster = mock('cluster')
+                power = mock('power')
+                state = {'db': db,
+                         'nova': nova,
+                         'cluster': cluster,
+                         'power': power,
+                         'compute_hosts': hosts,
+                         'host_macs': {}}
+                expect(cluster).host_characteristics().and_return((
+                    dict((x, 3000) for x in hosts),
+                    dict((x, 4) for x in hosts),
+                    dict((x, 4096) for x in hosts))).once()
+                expect(cluster).vms_by_hosts(hosts).and_return({
+                    'h1': ['vm1', 'vm2'],
+                    'h2': ['vm3'],
+                    'h3': ['vm4'],
+                    'h4': []}).once()
+                expect(db).select_last_cpu_mhz_for_vms().and_return({
+                    'vm1': 100 if reported else vm1_cpu,
+                    'vm2': 1000,
+                    'vm3': 500,
+                    'vm4': 500}).once()
+                expect(db).select_last_cpu_mhz_for_hosts().and_return(
+                    dict((x, 100) for x in hosts)).once()
+                expect(cluster).host_used_ram('h3'). \
+                    and_return(1024).once()
+                expect(cluster).vms_ram_limit(['vm1', 'vm3']). \
+                    and_return({'vm1': 1024, 'vm3': 1024}).once()
+                if reported:
+                    expect(db).select_cpu_mhz_for_vm('vm1', 10).never()
+                else:
+                    expect(db).select_cpu_mhz_for_vm('vm1', 10). \
+                        and_return([vm1_cpu]).once()
+                expect(db).select_cpu_mhz_for_vm('vm3', 10). \
+                    and_return([500]).once()
+                expect(db).select_inactive_hosts().and_return(['h4']).once()
+                if hosts_to_activate:
+                    expect(manager).switch_hosts_on(
+                        db, power, 'eth0', {}, hosts_to_activate). \
+                        and_return(activated).once()
+                else:
+                    expect(manager).switch_hosts_on.never()
+                expect(manager).migrate_vms(
+                    config, state,
+                    [(migrated,
+                      dict((vm, {'vm1': 'h1', 'vm3': 'h2'}[vm])
+                           for vm in migrated),
+                      dict((vm, []) for vm in migrated))],
+                    {'vm1': 102.4, 'vm3': 102.4}).and_return([]).once()
+                expect(cluster).record_migrations(migrated).once()
+                expect(manager).switch_hosts_off(
+                    db, power, 'sleep', ['h2']).once()
+                expect(manager).record_power_latencies(db, power).once()
+                manager.execute_joint(config, state, ['h2'],
+                                      {'h1': ['vm1']}, reported)
+
+        # In the dry-run mode the actions are only reported
+        with MockTransaction:
+            db = mock('db')
+            cluster = mock('cluster')
+            power = mock('power')
+            state = {'db': db,
+                     'nova': mock('nova'),
+                     'cluster': cluster,
+                     'power': power,
+                     'compute_hosts': hosts,
+                     'host_macs': {}}
+            expect(cluster).host_characteristics().and_return((
+                dict((x, 3000) for x in hosts),
+                dict((x, 4) for x in hosts),
+                dict((x, 4096) for x in hosts))).once()
+            expect(cluster).vms_by_hosts(hosts).and_return({
+                'h1': ['vm1', 'vm2'],
+                'h2': ['vm3'],
+                'h3': ['vm4'],
+                'h4': []}).once()
+            expect(db).select_last_cpu_mhz_for_vms().and_return({
+                'vm1': 2000, 'vm2': 1000, 'vm3': 500, 'vm4': 500}).once()
+            expect(db).select_last_cpu_mhz_for_hosts().and_return(
+                dict((x, 100) for x in hosts)).once()
+            expect(cluster).host_used_ram('h3').and_return(1024).once()
+            expect(cluster).vms_ram_limit(['vm1', 'vm3']). \
+                and_return({'vm1': 1024, 'vm3': 1024}).once()
+            expect(db).select_cpu_mhz_for_vm('vm1', 10). \
+                and_return([2000]).once()
+            expect(db).select_cpu_mhz_for_vm('vm3', 10). \
+                and_return([500]).once()
+            expect(db).select_inactive_hosts().and_return(['h4']).once()
+            expect(manager).switch_hosts_on.never()
+            expect(manager).migrate_vms.never()
+            expect(cluster).record_migrations.never()
+            expect(manager).switch_hosts_off.never()
+            expect(manager).record_power_latencies.never()
+            expect(metrics).observe.never()
+            report = {}
+            manager.execute_joint(config, state, ['h2'],
+                                  {'h1': ['vm1']}, None, report)
+            placement = {'vm1': 'h4', 'vm3': 'h3'}
+            assert report['placement'] == placement
+            assert report['plan'] == [
+                (placement, {'vm1': 'h1', 'vm3': 'h2'},
+                 {'vm1': [], 'vm3': []})]
+            assert report['unplanned'] == []
+            assert report['hosts_to_activate'] == ['h4']
+            assert report['hosts_to_deactivate'] == ['h2']
+            assert sorted(report['timings'].keys()) == \
+                sorted(manager.PHASES + ['total'])
+            assert report['timings']['migration'] == 0.
+            assert report['timings']['total'] >= \
+                report['timings']['placement']
+
+    def test_dry_run(self):
+        lock = threading.Lock()
+        db = db_utils.init_db('sqlite:///:memory:')
+        state = {'db': db,
+                 'execution_lock': lock,
+                 'vm_placement_state': {'history': [1]}}
+        config = {'option': 'value'}
+
+        def execute_joint(config, snapshot, underloaded_hosts,
+                          overloaded_vms, reported, report):
+            assert (underloaded_hosts, overloaded_vms) == (['h1'], {})
+            assert reported is None
+            assert report == {}
+            # A snapshot of the state is used with a separate connection
+            assert snapshot is not state
+            assert snapshot['execution_lock'] is lock
+            assert snapshot['db'].connection is not db.connection
+            assert snapshot['db'].hosts is db.hosts
+            snapshot['vm_placement_state']['history'].append(2)
+            report['placement'] = {'vm1': 'h2'}
+
+        # The dry run does not wait for a running job
+        with lock:
+            with MockTransaction:
+                expect(manager).execute_joint. \
+                    and_call(execute_joint).once()
+                assert manager.dry_run(config, state, 'h1', 0, []) == \
+                    {'placement': {'vm1': 'h2'}}
+                # The state of the placement algorithm is not modified
+                assert state['vm_placement_state'] == {'history': [1]}
+                assert state['db'] is db
+
         with MockTransaction:
+            expect(manager).execute_joint(
+                config, Any, [], {'h1': ['vm1']}, None, {}). \
+                and_raise(ValueError('error')).once()
+            try:
+                manager.dry_run(config, state, 'h1', 1, ['vm1'])
+            except ValueError:
+                pass
+            else:
+                assert False
+            assert not lock.locked()
+
+    def test_timings(self):
+        timings = {}
+        with manager.timed(timings, 'db'):
+            time.sleep(0.01)
+        with manager.timed(timings, 'db'):
+            time.sleep(0.01)
+        assert 0.02 <= timings['db'] < 1
+        try:
+            with manager.timed(timings, 'nova'):
+                raise ValueError()
+        except ValueError:
+            pass
+        assert 'nova' in timings
+        with MockTransaction:
+            expect(metrics).observe.never()
+            manager.log_timings(timings, time.time() - 1, False)
+        assert 1 <= timings['total'] < 2
+
+        # Only the measured phases are recorded in the metrics
+        timings = {'db': 0.5, 'plan': 0.25}
+        with MockTransaction:
+            expect(metrics).observe(
+                'neat_phase_seconds', 0.5, {'phase': 'db'}).once()
+            expect(metrics).observe(
+                'neat_phase_seconds', 0.25, {'phase': 'plan'}).once()
+            manager.log_timings(timings, time.time(), True)
+
+    def test_update_forecast(self):
+        forecaster = forecast.DemandForecaster(86400, 300, 0.5)
+        state = {'forecaster': forecaster}
+        t = datetime.datetime(2012, 1, 1)
+
+        with MockTransaction:
+            state['db'] = mock('db')
+            expect(state['db']).select_cpu_mhz_since(0, 0).and_return((
+                [(1, 1, t, 100), (2, 1, t + datetime.timedelta(0, 600), 50)],
+                [(7, 5, t, 200), (8, 6, t, 300)])).once()
+            manager.update_forecast(state)
+            assert forecaster.host_usage_id == 2
+            assert forecaster.vm_usage_id == 8
+            assert forecaster.current == 600.
+
+            expect(state['db']).select_cpu_mhz_since(2, 8). \
+                and_return(([], [])).once()
+            manager.update_forecast(state)
+            assert forecaster.host_usage_id == 2
+            assert forecaster.vm_usage_id == 8
+
+    def test_forecast_required_cpu(self):
+        forecaster = forecast.DemandForecaster(86400, 300, 0.5)
+        state = {'forecaster': forecaster}
+        config = {'forecast_horizon': '1800',
+                  'host_cpu_overload_threshold': '0.8'}
+        assert manager.forecast_required_cpu(config, state) is None
+        forecaster.observe([(0, 'h1', 800), (600, 'h1', 800)])
+        assert manager.forecast_required_cpu(config, state) == 1000.
+        config['forecast_horizon'] = '0'
+        assert manager.forecast_required_cpu(config, state) is None
+
+    def test_prewake_hosts(self):
+        config = {'ether_wake_interface': 'eth0'}
+
+        with MockTransaction:
+            db = mock('db')
+            cluster = mock('cluster')
+            power = mock('power')
+            state = {'db': db, 'cluster': cluster, 'power': power,
+                     'compute_hosts': ['h1', 'h2', 'h3', 'h4'],
+                     'host_macs': {}}
+            expect(manager).update_forecast(state).once()
+            expect(manager).forecast_required_cpu(config, state). \
+                and_return(5000.).once()
+            expect(cluster).host_characteristics().and_return((
+                {'h1': 2000, 'h2': 2000, 'h3': 1000, 'h4': 2000},
+                {}, {})).once()
+            expect(db).select_inactive_hosts(). \
+                and_return(['h2', 'h3', 'h4', 'h5']).once()
+            expect(manager).switch_hosts_on(
+                db, power, 'eth0', {}, ['h2', 'h4']). \
+                and_return(['h4']).once()
+            assert manager.prewake_hosts(config, state) == ['h4']
+
+        with MockTransaction:
+            state = {'db': mock('db'), 'cluster': mock('cluster')}
+            expect(manager).update_forecast(state).once()
+            expect(manager).forecast_required_cpu(config, state). \
+                and_return(None).once()
+            expect(manager).switch_hosts_on.never()
+            assert manager.prewake_hosts(config, state) == []
+
+    def test_forecast_hosts_to_keep(self):
+        config = {'option': 'value'}
+        state = {'compute_hosts': ['h1', 'h2', 'h3', 'h4', 'h5']}
+        hosts_cpu = {'h1': 2000, 'h2': 2000, 'h3': 1000,
+                     'h4': 3000, 'h5': 2000}
+
+        with MockTransaction:
+            expect(manager).forecast_required_cpu(config, state). \
+                and_return(4500.).once()
+            assert manager.forecast_hosts_to_keep(
+                config, state, ['h3', 'h4'], hosts_cpu, set(['h5'])) == \
+                ['h4']
+
+        with MockTransaction:
+            expect(manager).forecast_required_cpu(config, state). \
+                and_return(None).once()
+            assert manager.forecast_hosts_to_keep(
+                config, state, ['h3', 'h4'], hosts_cpu, set(['h5'])) == []
+
+        with MockTransaction:
+            expect(manager).forecast_required_cpu.never()
+            assert manager.forecast_hosts_to_keep(
+                config, state, [], hosts_cpu, set()) == []
+
+    def test_migrate_vms(self):
+        config = {'option': 'value'}
+        state = {'property': 'value'}
+        times = {'vm1': 10., 'vm2': 20., 'vm3': 30.}
+        phase1 = ({'vm1': 'h3', 'vm2': 'h4', 'vm3': 'h4'},
+                  {'vm1': 'h1', 'vm2': 'h2', 'vm3': 'h4'},
+                  {'vm1': [], 'vm2': ['vm3'], 'vm3': []})
+        phase2 = ({'vm1': 'h2', 'vm3': 'h1'},
+                  {'vm1': 'h3', 'vm3': 'h4'},
+                  {'vm1': [], 'vm3': []})
+
+        with MockTransaction:
+            expect(manager).migrate_phase(
+                config, state, phase1[0], phase1[1], phase1[2], times). \
+                and_return(['vm1']).once()
+            expect(manager).migrate_phase(
+                config, state, {'vm3': 'h1'}, phase2[1], phase2[2], times). \
+                and_return(['vm3']).once()
+            assert manager.migrate_vms(
+                config, state, [phase1, phase2], times) == ['vm1', 'vm3']
+
+    def test_migrate_phase(self):
+        config = {'vm_instance_directory': 'dir',
+                  'block_migration': '',
+                  'migration_max_per_source': '1',
+                  'migration_max_per_destination': '2',
+                  'migration_max_total': '4',
+                  'migration_poll_interval_min': '1',
+                  'migration_poll_interval_max': '10',
+                  'migration_timeout': '300',
+                  'migration_retries': '2'}
+        placement = {'vm1': 'h3', 'vm2': 'h4'}
+        sources = {'vm1': 'h1', 'vm2': 'h2'}
+        dependencies = {'vm1': [], 'vm2': ['vm1']}
+        times = {'vm1': 10., 'vm2': 20.}
+
+        with MockTransaction:
+            db = mock('db')
             nova = mock('nova')
-            nova.servers = mock('servers')
-            flavors_to_ram = {'1': 512, '2': 1024}
-            expect(manager).flavors_ram(nova). \
-                and_return(flavors_to_ram).once()
-
-            vm1 = mock('vm1')
-            vm1.flavor = {'id': '1'}
-            vm2 = mock('vm2')
-            vm2.flavor = {'id': '2'}
-            expect(nova.servers).get('vm1').and_return(vm1).once()
-            expect(nova.servers).get('vm2').and_return(vm2).once()
-            assert manager.vms_ram_limit(nova, ['vm1', 'vm2']) == \
-                {'vm1': 512, 'vm2': 1024}
+            power = mock('power')
+            state = {'db': db, 'nova': nova, 'power': power}
+            expect(migration).schedule_migrations(
+                nova, placement, sources, times, 1, 2, 4,
+                any_, 1., 10., 300., dependencies, power.is_ready). \
+                and_return(({'vm1': 9.}, ['vm2'])).once()
+            expect(migration).schedule_migrations(
+                nova, {'vm2': 'h4'}, sources, times, 1, 2, 4,
+                any_, 1., 10., 300., {'vm2': []}, power.is_ready). \
+                and_return(({'vm2': 21.}, [])).once()
+            expect(db).insert_vm_migration('vm1', 'h3').once()
+            expect(db).insert_vm_migration('vm2', 'h4').once()
+            assert manager.migrate_phase(
+                config, state, placement, sources, dependencies, times) == []
+
+        with MockTransaction:
+            db = mock('db')
+            state = {'db': db, 'nova': mock('nova'), 'power': mock('power')}
+            expect(migration).schedule_migrations. \
+                and_return(({}, ['vm2'])).exactly(3).times()
+            expect(db).insert_vm_migration.never()
+            assert manager.migrate_phase(
+                config, state, {'vm2': 'h4'}, sources, {}, times) == ['vm2']
 
     def test_switch_hosts_off(self):
         db = db_utils.init_db('sqlite:///:memory:')
 
         with MockTransaction:
-            expect(subprocess).call('ssh h1 "sleep"', shell=True).once()
-            expect(subprocess).call('ssh h2 "sleep"', shell=True).once()
-            expect(db).insert_host_states({
-                    'h1': 0,
-                    'h2': 0}).once()
-            manager.switch_hosts_off(db, 'sleep', ['h1', 'h2'])
+            power = mock('power')
+            expect(power).suspend({'h1': 'ssh h1 "sleep"',
+                                   'h2': 'ssh h2 "sleep"'}). \
+                and_return(['h1']).once()
+            expect(db).insert_host_states({'h1': 0}).once()
+            manager.switch_hosts_off(db, power, 'sleep', ['h1', 'h2'])
 
         with MockTransaction:
-            expect(subprocess).call.never()
+            power = mock('power')
+            expect(power).suspend.and_return([]).once()
+            expect(db).insert_host_states.never()
+            manager.switch_hosts_off(db, power, 'sleep', ['h1'])
+
+        with MockTransaction:
+            power = mock('power')
+            expect(power).suspend.never()
             expect(db).insert_host_states({
                     'h1': 0,
                     'h2': 0}).once()
-            manager.switch_hosts_off(db, '', ['h1', 'h2'])
+            manager.switch_hosts_off(db, power, '', ['h1', 'h2'])
 
     def test_switch_hosts_on(self):
         db = db_utils.init_db('sqlite:///:memory:')
+        commands = dict(
+            (host, '{0} -i eth0 {1}'.format(manager.etherwake, mac))
+            for host, mac in [('h1', 'mac1'), ('h2', 'mac2')])
 
         with MockTransaction:
-            expect(subprocess).call(any_of(['ether-wake -i eth0 mac1',
-                                            'etherwake -i eth0 mac1']),
-                                    shell=True).once()
-            expect(subprocess).call(any_of(['ether-wake -i eth0 mac2',
-                                            'etherwake -i eth0 mac2']),
-                                    shell=True).once()
-            expect(manager).host_mac('h1').and_return('mac1').once()
+            power = mock('power')
+            host_macs = {'h1': 'mac1', 'h2': 'mac2'}
+            expect(manager).resolve_host_macs(
+                db, host_macs, ['h1', 'h2']).and_return([]).once()
+            expect(power).wake(commands).once()
             expect(db).insert_host_states({
                     'h1': 1,
                     'h2': 1}).once()
-            manager.switch_hosts_on(db, 'eth0', {'h2': 'mac2'}, ['h1', 'h2'])
+            assert manager.switch_hosts_on(db, power, 'eth0', host_macs,
+                                           ['h1', 'h2']) == ['h1', 'h2']
 
+        # The hosts with unknown MAC addresses are not recorded as active
         with MockTransaction:
-            expect(subprocess).call(any_of(['ether-wake -i eth0 mac1',
-                                            'etherwake -i eth0 mac1']),
-                                    shell=True).once()
-            expect(subprocess).call(any_of(['ether-wake -i eth0 mac2',
-                                            'etherwake -i eth0 mac2']),
-                                    shell=True).once()
-            expect(manager).host_mac('h1').and_return('mac1').once()
-            expect(manager).host_mac('h2').and_return('mac2').once()
-            expect(db).insert_host_states({
-                    'h1': 1,
-                    'h2': 1}).once()
-            manager.switch_hosts_on(db, 'eth0', {}, ['h1', 'h2'])
+            power = mock('power')
+            host_macs = {'h1': 'mac1'}
+            expect(manager).resolve_host_macs(
+                db, host_macs, ['h1', 'h2']).and_return(['h2']).once()
+            expect(power).wake({'h1': commands['h1']}).once()
+            expect(db).insert_host_states({'h1': 1}).once()
+            assert manager.switch_hosts_on(db, power, 'eth0', host_macs,
+                                           ['h1', 'h2']) == ['h1']
+
+    def test_arp_table(self):
+        path = os.path.join(tempfile.mkdtemp(), 'arp')
+        with open(path, 'w') as f:
+            f.write(
+                'IP address       HW type     Flags       HW address' +
+                '            Mask     Device\n' +
+                '10.0.0.1         0x1         0x2         ' +
+                '00:11:22:33:44:55     *        eth0\n' +
+                '10.0.0.2         0x1         0x0         ' +
+                '00:00:00:00:00:00     *        eth0\n' +
+                '10.0.0.3         0x1         0x2         ' +
+                '66:77:88:99:aa:bb     *        eth0\n')
+        assert manager.arp_table(path) == {
+            '10.0.0.1': '00:11:22:33:44:55',
+            '10.0.0.3': '66:77:88:99:aa:bb'}
+        assert manager.arp_table(path + '-missing') == {}
+
+    def test_discover_host_macs(self):
+        ips = {'h1': '10.0.0.1', 'h2': '10.0.0.2', 'h3': '10.0.0.3'}
+
+        def gethostbyname(host):
+            if host not in ips:
+                raise socket.gaierror('unknown')
+            return ips[host]
+
+        with MockTransaction:
+            expect(socket).gethostbyname.and_call(gethostbyname)
+            tables = [{'10.0.0.1': 'mac1'},
+                      {'10.0.0.1': 'mac1', '10.0.0.3': 'mac3'}]
+            expect(manager).arp_table(manager.ARP_TABLE). \
+                and_call(lambda path: tables.pop(0)).twice()
+            ping = mock('ping')
+            expect(ping).wait().twice()
+            expect(subprocess).Popen.and_return(ping).twice()
+            assert manager.discover_host_macs(['h1', 'h2', 'h3', 'h4']) == \
+                {'h1': 'mac1', 'h3': 'mac3'}
+
+        with MockTransaction:
+            expect(socket).gethostbyname.and_call(gethostbyname)
+            expect(manager).arp_table(manager.ARP_TABLE). \
+                and_return({'10.0.0.1': 'mac1'}).once()
+            expect(subprocess).Popen.never()
+            assert manager.discover_host_macs(['h1']) == {'h1': 'mac1'}
+
+    def test_resolve_host_macs(self):
+        db = db_utils.init_db('sqlite:///:memory:')
+
+        with MockTransaction:
+            host_macs = {'h1': 'mac1'}
+            expect(db).select_host_macs.never()
+            expect(manager).discover_host_macs.never()
+            assert manager.resolve_host_macs(db, host_macs, ['h1']) == []
+
+        with MockTransaction:
+            host_macs = {'h1': 'mac1'}
+            expect(db).select_host_macs(). \
+                and_return({'h1': 'mac1', 'h2': 'mac2'}).once()
+            expect(manager).discover_host_macs(['h3', 'h4']). \
+                and_return({'h3': 'mac3'}).once()
+            expect(db).update_host_macs({'h3': 'mac3'}).once()
+            assert manager.resolve_host_macs(
+                db, host_macs, ['h1', 'h2', 'h3', 'h4']) == ['h4']
+            assert host_macs == {'h1': 'mac1', 'h2': 'mac2', 'h3': 'mac3'}
+
+    def test_record_power_latencies(self):
+        db = db_utils.init_db('sqlite:///:memory:')
+
+        with MockTransaction:
+            power = mock('power')
+            expect(power).pop_latencies(). \
+                and_return([('h1', 0, 10.), ('h2', 1, 20.)]).once()
+            expect(db).insert_host_power_latency('h1', 0, 10.).once()
+            expect(db).insert_host_power_latency('h2', 1, 20.).once()
+            expect(db).select_host_power_latencies(). \
+                and_return(({'h1': 10.}, {'h2': 20.})).once()
+            expect(power).set_resume_latencies({'h2': 20.}).once()
+            manager.record_power_latencies(db, power)
+
+        # Only new resume latencies update the power manager
+        with MockTransaction:
+            power = mock('power')
+            expect(power).pop_latencies(). \
+                and_return([('h1', 0, 10.)]).once()
+            expect(db).insert_host_power_latency('h1', 0, 10.).once()
+            expect(power).set_resume_latencies.never()
+            manager.record_power_latencies(db, power)
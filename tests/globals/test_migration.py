@@ -0,0 +1,264 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import time
+
+import neat.globals.migration as migration
+
+
+class Server(object):
+
+    def __init__(self, id, host, status):
+        self.id = id
+        setattr(self, 'OS-EXT-SRV-ATTR:host', host)
+        self.status = status
+
+
+class FakeNova(object):
+    """ Simulates live migrations taking the specified durations.
+    """
+
+    def __init__(self, sources, durations, errors=()):
+        self.servers = self
+        self.sources = sources
+        self.durations = durations
+        self.errors = errors
+        self.started = {}
+        self.order = []
+        self.polls = 0
+        self.max_total = 0
+        self.max_per_source = 0
+        self.max_per_destination = 0
+
+    def in_flight(self):
+        now = time.time()
+        return dict((vm, host) for vm, (host, start) in self.started.items()
+                    if now - start < self.durations[vm])
+
+    def start(self, vm, host):
+        self.started[vm] = (host, time.time())
+        self.order.append(vm)
+        in_flight = self.in_flight()
+        self.max_total = max(self.max_total, len(in_flight))
+        for vm_host in set(in_flight.values()):
+            self.max_per_destination = max(
+                self.max_per_destination,
+                in_flight.values().count(vm_host))
+        sources = [self.sources[x] for x in in_flight]
+        for source in set(sources):
+            self.max_per_source = max(self.max_per_source,
+                                      sources.count(source))
+
+    def server(self, vm):
+        if vm in self.errors:
+            return Server(vm, self.sources[vm], u'ERROR')
+        host, start = self.started[vm]
+        if time.time() - start < self.durations[vm]:
+            return Server(vm, self.sources[vm], u'MIGRATING')
+        return Server(vm, host, u'ACTIVE')
+
+    def list(self, search_opts):
+        assert 'changes-since' in search_opts
+        self.polls += 1
+        return [self.server(vm) for vm in self.started]
+
+
+class Migration(TestCase):
+
+    def test_estimate_migration_times(self):
+        assert migration.estimate_migration_times(
+            {'vm1': 1024, 'vm2': 512}, 10.) == {'vm1': 102.4, 'vm2': 51.2}
+        assert migration.estimate_migration_times({}, 10.) == {}
+
+    def test_schedule_migrations_limits(self):
+        sources = {'vm1': 'h1', 'vm2': 'h1', 'vm3': 'h2',
+                   'vm4': 'h2', 'vm5': 'h3', 'vm6': 'h3'}
+        placement = {'vm1': 'h4', 'vm2': 'h5', 'vm3': 'h4',
+                     'vm4': 'h5', 'vm5': 'h6', 'vm6': 'h6'}
+        durations = {'vm1': 0.03, 'vm2': 0.02, 'vm3': 0.01,
+                     'vm4': 0.04, 'vm5': 0.02, 'vm6': 0.01}
+        nova = FakeNova(sources, durations)
+        completed, failed = migration.schedule_migrations(
+            nova, placement, sources, durations, 1, 1, 2,
+            nova.start, 0.002, 0.002, 10)
+        assert failed == []
+        assert set(completed.keys()) == set(placement.keys())
+        assert nova.max_total <= 2
+        assert nova.max_per_source <= 1
+        assert nova.max_per_destination <= 1
+        assert nova.order[0] == 'vm3'
+        assert nova.order[1] == 'vm6'
+
+    def test_schedule_migrations_concurrency(self):
+        sources = {'vm1': 'h1', 'vm2': 'h2', 'vm3': 'h3'}
+        placement = {'vm1': 'h4', 'vm2': 'h5', 'vm3': 'h6'}
+        durations = {'vm1': 0.05, 'vm2': 0.05, 'vm3': 0.05}
+        nova = FakeNova(sources, durations)
+        start = time.time()
+        completed, failed = migration.schedule_migrations(
+            nova, placement, sources, durations, 1, 1, 3,
+            nova.start, 0.002, 0.002, 10)
+        assert time.time() - start < 0.14
+        assert nova.max_total == 3
+        assert set(completed.keys()) == set(placement.keys())
+        assert all(x >= 0.05 for x in completed.values())
+
+    def test_schedule_migrations_failures(self):
+        sources = {'vm1': 'h1', 'vm2': 'h2'}
+        placement = {'vm1': 'h3', 'vm2': 'h3'}
+        durations = {'vm1': 0.01, 'vm2': 0.01}
+        nova = FakeNova(sources, durations, errors=['vm1'])
+        completed, failed = migration.schedule_migrations(
+            nova, placement, sources, durations, 1, 2, 2,
+            nova.start, 0.002, 0.002, 10)
+        assert completed.keys() == ['vm2']
+        assert failed == ['vm1']
+
+        nova = FakeNova(sources, durations)
+        with MockTransaction:
+            expect(nova).list.and_call(
+                lambda search_opts: [Server(vm, sources[vm], u'ACTIVE')
+                                     for vm in nova.started])
+            completed, failed = migration.schedule_migrations(
+                nova, placement, sources, durations, 1, 2, 2,
+                nova.start, 0.002, 0.002, 0.01)
+        assert completed == {}
+        assert sorted(failed) == ['vm1', 'vm2']
+
+        def start(vm, host):
+            if vm == 'vm1':
+                raise ValueError('conflict')
+            nova.start(vm, host)
+
+        nova = FakeNova(sources, durations)
+        completed, failed = migration.schedule_migrations(
+            nova, placement, sources, durations, 1, 2, 2,
+            start, 0.002, 0.002, 10)
+        assert completed.keys() == ['vm2']
+        assert failed == ['vm1']
+
+    def test_schedule_migrations_dependencies(self):
+        sources = {'vm1': 'h1', 'vm2': 'h2', 'vm3': 'h3'}
+        placement = {'vm1': 'h2', 'vm2': 'h3', 'vm3': 'h4'}
+        durations = {'vm1': 0.01, 'vm2': 0.01, 'vm3': 0.02}
+        nova = FakeNova(sources, durations)
+        completed, failed = migration.schedule_migrations(
+            nova, placement, sources, durations, 2, 2, 3,
+            nova.start, 0.002, 0.002, 10,
+            {'vm1': ['vm2'], 'vm2': ['vm3'], 'vm3': []})
+        assert failed == []
+        assert nova.order == ['vm3', 'vm2', 'vm1']
+        assert nova.max_total == 1
+
+        nova = FakeNova(sources, durations, errors=['vm3'])
+        completed, failed = migration.schedule_migrations(
+            nova, placement, sources, durations, 2, 2, 3,
+            nova.start, 0.002, 0.002, 10,
+            {'vm1': ['vm2'], 'vm2': ['vm3'], 'vm3': []})
+        assert completed == {}
+        assert failed == ['vm3', 'vm2', 'vm1']
+        assert nova.order == ['vm3']
+
+    def test_schedule_migrations_host_ready(self):
+        sources = {'vm1': 'h1', 'vm2': 'h2', 'vm3': 'h3'}
+        placement = {'vm1': 'h4', 'vm2': 'h5', 'vm3': 'h6'}
+        durations = {'vm1': 0.01, 'vm2': 0.01, 'vm3': 0.01}
+        ready_at = time.time() + 0.05
+
+        def host_ready(host):
+            if host == 'h5':
+                return None if time.time() < ready_at else True
+            if host == 'h6':
+                return False
+            return True
+
+        nova = FakeNova(sources, durations)
+        completed, failed = migration.schedule_migrations(
+            nova, placement, sources, durations, 1, 1, 3,
+            nova.start, 0.002, 0.002, 10, None, host_ready)
+        assert sorted(completed.keys()) == ['vm1', 'vm2']
+        assert failed == ['vm3']
+        assert nova.order == ['vm1', 'vm2']
+        assert nova.started['vm2'][1] >= ready_at
+
+    def test_plan_migrations(self):
+        assert migration.plan_migrations({}, {}, {}, {}) == ([], [])
+
+        # Independent migrations form a single stage
+        placement = {'vm1': 'h3', 'vm2': 'h3', 'vm3': 'h4'}
+        sources = {'vm1': 'h1', 'vm2': 'h2', 'vm3': 'h2'}
+        vms_ram = {'vm1': 1024, 'vm2': 1024, 'vm3': 2048}
+        assert migration.plan_migrations(
+            placement, sources, vms_ram, {'h3': 2048, 'h4': 4096}) == \
+            ([(placement, sources, {'vm1': [], 'vm2': [], 'vm3': []})], [])
+
+        # vm1 can be moved to h2 only after vm2 has left it for h3
+        placement = {'vm1': 'h2', 'vm2': 'h3'}
+        sources = {'vm1': 'h1', 'vm2': 'h2'}
+        vms_ram = {'vm1': 1024, 'vm2': 2048}
+        assert migration.plan_migrations(
+            placement, sources, vms_ram,
+            {'h1': 0, 'h2': 512, 'h3': 4096}) == \
+            ([(placement, sources, {'vm1': ['vm2'], 'vm2': []})], [])
+
+        # A swap of VMs between full hosts goes through a temporary host
+        placement = {'vm1': 'h2', 'vm2': 'h1'}
+        sources = {'vm1': 'h1', 'vm2': 'h2'}
+        vms_ram = {'vm1': 1024, 'vm2': 1024}
+        assert migration.plan_migrations(
+            placement, sources, vms_ram,
+            {'h1': 0, 'h2': 0, 'h3': 1024, 'h4': 512}) == \
+            ([({'vm1': 'h3', 'vm2': 'h1'},
+               sources,
+               {'vm1': [], 'vm2': ['vm1']}),
+              ({'vm1': 'h2'}, {'vm1': 'h3'}, {'vm1': []})], [])
+
+        # Without a temporary host the cycle cannot be broken
+        assert migration.plan_migrations(
+            placement, sources, vms_ram, {'h1': 0, 'h2': 0, 'h3': 512}) == \
+            ([], ['vm1', 'vm2'])
+        assert migration.plan_migrations(
+            placement, sources, vms_ram,
+            {'h1': 0, 'h2': 0, 'h3': 1024}, False) == ([], ['vm1', 'vm2'])
+
+        # The capacity of unknown hosts is not restricted
+        assert migration.plan_migrations(
+            {'vm1': 'h2'}, {'vm1': 'h1'}, {'vm1': 1024}, {}) == \
+            ([({'vm1': 'h2'}, {'vm1': 'h1'}, {'vm1': []})], [])
+
+    def test_schedule_migrations_polls(self):
+        sources = {'vm1': 'h1', 'vm2': 'h2', 'vm3': 'h3'}
+        placement = {'vm1': 'h4', 'vm2': 'h5', 'vm3': 'h6'}
+        durations = {'vm1': 0.05, 'vm2': 0.05, 'vm3': 0.1}
+        nova = FakeNova(sources, durations)
+        completed, failed = migration.schedule_migrations(
+            nova, placement, sources, durations, 1, 1, 3,
+            nova.start, 0.001, 1, 10)
+        assert set(completed.keys()) == set(placement.keys())
+        assert nova.polls <= 6
+
+    def test_poll_interval(self):
+        now = time.time()
+        with MockTransaction:
+            expect(time).time.and_return(now)
+            assert migration.poll_interval(
+                {'vm1': now - 5, 'vm2': now - 1},
+                {'vm1': 10., 'vm2': 3.}, 1, 10) == 2.
+            assert migration.poll_interval(
+                {'vm1': now - 5}, {'vm1': 10.}, 1, 3) == 3
+            assert migration.poll_interval(
+                {'vm1': now - 5}, {'vm1': 2.}, 1, 3) == 1
@@ -0,0 +1,146 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import socket
+import time
+
+import neat.globals.power as power
+
+
+def listening_socket():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(128)
+    return server, server.getsockname()[1]
+
+
+def closed_port():
+    server, port = listening_socket()
+    server.close()
+    return port
+
+
+def wait(predicate, timeout=2):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class Power(TestCase):
+
+    def test_run_command(self):
+        assert power.run_command('true', 1) == 0
+        assert power.run_command('exit 3', 1) == 3
+        start = time.time()
+        assert power.run_command('sleep 5', 0.1) is None
+        assert time.time() - start < 1
+
+    def test_probe_port(self):
+        server, port = listening_socket()
+        try:
+            assert power.probe_port('127.0.0.1', port, 1)
+        finally:
+            server.close()
+        assert not power.probe_port('127.0.0.1', closed_port(), 1)
+
+    def test_wait_for_port(self):
+        port = closed_port()
+        assert power.wait_for_port('127.0.0.1', port, False,
+                                   time.time() + 1, 0.01)
+        start = time.time()
+        assert not power.wait_for_port('127.0.0.1', port, True,
+                                       time.time() + 0.05, 0.01)
+        assert time.time() - start < 1
+
+    def test_wake(self):
+        server, port = listening_socket()
+        try:
+            manager = power.PowerManager(port, 0.01, 1, 1)
+            manager.wake({'127.0.0.1': 'true'})
+            assert wait(lambda: manager.is_ready('127.0.0.1'))
+            # A host that is already up has no resume latency
+            assert manager.pop_latencies() == []
+        finally:
+            server.close()
+
+        manager = power.PowerManager(closed_port(), 0.01, 1, 0.05)
+        manager.wake({'127.0.0.1': 'true'})
+        assert manager.is_ready('127.0.0.1') is None
+        assert wait(lambda: manager.is_ready('127.0.0.1') is not None)
+        assert manager.is_ready('127.0.0.1') is False
+        assert manager.pop_latencies() == []
+        assert manager.is_ready('other') is True
+
+    def test_wake_latency(self):
+        probes = []
+
+        def probe(host, port, timeout):
+            probes.append(host)
+            return len(probes) > 2
+
+        with MockTransaction:
+            expect(power).probe_port.and_call(probe)
+            expect(power).run_command('wake h1', 1).and_return(0).once()
+            manager = power.PowerManager(22, 0.01, 1, 1)
+            manager.wake({'h1': 'wake h1'})
+            assert wait(lambda: manager.is_ready('h1'))
+        latencies = manager.pop_latencies()
+        assert len(latencies) == 1
+        assert latencies[0][:2] == ('h1', 1)
+        assert 0.01 <= latencies[0][2] < 1
+        assert manager.pop_latencies() == []
+
+    def test_host_ready_timeout(self):
+        manager = power.PowerManager(22, 0.01, 1, 300)
+        manager.set_resume_latencies({'h1': 60., 'h2': 120.})
+        assert manager.host_ready_timeout('h1') == 180.
+        assert manager.host_ready_timeout('h2') == 300
+        assert manager.host_ready_timeout('h3') == 300
+
+        # A failed resume is detected after the learned timeout
+        manager = power.PowerManager(closed_port(), 0.01, 1, 10)
+        manager.set_resume_latencies({'127.0.0.1': 0.02})
+        start = time.time()
+        manager.wake({'127.0.0.1': 'true'})
+        assert wait(lambda: manager.is_ready('127.0.0.1') is not None)
+        assert manager.is_ready('127.0.0.1') is False
+        assert time.time() - start < 1
+
+    def test_suspend(self):
+        port = closed_port()
+        manager = power.PowerManager(port, 0.01, 1, 1)
+        start = time.time()
+        assert manager.suspend({'127.0.0.1': 'sleep 0.1',
+                                'localhost': 'sleep 0.1'}) == \
+            ['127.0.0.1', 'localhost']
+        # The commands are run in parallel
+        assert time.time() - start < 0.19
+        assert manager.is_ready('127.0.0.1') is False
+        latencies = sorted(manager.pop_latencies())
+        assert [x[:2] for x in latencies] == \
+            [('127.0.0.1', 0), ('localhost', 0)]
+        assert all(x[2] >= 0.1 for x in latencies)
+
+        server, port = listening_socket()
+        try:
+            manager = power.PowerManager(port, 0.01, 0.1, 1)
+            assert manager.suspend({'127.0.0.1': 'true'}) == []
+            assert manager.is_ready('127.0.0.1') is True
+            assert manager.pop_latencies() == []
+        finally:
+            server.close()
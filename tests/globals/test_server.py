@@ -0,0 +1,292 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import bottle
+import httplib
+import json
+import threading
+import time
+import urllib
+
+import neat.globals.manager as manager
+import neat.globals.server as server
+import neat.globals.jobs as jobs
+import neat.protocol as protocol
+
+
+def start_server(state, keepalive_timeout=5):
+    app = bottle.app()
+    # Bottle does not allow rebinding the attributes of an app, so the
+    # state of the default app is reset in place for each test
+    if not hasattr(app, 'state'):
+        app.state = {}
+    app.state.clear()
+    app.state.update({'config': {},
+                      'state': state})
+    adapter = server.ThreadingServer(host='127.0.0.1', port=0,
+                                     keepalive_timeout=keepalive_timeout)
+    thread = threading.Thread(target=adapter.run, args=(app,))
+    thread.daemon = True
+    thread.start()
+    deadline = time.time() + 5
+    while getattr(adapter, 'server', None) is None and \
+            time.time() < deadline:
+        time.sleep(0.01)
+    return adapter
+
+
+def init_state():
+    return {'hashed_username': 'user',
+            'hashed_password': 'password',
+            'jobs': jobs.JobQueue(10000),
+            'host_locks': server.HostLocks(),
+            'request_times': {}}
+
+
+def put(connection, host, reason=0, vm_uuids=None):
+    params = {'username': 'user',
+              'password': 'password',
+              'time': time.time(),
+              'host': host,
+              'reason': reason}
+    if vm_uuids is not None:
+        params['vm_uuids'] = ','.join(vm_uuids)
+    connection.request('PUT', '/', urllib.urlencode(params),
+                       {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def put_events(connection, events, content_type, password='password'):
+    body = protocol.encode(protocol.message('user', password, events),
+                           content_type)
+    connection.request('PUT', '/v1/events', body,
+                       {'Content-Type': content_type})
+    response = connection.getresponse()
+    body = response.read()
+    if response.getheader('Content-Type') != content_type:
+        return response.status, body
+    return response.status, protocol.decode(body, content_type)
+
+
+class Server(TestCase):
+
+    def test_host_locks(self):
+        locks = server.HostLocks()
+        assert locks('host1') is locks('host1')
+        assert locks('host1') is not locks('host2')
+        with locks('host1'):
+            # The lock of another host is not blocked
+            assert locks('host2').acquire(False)
+            locks('host2').release()
+            assert not locks('host1').acquire(False)
+
+    def test_keep_alive(self):
+        state = init_state()
+        adapter = start_server(state)
+        try:
+            connection = httplib.HTTPConnection('127.0.0.1', adapter.port)
+            status, body = put(connection, 'host1')
+            assert status == 202
+            job = json.loads(body)
+            # The same connection is reused for the next requests
+            sock = connection.sock
+            status, body = put(connection, 'host1', 1, ['vm1'])
+            assert status == 202
+            assert connection.sock is sock
+            connection.request(
+                'GET', '/jobs/' + str(job['job']) +
+                '?username=user&password=password')
+            response = connection.getresponse()
+            assert response.status == 200
+            assert json.loads(response.read())['status'] == jobs.REPLACED
+            assert connection.sock is sock
+
+            # The errors do not close the connection
+            connection.request('GET', '/jobs/unknown' +
+                               '?username=user&password=password')
+            response = connection.getresponse()
+            assert response.status == 404
+            response.read()
+            status, body = put(connection, 'host2')
+            assert status == 202
+            assert connection.sock is sock
+            connection.close()
+        finally:
+            adapter.server.shutdown()
+            adapter.server.server_close()
+
+    def test_keep_alive_timeout(self):
+        adapter = start_server(init_state(), 0.1)
+        try:
+            connection = httplib.HTTPConnection('127.0.0.1', adapter.port)
+            assert put(connection, 'host1')[0] == 202
+            time.sleep(0.3)
+            # The idle connection has been closed by the server
+            assert connection.sock.recv(1) == ''
+            connection.close()
+        finally:
+            adapter.server.shutdown()
+            adapter.server.server_close()
+
+    def test_load(self):
+        hosts = ['compute{0}'.format(i) for i in range(200)]
+        requests_per_host = 5
+        state = init_state()
+        adapter = start_server(state)
+        statuses = []
+        lock = threading.Lock()
+        barrier = threading.Event()
+
+        def local_manager(host):
+            connection = httplib.HTTPConnection('127.0.0.1', adapter.port,
+                                                timeout=30)
+            barrier.wait()
+            results = []
+            for i in range(requests_per_host):
+                results.append(put(connection, host, 1, [host + '-vm'])[0])
+            connection.close()
+            with lock:
+                statuses.extend(results)
+
+        try:
+            threads = [threading.Thread(target=local_manager, args=(host,))
+                       for host in hosts]
+            for thread in threads:
+                thread.start()
+            start = time.time()
+            barrier.set()
+            for thread in threads:
+                thread.join(60)
+            duration = time.time() - start
+        finally:
+            adapter.server.shutdown()
+            adapter.server.server_close()
+
+        assert len(statuses) == len(hosts) * requests_per_host
+        assert set(statuses) == set([202])
+        assert duration < 30
+        # Only the latest job of each host is pending
+        pending = state['jobs'].get_all()
+        assert sorted(job['host'] for job in pending) == sorted(hosts)
+        assert all(job['vm_uuids'] == [job['host'] + '-vm']
+                   for job in pending)
+        assert sorted(state['request_times'].keys()) == sorted(hosts)
+
+    def test_events(self):
+        state = init_state()
+        adapter = start_server(state)
+        try:
+            connection = httplib.HTTPConnection('127.0.0.1', adapter.port)
+            now = time.time()
+            for content_type in protocol.supported_content_types():
+                events = [
+                    protocol.event('host1', now, 0, [], [100],
+                                   {'vm1': [100], 'vm2': [200, 300]}),
+                    protocol.event('host2', now, 1, ['vm3'], [100],
+                                   {'vm3': [400]}),
+                    {'host': 'host3', 'reason': 0},
+                    protocol.event('host4', now - 10, 0, [], [], {})]
+                status, response = put_events(connection, events,
+                                              content_type)
+                assert status == 202
+                assert response['version'] == protocol.VERSION
+                results = response['jobs']
+                assert [x.get('error') for x in results] == \
+                    [None, None, 400, 412]
+                job1 = state['jobs'].jobs[results[0]['job']]
+                assert job1['host'] == 'host1'
+                assert job1['reason'] == 0
+                assert job1['data'] == {
+                    'host_cpu_mhz': [100],
+                    'vm_cpu_mhz': {'vm1': [100], 'vm2': [200, 300]}}
+                job2 = state['jobs'].jobs[results[1]['job']]
+                assert job2['vm_uuids'] == ['vm3']
+                assert job2['data']['vm_cpu_mhz'] == {'vm3': [400]}
+                now += 1
+
+            # The jobs of the first batch have been replaced
+            assert sorted(job['host'] for job in
+                          state['jobs'].get_all()) == ['host1', 'host2']
+
+            # A batch of a single event is answered with its status
+            content_type = protocol.content_type('json')
+            for event, error in [
+                    (protocol.event('host1', now - 10, 0, [], [], {}), 412),
+                    ({'host': 'host1', 'reason': 0}, 400)]:
+                status, response = put_events(connection, [event],
+                                              content_type)
+                assert status == error
+                assert response['jobs'] == [{'error': error}]
+            status, response = put_events(
+                connection, [protocol.event('host1', now, 0, [], [], {})],
+                content_type)
+            assert status == 202
+            assert response['jobs'][0]['status'] == jobs.PENDING
+
+            content_type = protocol.content_type('json')
+            assert put_events(connection, [], content_type,
+                              'invalid')[0] == 403
+            connection.request('PUT', '/v1/events', '{"version": 1}',
+                               {'Content-Type': content_type})
+            response = connection.getresponse()
+            response.read()
+            assert response.status == 400
+            connection.request('PUT', '/v1/events', '[',
+                               {'Content-Type': content_type})
+            response = connection.getresponse()
+            response.read()
+            assert response.status == 400
+            connection.request('PUT', '/v1/events', 'version=1',
+                               {'Content-Type': 'text/plain'})
+            response = connection.getresponse()
+            response.read()
+            assert response.status == 415
+            connection.close()
+        finally:
+            adapter.server.shutdown()
+            adapter.server.server_close()
+
+    def test_dry_run(self):
+        adapter = start_server(init_state())
+        bottle.app().state['config'] = {'option': 'value'}
+        try:
+            connection = httplib.HTTPConnection('127.0.0.1', adapter.port)
+            with MockTransaction:
+                expect(manager).dry_run(
+                    {'option': 'value'}, Any, 'h1', 1, ['vm1', 'vm2']). \
+                    and_return({'placement': {'vm1': 'h2'}}).once()
+                connection.request(
+                    'GET', '/dry-run?username=user&password=password' +
+                    '&host=h1&reason=1&vm_uuids=vm1,vm2')
+                response = connection.getresponse()
+                assert response.status == 200
+                assert json.loads(response.read()) == \
+                    {'placement': {'vm1': 'h2'}}
+
+            for query in ['host=h1&reason=2', 'host=h1&reason=1',
+                          'reason=0', 'host=h1&reason=x']:
+                connection.request(
+                    'GET', '/dry-run?username=user&password=password&' +
+                    query)
+                response = connection.getresponse()
+                response.read()
+                assert response.status == 400
+            connection.close()
+        finally:
+            adapter.server.shutdown()
+            adapter.server.server_close()
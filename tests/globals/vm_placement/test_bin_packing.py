@@ -264,3 +264,102 @@ class BinPacking(TestCase):
                 'vm1': 'host1',
                 'vm2': 'host1',
                 'vm3': 'host3'}
+
+    def test_percentile_best_fit_decreasing_factory(self):
+        alg = packing.percentile_best_fit_decreasing_factory(
+            300, 20., {'cpu_threshold': 0.8,
+                       'ram_threshold': 0.9,
+                       'last_n_vm_cpu': 4,
+                       'percentile': 100})
+
+        hosts_cpu_usage = {
+            'host1': 1200,
+            'host2': 2000}
+        hosts_cpu_total = {
+            'host1': 4000,
+            'host2': 4000}
+        hosts_ram_usage = {
+            'host1': 1024,
+            'host2': 1024}
+        hosts_ram_total = {
+            'host1': 8192,
+            'host2': 8192}
+        vms_cpu = {
+            'vm1': [1000, 100, 1000, 100],
+            'vm2': [100, 1000, 100, 1000],
+            'vm3': [1000, 100, 1000, 100]}
+        vms_ram = {
+            'vm1': 1024,
+            'vm2': 1024,
+            'vm3': 1024}
+
+        self.assertEqual(alg(hosts_cpu_usage, hosts_cpu_total,
+                             hosts_ram_usage, hosts_ram_total,
+                             {}, {}, vms_cpu, vms_ram), ({
+                                 'vm1': 'host1',
+                                 'vm2': 'host2',
+                                 'vm3': 'host2'}, {}))
+
+    def test_vms_cpu_matrix(self):
+        matrix = packing.vms_cpu_matrix(3, [[1, 2, 3, 4], [5], [2, 4]])
+        assert matrix.tolist() == [[2, 3, 4],
+                                   [5, 5, 5],
+                                   [3, 2, 4]]
+
+        matrix = packing.vms_cpu_matrix(5, [[1, 2], [3]])
+        assert matrix.tolist() == [[1, 2],
+                                   [3, 3]]
+
+    def test_percentile_best_fit_decreasing(self):
+        hosts_cpu = {
+            'host1': 2000,
+            'host2': 2500}
+        hosts_ram = {
+            'host1': 4096,
+            'host2': 4096}
+        vms_cpu = {
+            'vm1': [1000, 200, 1000, 200],
+            'vm2': [1000, 200, 1000, 200],
+            'vm3': [200, 1000, 200, 1000]}
+        vms_ram = {
+            'vm1': 512,
+            'vm2': 512,
+            'vm3': 512}
+
+        # The mean based BFD co-locates the VMs with coinciding peaks
+        assert packing.best_fit_decreasing(
+            4, dict(hosts_cpu), dict(hosts_ram), {}, {},
+            vms_cpu, vms_ram) == {
+                'vm1': 'host1',
+                'vm2': 'host1',
+                'vm3': 'host1'}
+
+        # The peaks of vm1 and vm2 coincide, only one of them fits a host
+        # together with vm3
+        assert packing.percentile_best_fit_decreasing(
+            4, 100, dict(hosts_cpu), dict(hosts_ram), {}, {},
+            vms_cpu, vms_ram) == {
+                'vm1': 'host2',
+                'vm2': 'host1',
+                'vm3': 'host1'}
+
+        # The 50th percentile ignores the peaks
+        assert packing.percentile_best_fit_decreasing(
+            4, 50, dict(hosts_cpu), dict(hosts_ram), {}, {},
+            vms_cpu, vms_ram) == {
+                'vm1': 'host1',
+                'vm2': 'host1',
+                'vm3': 'host1'}
+
+        # An inactive host is activated when active hosts are full
+        assert packing.percentile_best_fit_decreasing(
+            4, 100, {'host1': 1000}, {'host1': 4096},
+            {'host3': 3000, 'host4': 1000}, {'host3': 4096, 'host4': 4096},
+            vms_cpu, vms_ram) == {
+                'vm1': 'host3',
+                'vm2': 'host4',
+                'vm3': 'host1'}
+
+        assert packing.percentile_best_fit_decreasing(
+            4, 100, {'host1': 1000}, {'host1': 256}, {}, {},
+            vms_cpu, vms_ram) == {}
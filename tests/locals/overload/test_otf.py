@@ -111,3 +111,43 @@ class Otf(TestCase):
         decision, state = alg([0.9, 1.3, 1.1, 1.2, 0.3, 0.2, 0.1, 0.1], state)
         self.assertEqual(state, {'overload': 4, 'total': 9})
         self.assertFalse(decision)
+
+    def test_otf_detector(self):
+        utilization = [0.9, 1.3, 1.1, 1.2, 0.3, 1.3, 0.2, 0.1, 0.1]
+        params = {'otf': 0.5, 'threshold': 1.0, 'limit': 4}
+        alg = otf.otf_factory(30, 0., params)
+        expected = []
+        state = None
+        for i in range(len(utilization)):
+            decision, state = alg(utilization[:i + 1], state)
+            expected.append(decision)
+
+        detector = otf.Otf(30, 0., params)
+        assert detector.evaluate(utilization) == expected
+        self.assertEqual(detector.snapshot(), {'overload': 4,
+                                               'total': 9,
+                                               'last': 0.1})
+
+        restored = otf.Otf(30, 0., params)
+        restored.restore(detector.snapshot())
+        restored.observe(1.2)
+        self.assertTrue(restored.decide())
+
+    @qc(10)
+    def otf_detector_trace(
+        utilization=list_(of=float_(min=0., max=1.5),
+                          min_length=1, max_length=50),
+        threshold=float_(min=0.5, max=1.2),
+        limit=int_(min=0, max=20),
+        migration_time=float_(min=0., max=600.)
+    ):
+        params = {'otf': 0.3, 'threshold': threshold, 'limit': limit}
+        expected = []
+        state = {'overload': 0, 'total': 0}
+        for i in range(len(utilization)):
+            decision, state = otf.otf(0.3, threshold, limit,
+                                      migration_time / 30,
+                                      utilization[:i + 1], state)
+            expected.append(decision)
+        detector = otf.Otf(30, migration_time, params)
+        assert detector.evaluate(utilization) == expected
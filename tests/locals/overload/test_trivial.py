@@ -88,3 +88,19 @@ class Trivial(TestCase):
         self.assertFalse(trivial.last_n_average_threshold(
                 0.5, 2, [0.9, 0.8, 1.1, 0.2, 0.3]))
         self.assertFalse(trivial.last_n_average_threshold(0.5, 2, []))
+
+    @qc(10)
+    def last_n_average_threshold_detector(
+        utilization=list_(of=float_(min=0, max=2), max_length=20),
+        n=int_(min=1, max=5)
+    ):
+        params = {'threshold': 0.5, 'n': n}
+        alg = trivial.LastNAverageThreshold(300, 20., params)
+        assert alg.evaluate(utilization) == \
+            [trivial.last_n_average_threshold(0.5, n, utilization[:i + 1])
+             for i in range(len(utilization))]
+
+        restored = trivial.LastNAverageThreshold(300, 20., params)
+        restored.restore(alg.snapshot())
+        assert restored.decide() == \
+            trivial.last_n_average_threshold(0.5, n, utilization)
@@ -0,0 +1,125 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import neat.locals.agent as agent
+import neat.locals.collector as collector
+import neat.locals.manager as manager
+import neat.locals.vm_cache as vm_cache
+import neat.common as common
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class LocalAgent(TestCase):
+
+    @qc(10)
+    def start(
+            time_interval=int_(min=0)
+    ):
+        with MockTransaction:
+            state = {'property': 'value'}
+            config = {
+                'log_directory': 'dir',
+                'log_level': 2,
+                'data_collector_interval': str(time_interval),
+                'data_collector_phase': ''}
+            paths = [agent.DEFAILT_CONFIG_PATH, agent.CONFIG_PATH]
+            fields = agent.REQUIRED_FIELDS
+            expect(agent).read_and_validate_config(paths, fields). \
+                and_return(config).once()
+            expect(common).init_logging('dir', 'local-agent.log', 2).once()
+            expect(common).start(agent.init_state,
+                                 agent.execute,
+                                 config,
+                                 time_interval,
+                                 phase=None).and_return(state).once()
+            assert agent.start() == state
+
+    def test_init_state(self):
+        config = {'data_collector_data_length': '5',
+                  'data_collector_interval': '60',
+                  'local_manager_interval': '300'}
+        with MockTransaction:
+            vir_connection = mock('virConnect')
+            db = mock('db')
+            expect(vm_cache).init_event_loop().and_return(True).once()
+            expect(collector).init_state(config). \
+                and_return({'vir_connection': vir_connection,
+                            'db': db}).once()
+            expect(manager).init_state(config, vir_connection, db). \
+                and_return({}).once()
+            state = agent.init_state(config)
+            history = state['collector']['history']
+            assert isinstance(history, agent.History)
+            assert history.length == 5
+            assert state['manager']['history'] is history
+            assert state['iterations'] == 0
+            assert state['manager_period'] == 5
+
+    def test_get_manager_period(self):
+        assert agent.get_manager_period(300, 300) == 1
+        assert agent.get_manager_period(60, 300) == 5
+        assert agent.get_manager_period(100, 300) == 3
+        assert agent.get_manager_period(300, 60) == 1
+        assert agent.get_manager_period(0, 300) == 1
+
+    def test_execute(self):
+        config = {}
+        state = {'collector': {'name': 'collector'},
+                 'manager': {'name': 'manager'},
+                 'iterations': 0,
+                 'manager_period': 2}
+        with MockTransaction:
+            expect(collector).execute(config, state['collector']). \
+                and_return(state['collector']).exactly(4).times()
+            expect(manager).execute(config, state['manager']). \
+                and_return(state['manager']).exactly(2).times()
+            for _ in range(4):
+                state = agent.execute(config, state)
+            assert state['iterations'] == 4
+
+    def test_history(self):
+        history = agent.History(3)
+        assert history.get_vms() == []
+        assert history.get_vm_data() == {}
+        assert history.get_host_data() == []
+        assert history.sample_time is None
+
+        history.write_vm_data({'vm1': [1, 2, 3, 4], 'vm2': []})
+        history.append_vm_data({'vm1': 5, 'vm2': 6, 'vm3': 7})
+        assert sorted(history.get_vms()) == ['vm1', 'vm2', 'vm3']
+        assert history.get_vm_data() == {'vm1': [3, 4, 5],
+                                         'vm2': [6],
+                                         'vm3': [7]}
+
+        history.cleanup_vm_data(['vm2'])
+        assert sorted(history.get_vms()) == ['vm1', 'vm3']
+
+        history.write_host_data([1, 2, 3, 4])
+        assert history.get_host_data() == [2, 3, 4]
+        assert history.sample_time is None
+        assert history.samples == 0
+        for x in range(5):
+            history.append_host_data(x)
+        assert history.get_host_data() == [2, 3, 4]
+        assert history.sample_time is not None
+        assert history.samples == 5
+
+        data = history.get_vm_data()
+        data['vm1'].append(10)
+        assert history.get_vm_data()['vm1'] == [3, 4, 5]
@@ -40,7 +40,8 @@ class Collector(TestCase):
                 'log_directory': 'dir',
                 'log_level': 2,
                 'local_data_directory': 'data_dir',
-                'data_collector_interval': str(time_interval)}
+                'data_collector_interval': str(time_interval),
+                'data_collector_phase': '10'}
             paths = [collector.DEFAILT_CONFIG_PATH, collector.CONFIG_PATH]
             fields = collector.REQUIRED_FIELDS
             expect(collector).read_and_validate_config(paths, fields). \
@@ -49,7 +50,8 @@ class Collector(TestCase):
             expect(common).start(collector.init_state,
                                  collector.execute,
                                  config,
-                                 time_interval).and_return(state).once()
+                                 time_interval,
+                                 phase=10.).and_return(state).once()
             assert collector.start() == state
 
     def test_init_state(self):
@@ -365,6 +367,26 @@ class Collector(TestCase):
         for uuid, data in final_data.items():
             assert db.select_cpu_mhz_for_vm(uuid, 11) == data
 
+    @qc
+    def write_host_data_locally(
+        data=list_(of=int_(min=0, max=3000),
+                   min_length=0, max_length=10),
+        data_length=int_(min=0, max=10)
+    ):
+        path = os.path.join(os.path.dirname(__file__),
+                            '..', 'resources', 'host')
+        collector.write_host_data_locally(path, data, data_length)
+        if data_length > 0:
+            expected = data[-data_length:]
+        else:
+            expected = []
+
+        with open(path, 'r') as f:
+            actual = [int(x)
+                      for x in f.read().strip().splitlines()]
+        os.remove(path)
+        assert actual == expected
+
     @qc
     def append_host_data_locally(
         data=list_(of=int_(min=0, max=3000),
@@ -17,11 +17,15 @@ from pyqcy import *
 
 import shutil
 import libvirt
+import requests
+import time
 from hashlib import sha1
 
 import neat.locals.manager as manager
 import neat.common as common
 import neat.locals.collector as collector
+import neat.locals.vm_cache as vm_cache
+import neat.protocol as protocol
 
 import logging
 logging.disable(logging.CRITICAL)
@@ -39,7 +43,9 @@ class LocalManager(TestCase):
             config = {
                 'log_directory': 'dir',
                 'log_level': 2,
-                'local_manager_interval': str(time_interval)}
+                'local_manager_interval': str(time_interval),
+                'local_manager_phase': '',
+                'local_manager_trigger': 'timer'}
             paths = [manager.DEFAILT_CONFIG_PATH, manager.CONFIG_PATH]
             fields = manager.REQUIRED_FIELDS
             expect(manager).read_and_validate_config(paths, fields). \
@@ -48,7 +54,9 @@ class LocalManager(TestCase):
             expect(common).start(manager.init_state,
                                  manager.execute,
                                  config,
-                                 time_interval).and_return(state).once()
+                                 time_interval,
+                                 phase=None,
+                                 wait=None).and_return(state).once()
             assert manager.start() == state
 
     @qc(1)
@@ -57,6 +65,7 @@ class LocalManager(TestCase):
             vir_connection = mock('virConnect')
             db = mock('db')
             mhz = 3000
+            expect(vm_cache).init_event_loop().and_return(False).once()
             expect(libvirt).openReadOnly(None). \
                 and_return(vir_connection).once()
             expect(manager).init_db('db'). \
@@ -64,6 +73,9 @@ class LocalManager(TestCase):
             expect(common).physical_cpu_mhz_total(vir_connection). \
                 and_return(mhz)
             expect(vir_connection).getHostname().and_return('host').once()
+            notifier = mock('notifier')
+            expect(manager).init_notifier.and_return(notifier).once()
+            expect(notifier).start().once()
             config = {'sql_connection': 'db',
                       'os_admin_user': 'user',
                       'os_admin_password': 'password',
@@ -76,6 +88,60 @@ class LocalManager(TestCase):
             assert state['hostname'] == 'host'
             assert state['hashed_username'] == sha1('user').hexdigest()
             assert state['hashed_password'] == sha1('password').hexdigest()
+            assert isinstance(state['session'], requests.Session)
+            assert state['notifier'] == notifier
+            assert isinstance(state['vm_cache'], vm_cache.VmCache)
+
+    def test_notify_global_manager(self):
+        config = {'global_manager_host': 'controller',
+                  'global_manager_port': '60080',
+                  'global_manager_protocol': 'form',
+                  'global_manager_timeout': '10'}
+        state = {'hashed_username': 'user',
+                 'hashed_password': 'password',
+                 'hostname': 'host'}
+
+        def check_form(url, params, timeout):
+            assert url == 'http://controller:60080'
+            assert timeout == 10.
+            assert params['username'] == 'user'
+            assert params['password'] == 'password'
+            assert params['host'] == 'host'
+            assert params['reason'] == 1
+            assert params['vm_uuids'] == 'vm1,vm2'
+            assert abs(params['time'] - time.time()) < 5
+            return 'response'
+
+        with MockTransaction:
+            state['session'] = mock('session')
+            expect(state['session']).put.and_call(check_form).once()
+            assert manager.notify_global_manager(
+                config, state, 1, ['vm1', 'vm2'], [100],
+                {'vm1': [200], 'vm2': [300]}) == 'response'
+
+        def check_events(url, body, headers, timeout):
+            assert url == 'http://controller:60080/v1/events'
+            assert timeout == 10.
+            assert headers == {'Content-Type': 'application/json'}
+            message = protocol.decode(body, 'application/json')
+            assert message['username'] == 'user'
+            assert message['password'] == 'password'
+            assert len(message['events']) == 1
+            event = message['events'][0]
+            assert event['host'] == 'host'
+            assert event['reason'] == 0
+            assert event['vm_uuids'] == []
+            assert event['host_cpu_mhz'] == [100]
+            assert event['vm_cpu_mhz'] == {'vm1': [200], 'vm2': [300]}
+            return 'response'
+
+        config['global_manager_protocol'] = 'json'
+        with MockTransaction:
+            state['session'] = mock('session')
+            expect(state['session']).put.and_call(check_events).once()
+            assert manager.notify_global_manager(
+                config, state, 0, [], [100],
+                {'vm1': [200], 'vm2': [300]}) == 'response'
 
     @qc(1)
     def get_local_vm_data(
@@ -130,77 +196,6 @@ class LocalManager(TestCase):
 
         assert manager.cleanup_vm_data(original_data, uuids) == data
 
-    @qc(10)
-    def get_ram(
-        data=dict_(
-            keys=str_(of='abc123-', min_length=36, max_length=36),
-            values=int_(min=1, max=100),
-            min_length=0, max_length=10
-        )
-    ):
-        with MockTransaction:
-            def mock_get_max_ram(vir_connection, uuid):
-                return data[uuid]
-            connection = libvirt.virConnect()
-            when(manager).get_max_ram(connection, any_string). \
-                then_call(mock_get_max_ram)
-            assert manager.get_ram(connection, data.keys()) == data
-
-    @qc(10)
-    def get_ram_long(
-        data=dict_(
-            keys=str_(of='abc123-', min_length=36, max_length=36),
-            values=int_(min=1, max=100),
-            min_length=0, max_length=10
-        )
-    ):
-        data = dict([(k, long(v)) for (k, v) in data.iteritems()])
-        with MockTransaction:
-            def mock_get_max_ram(vir_connection, uuid):
-                return data[uuid]
-            connection = libvirt.virConnect()
-            when(manager).get_max_ram(connection, any_string). \
-                then_call(mock_get_max_ram)
-            assert manager.get_ram(connection, data.keys()) == data
-
-    @qc(10)
-    def get_max_ram(
-        uuid=str_(of='abc123-', min_length=36, max_length=36),
-        x=int_(min=0)
-    ):
-        with MockTransaction:
-            connection = libvirt.virConnect()
-            domain = mock('domain')
-            expect(connection).lookupByUUIDString(uuid). \
-                and_return(domain).once()
-            expect(domain).maxMemory().and_return(x).once()
-            assert manager.get_max_ram(connection, uuid) == int(x) / 1024
-
-    @qc(10)
-    def get_max_ram_long(
-        uuid=str_(of='abc123-', min_length=36, max_length=36),
-        x=int_(min=0)
-    ):
-        with MockTransaction:
-            connection = libvirt.virConnect()
-            domain = mock('domain')
-            expect(connection).lookupByUUIDString(uuid). \
-                and_return(domain).once()
-            expect(domain).maxMemory().and_return(long(x)).once()
-            assert manager.get_max_ram(connection, uuid) == long(x) / 1024
-
-    @qc(1)
-    def get_max_ram_none(
-        uuid=str_(of='abc123-', min_length=36, max_length=36)
-    ):
-        with MockTransaction:
-            def raise_libvirt_error():
-                raise libvirt.libvirtError(None)
-            connection = libvirt.virConnect()
-            expect(connection).lookupByUUIDString(uuid). \
-                and_call(lambda _: raise_libvirt_error())
-            assert manager.get_max_ram(connection, uuid) is None
-
     def test_vm_mhz_to_percentage(self):
         self.assertEqual(manager.vm_mhz_to_percentage(
             [[100, 200, 300],
@@ -0,0 +1,211 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import os
+import shutil
+import tempfile
+
+import requests
+
+import neat.locals.notifier as notifier
+import neat.protocol as protocol
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class Response(object):
+
+    def __init__(self, status_code, message=None):
+        self.status_code = status_code
+        self.content = ''
+        self.headers = {}
+        if message is not None:
+            self.headers['Content-Type'] = 'application/json'
+            self.content = protocol.encode(message, 'application/json')
+
+
+class Sender(object):
+    """ A fake send function returning the given responses in turn.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        if isinstance(response, Response):
+            return response
+        return Response(response)
+
+
+class Notifier(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = notifier.build_outbox_path(self.directory)
+        self.event = protocol.event('host', 1000., 1, ['vm1'], [100],
+                                    {'vm1': [200]})
+        self.other = protocol.event('host', 1010., 0, [], [100],
+                                    {'vm1': [200], 'vm2': [300]})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create(self, send, retries=2, max_age=60):
+        n = notifier.Notifier(send, self.path, retries, 0, max_age,
+                              clock=lambda: 1020.)
+        # Do not wait for the backoff delay
+        n.condition.wait = lambda timeout=None: None
+        return n
+
+    def test_build_outbox_path(self):
+        assert notifier.build_outbox_path('/var/lib/neat') == \
+            '/var/lib/neat/outbox'
+
+    def test_deliver(self):
+        send = Sender(202)
+        n = self.create(send)
+        n.submit(self.event)
+        assert os.access(self.path, os.F_OK)
+        n.process()
+        assert send.events == [self.event]
+        assert n.pending() is None
+        assert not os.access(self.path, os.F_OK)
+
+    def test_submit_replaces(self):
+        send = Sender(202)
+        n = self.create(send)
+        n.submit(self.event)
+        n.submit(self.other)
+        n.process()
+        assert send.events == [self.other]
+        assert n.pending() is None
+
+    def test_cancel(self):
+        n = self.create(Sender())
+        n.submit(self.event)
+        n.cancel()
+        assert n.pending() is None
+        assert not os.access(self.path, os.F_OK)
+
+    def test_retry(self):
+        send = Sender(requests.exceptions.Timeout('timeout'), 503, 412, 202)
+        n = self.create(send, retries=3)
+        n.submit(self.event)
+        for _ in range(3):
+            n.process()
+            assert n.pending() == self.event
+        assert n.attempts == 3
+        n.process()
+        assert len(send.events) == 4
+        assert n.pending() is None
+
+    def test_retries_exhausted(self):
+        send = Sender(500, 500, 500)
+        n = self.create(send, retries=2)
+        n.submit(self.event)
+        for _ in range(3):
+            n.process()
+        assert len(send.events) == 3
+        assert n.pending() is None
+        assert not os.access(self.path, os.F_OK)
+
+    def test_rejected(self):
+        send = Sender(400)
+        n = self.create(send)
+        n.submit(self.event)
+        n.process()
+        assert len(send.events) == 1
+        assert n.pending() is None
+
+    def test_batch_errors(self):
+        # An event rejected in an accepted batch is retried if stale
+        send = Sender(Response(202, {'version': 1, 'jobs': [{'error': 412}]}),
+                      Response(202, {'version': 1,
+                                     'jobs': [{'job': '1',
+                                               'status': 'pending'}]}))
+        n = self.create(send)
+        n.submit(self.event)
+        n.process()
+        assert n.pending() == self.event
+        n.process()
+        assert len(send.events) == 2
+        assert n.pending() is None
+
+        # and discarded if invalid
+        send = Sender(Response(202, {'version': 1, 'jobs': [{'error': 400}]}))
+        n = self.create(send)
+        n.submit(self.event)
+        n.process()
+        assert len(send.events) == 1
+        assert n.pending() is None
+
+    def test_event_status(self):
+        assert notifier.event_status(Response(202)) == 202
+        assert notifier.event_status(Response(412)) == 412
+        assert notifier.event_status(
+            Response(202, {'version': 1, 'jobs': [{'error': 412}]})) == 412
+        assert notifier.event_status(
+            Response(202, {'version': 1, 'jobs': [{'job': '1'}]})) == 202
+        # The response to a form-encoded request carries a single job
+        assert notifier.event_status(
+            Response(200, {'job': '1', 'status': 'pending'})) == 200
+        response = Response(202, {})
+        response.content = '{'
+        assert notifier.event_status(response) == 202
+
+    def test_replaced_during_delivery(self):
+        n = self.create(None)
+
+        def send(event):
+            n.submit(self.other)
+            return Response(202)
+
+        n.send = send
+        n.submit(self.event)
+        n.process()
+        assert n.pending() == self.other
+
+    def test_expired(self):
+        send = Sender(202)
+        n = self.create(send, max_age=10)
+        n.submit(self.event)
+        n.process()
+        assert send.events == []
+        assert n.pending() is None
+
+        n = self.create(send, max_age=0)
+        n.submit(self.event)
+        n.process()
+        assert send.events == [self.event]
+
+    def test_outbox(self):
+        n = self.create(Sender())
+        n.submit(self.event)
+        assert self.create(Sender()).pending() == self.event
+        assert self.create(Sender(), max_age=10).pending() is None
+        assert not os.access(self.path, os.F_OK)
+
+    def test_outbox_corrupted(self):
+        with open(self.path, 'w') as f:
+            f.write('corrupted')
+        assert self.create(Sender()).pending() is None
@@ -0,0 +1,102 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import neat.locals.plugins as plugins
+import neat.locals.overload.otf as otf
+import neat.locals.overload.trivial as trivial
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class Plugins(TestCase):
+
+    def test_load_factory(self):
+        alg = plugins.load(
+            plugins.OVERLOAD_DETECTION,
+            'neat.locals.overload.trivial.last_n_average_threshold_factory',
+            300, 20., {'threshold': 0.5, 'n': 2})
+        assert isinstance(alg, plugins.FactoryAdapter)
+        assert alg.evaluate([0.9, 0.2, 0.1]) == [True, True, False]
+
+    def test_load_class(self):
+        alg = plugins.load(plugins.OVERLOAD_DETECTION,
+                           'neat.locals.overload.otf.Otf',
+                           300, 20., {'otf': 0.5,
+                                      'threshold': 1.0,
+                                      'limit': 4})
+        assert isinstance(alg, otf.Otf)
+        assert alg.time_step == 300
+        assert alg.migration_time == 20.
+
+    def test_load_unknown(self):
+        try:
+            plugins.load(plugins.OVERLOAD_DETECTION, 'unknown',
+                         300, 20., {})
+        except ValueError:
+            pass
+        else:
+            assert False
+
+    def test_factory_adapter(self):
+        calls = []
+
+        def algorithm(utilization, state):
+            calls.append(utilization)
+            state['calls'] = state.get('calls', 0) + 1
+            return utilization[-1] > 0.5, state
+
+        alg = plugins.FactoryAdapter(algorithm, 3)
+        assert alg.update([0.1, 0.9], 2)
+        assert not alg.update([0.1, 0.9, 0.2, 0.3], 1)
+        assert calls == [[0.1, 0.9], [0.9, 0.2, 0.3]]
+        assert alg.snapshot() == {'calls': 2}
+
+        restored = plugins.FactoryAdapter(algorithm)
+        restored.restore(alg.snapshot())
+        restored.observe(0.6)
+        assert restored.decide()
+        assert restored.snapshot() == {'calls': 3}
+
+    def test_update(self):
+        alg = trivial.LastNAverageThreshold(300, 20., {'threshold': 0.5,
+                                                       'n': 2})
+        assert alg.update([0.9, 0.8, 0.7], 3)
+        assert list(alg.window) == [0.8, 0.7]
+        assert not alg.update([0.9, 0.8, 0.7, 0.2, 0.1], 2)
+        assert list(alg.window) == [0.2, 0.1]
+        # No new samples
+        assert not alg.update([0.9, 0.8, 0.7, 0.2, 0.1], 0)
+        assert list(alg.window) == [0.2, 0.1]
+
+    def test_count_new_samples(self):
+        assert plugins.count_new_samples(None, 5, 10) == 10
+        assert plugins.count_new_samples(5, 6, 10) == 1
+        assert plugins.count_new_samples(5, 8, 10) == 3
+        assert plugins.count_new_samples(5, 5, 10) == 0
+        assert plugins.count_new_samples(5, 50, 10) == 10
+        # The count has been reset
+        assert plugins.count_new_samples(50, 2, 10) == 2
+        assert plugins.count_new_samples(50, 20, 10) == 10
+
+    def test_detector_abstract(self):
+        try:
+            plugins.Detector(300, 20., {})
+        except TypeError:
+            pass
+        else:
+            assert False
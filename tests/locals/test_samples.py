@@ -0,0 +1,109 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import errno
+import os
+import select
+import shutil
+import tempfile
+
+import neat.locals.samples as samples
+import neat.locals.manager as manager
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class Samples(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = samples.build_socket_path(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_build_socket_path(self):
+        assert samples.build_socket_path('/var/lib/neat') == \
+            '/var/lib/neat/samples.sock'
+
+    def test_notify_no_listener(self):
+        assert not samples.notify(self.path)
+
+    def test_wait(self):
+        listener = samples.Listener(self.path)
+        try:
+            assert not listener.wait(0)
+            assert samples.notify(self.path)
+            assert samples.notify(self.path)
+            assert listener.wait(1)
+            # All the pending notifications have been consumed
+            assert not listener.wait(0)
+        finally:
+            listener.close()
+        assert not os.path.exists(self.path)
+        assert not samples.notify(self.path)
+
+    def test_wait_interrupted(self):
+        listener = samples.Listener(self.path)
+        calls = []
+        real_select = select.select
+
+        def interrupted_select(rlist, wlist, xlist, timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                raise select.error(errno.EINTR, 'Interrupted system call')
+            return real_select(rlist, wlist, xlist, timeout)
+
+        try:
+            with MockTransaction:
+                modify(select).select = interrupted_select
+                assert samples.notify(self.path)
+                # The wait is resumed after a signal
+                assert listener.wait(1)
+            assert len(calls) == 2
+            assert 0 <= calls[1] <= 1
+        finally:
+            listener.close()
+
+    def test_counter(self):
+        path = samples.build_counter_path(self.directory)
+        assert samples.read_counter(path) == 0
+        assert samples.increment_counter(path) == 1
+        assert samples.increment_counter(path) == 2
+        assert samples.read_counter(path) == 2
+        with open(path, 'w') as f:
+            f.write('corrupted')
+        assert samples.read_counter(path) == 0
+
+    def test_stale_socket(self):
+        samples.Listener(self.path).socket.close()
+        assert os.path.exists(self.path)
+        listener = samples.Listener(self.path)
+        try:
+            assert samples.notify(self.path)
+            assert listener.wait(1)
+        finally:
+            listener.close()
+
+    def test_get_sample_time(self):
+        path = os.path.join(self.directory, 'host')
+        assert manager.get_sample_time(path) is None
+        with open(path, 'w') as f:
+            f.write('100\n')
+        os.utime(path, (1000, 1000))
+        assert manager.get_sample_time(path) == 1000
@@ -0,0 +1,90 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+
+import neat.locals.snapshot as snapshot
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class Snapshot(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = snapshot.build_snapshot_path(self.directory)
+        self.parameters = {'data_collector_interval': '300',
+                           'algorithm_overload_detection_parameters':
+                               '{"otf": 0.1}'}
+        self.state = {'underload_detection_state': {},
+                      'overload_detection_state': {
+                          'time_in_states': 10,
+                          'time_in_state_n': 2,
+                          'request_windows': [deque([1, 0], 30)]},
+                      'vm_selection_state': {'random': 1},
+                      'detection_samples': 12,
+                      'vir_connection': object()}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_build_parameters(self):
+        config = dict((key, key + '-value')
+                      for key in snapshot.PARAMETER_KEYS)
+        config['other'] = 'value'
+        parameters = snapshot.build_parameters(config)
+        assert sorted(parameters.keys()) == sorted(snapshot.PARAMETER_KEYS)
+        assert 'other' not in parameters
+
+    def test_save_load(self):
+        assert snapshot.load(self.path, self.parameters, 60) is None
+        assert snapshot.save(self.path, self.parameters, self.state)
+        states = snapshot.load(self.path, self.parameters, 60)
+        assert sorted(states.keys()) == sorted(snapshot.STATE_KEYS)
+        for key in snapshot.STATE_KEYS:
+            assert states[key] == self.state[key]
+
+    def test_load_other_parameters(self):
+        snapshot.save(self.path, self.parameters, self.state)
+        parameters = dict(self.parameters)
+        parameters['data_collector_interval'] = '60'
+        assert snapshot.load(self.path, parameters, 60) is None
+
+    def test_load_other_version(self):
+        with MockTransaction:
+            modify(snapshot).VERSION = 0
+            snapshot.save(self.path, self.parameters, self.state)
+        assert snapshot.load(self.path, self.parameters, 60) is None
+
+    def test_load_expired(self):
+        with MockTransaction:
+            when(time).time().then_return(1000.)
+            snapshot.save(self.path, self.parameters, self.state)
+            when(time).time().then_return(1061.)
+            assert snapshot.load(self.path, self.parameters, 60) is None
+            when(time).time().then_return(1059.)
+            assert snapshot.load(self.path, self.parameters, 60) is not None
+
+    def test_load_corrupted(self):
+        with open(self.path, 'wb') as f:
+            f.write('corrupted')
+        assert snapshot.load(self.path, self.parameters, 60) is None
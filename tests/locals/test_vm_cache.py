@@ -0,0 +1,128 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import libvirt
+
+import neat.locals.vm_cache as vm_cache
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+UUID1 = 'a' * 36
+UUID2 = 'b' * 36
+UUID3 = 'c' * 36
+
+
+class Domain(object):
+
+    def __init__(self, uuid, id, ram):
+        self.uuid = uuid
+        self.id = id
+        self.ram = ram
+
+    def UUIDString(self):
+        return self.uuid
+
+    def ID(self):
+        return self.id
+
+    def maxMemory(self):
+        return self.ram * 1024
+
+
+class Connection(object):
+    """ A fake libvirt connection counting the lookups.
+    """
+
+    def __init__(self, *domains):
+        self.domains = dict((domain.uuid, domain) for domain in domains)
+        self.lookups = 0
+        self.lists = 0
+
+    def lookupByUUIDString(self, uuid):
+        self.lookups += 1
+        if uuid not in self.domains:
+            raise libvirt.libvirtError('Domain not found')
+        return self.domains[uuid]
+
+    def listDomainsID(self):
+        self.lists += 1
+        return [domain.id for domain in self.domains.values()]
+
+
+class VmCache(TestCase):
+
+    def setUp(self):
+        self.connection = Connection(Domain(UUID1, 1, 1024),
+                                     Domain(UUID2, 2, 2048))
+        self.cache = vm_cache.VmCache(self.connection)
+
+    def test_get_ram(self):
+        ram = {UUID1: 1024, UUID2: 2048}
+        assert self.cache.get_ram([UUID1, UUID2]) == ram
+        assert self.connection.lookups == 2
+        assert self.cache.get_ram([UUID1, UUID2]) == ram
+        assert self.connection.lookups == 2
+
+    def test_get_ram_not_found(self):
+        assert self.cache.get_ram([UUID1, UUID3]) == {UUID1: 1024}
+        assert UUID3 not in self.cache.entries
+
+    def test_vm_set_changed(self):
+        self.cache.get_ram([UUID1, UUID2])
+        assert self.cache.get_ram([UUID1]) == {UUID1: 1024}
+        assert UUID2 not in self.cache.entries
+        assert self.cache.get_ram([UUID1, UUID2]) == \
+            {UUID1: 1024, UUID2: 2048}
+        assert self.connection.lookups == 3
+
+    def test_domain_id_changed(self):
+        self.cache.get_ram([UUID1, UUID2])
+        self.connection.domains[UUID2] = Domain(UUID2, 3, 4096)
+        assert self.cache.get_ram([UUID1, UUID2]) == \
+            {UUID1: 1024, UUID2: 4096}
+        assert self.connection.lookups == 3
+
+    def test_lifecycle_event(self):
+        self.cache.events = True
+        self.cache.get_ram([UUID1, UUID2])
+        self.connection.domains[UUID2] = Domain(UUID2, 2, 4096)
+        self.cache.lifecycle_event(self.connection,
+                                   self.connection.domains[UUID2],
+                                   0, 0, None)
+        assert self.cache.get_ram([UUID1, UUID2]) == \
+            {UUID1: 1024, UUID2: 4096}
+        assert self.connection.lookups == 3
+        assert self.connection.lists == 0
+
+    def test_register_events_unsupported(self):
+        assert not self.cache.register_events()
+
+    def test_lookup_not_found(self):
+        assert self.cache.lookup(UUID1) == (1, 1024)
+        assert self.cache.lookup(UUID3) is None
+
+    @qc(10)
+    def get_ram_long(
+        x=int_(min=0)
+    ):
+        connection = Connection(Domain(UUID1, 1, long(x)))
+        cache = vm_cache.VmCache(connection)
+        ram = cache.get_ram([UUID1])
+        assert ram == {UUID1: long(x)}
+        assert isinstance(ram[UUID1], long)
@@ -18,6 +18,7 @@ from pyqcy import *
 import os
 import shutil
 import libvirt
+import contracts
 
 import neat.common as common
 
@@ -27,6 +28,15 @@ logging.disable(logging.CRITICAL)
 
 class Common(TestCase):
 
+    def test_contracts_enabled(self):
+        assert not contracts.all_disabled()
+        try:
+            common.parse_compute_hosts(1)
+        except contracts.ContractNotRespected:
+            pass
+        else:
+            assert False
+
     @qc(10)
     def start(iterations=int_(0, 10)):
         with MockTransaction:
@@ -42,6 +52,12 @@ class Common(TestCase):
                                 0,
                                 iterations) == state
 
+    def test_parse_phase(self):
+        assert common.parse_phase('') is None
+        assert common.parse_phase(' ') is None
+        assert common.parse_phase('10') == 10.
+        assert common.parse_phase('2.5') == 2.5
+
     @qc(10)
     def build_local_vm_path(
         x=str_(of='abc123_-/')
@@ -34,6 +34,17 @@ class Db(TestCase):
         assert db.vm_resource_usage.select(). \
             execute().first()['cpu_mhz'] == 1000
 
+    def test_copy(self):
+        db = db_utils.init_db('sqlite:///:memory:')
+        db.update_host('host1', 3000, 4, 4000)
+        copy = db.copy()
+        assert copy.connection is not db.connection
+        assert copy.hosts is db.hosts
+        assert copy.host_power_latencies is db.host_power_latencies
+        assert copy.select_host_ids() == db.select_host_ids()
+        copy.connection.close()
+        assert db.select_host_ids() == {'host1': 1}
+
     @qc(10)
     def select_cpu_mhz_for_vm(
         uuid=str_(of='abc123-', min_length=36, max_length=36),
@@ -49,6 +60,26 @@ class Db(TestCase):
                 cpu_mhz=mhz)
         assert db.select_cpu_mhz_for_vm(uuid, n) == cpu_mhz[-n:]
 
+    @qc(10)
+    def select_cpu_mhz_for_vms(
+        vms=dict_(
+            keys=str_(of='abc123-', min_length=36, max_length=36),
+            values=list_(of=int_(min=1, max=3000),
+                         min_length=0, max_length=10),
+            min_length=0, max_length=3
+        ),
+        n=int_(min=1, max=10)
+    ):
+        db = db_utils.init_db('sqlite:///:memory:')
+        for i in range(10):
+            db.insert_vm_cpu_mhz(dict((uuid, data[i])
+                                      for uuid, data in vms.items()
+                                      if i < len(data)))
+        expected = dict((uuid, data[-n:]) for uuid, data in vms.items())
+        expected['missing'] = []
+        assert db.select_cpu_mhz_for_vms(vms.keys() + ['missing'], n) == \
+            expected
+
     @qc(10)
     def select_last_cpu_mhz_for_vms(
         vms=dict_(
@@ -130,6 +161,34 @@ class Db(TestCase):
         assert host['cpu_cores'] == 8
         assert host['ram'] == 8000L
 
+    def test_select_cpu_mhz_since(self):
+        db = db_utils.init_db('sqlite:///:memory:')
+        assert db.select_cpu_mhz_since(0, 0) == ([], [])
+        host_id = db.update_host('host1', 1, 1, 1)
+        db.insert_host_cpu_mhz('host1', 100)
+        db.insert_host_cpu_mhz('host1', 200)
+        db.vms.insert().execute(uuid='x' * 36)
+        db.insert_vm_cpu_mhz({'x' * 36: 300})
+        hosts, vms = db.select_cpu_mhz_since(0, 0)
+        assert [(x[0], x[1], x[3]) for x in hosts] == \
+            [(1, host_id, 100), (2, host_id, 200)]
+        assert all(isinstance(x[2], datetime.datetime) for x in hosts)
+        assert [(x[0], x[1], x[3]) for x in vms] == [(1, 1, 300)]
+        hosts, vms = db.select_cpu_mhz_since(1, 1)
+        assert [(x[0], x[3]) for x in hosts] == [(2, 200)]
+        assert vms == []
+
+    def test_host_macs(self):
+        db = db_utils.init_db('sqlite:///:memory:')
+        db.update_host('host1', 1, 1, 1)
+        db.update_host('host2', 1, 1, 1)
+        assert db.select_host_macs() == {}
+        db.update_host_macs({'host1': '00:11:22:33:44:55',
+                             'host3': '66:77:88:99:aa:bb'})
+        assert db.select_host_macs() == {'host1': '00:11:22:33:44:55'}
+        db.update_host('host1', 2, 2, 2)
+        assert db.select_host_macs() == {'host1': '00:11:22:33:44:55'}
+
     @qc(10)
     def select_cpu_mhz_for_host(
         hostname=str_(of='abc123', min_length=5, max_length=10),
@@ -343,6 +402,19 @@ class Db(TestCase):
                     result), key=lambda x: x[0])]
         self.assertEqual(host2, [0, 1])
 
+    def test_host_power_latencies(self):
+        db = db_utils.init_db('sqlite:///:memory:')
+        db.update_host('host1', 1, 1, 1)
+        db.update_host('host2', 1, 1, 1)
+        assert db.select_host_power_latencies() == ({}, {})
+        db.insert_host_power_latency('host1', 0, 10)
+        db.insert_host_power_latency('host1', 0, 20.)
+        db.insert_host_power_latency('host1', 1, 30.)
+        db.insert_host_power_latency('host2', 1, 40.5)
+        assert db.select_host_power_latencies() == (
+            {'host1': 15.},
+            {'host1': 30., 'host2': 40.5})
+
     @qc(1)
     def insert_select():
         db = db_utils.init_db('sqlite:///:memory:')
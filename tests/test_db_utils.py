@@ -17,6 +17,10 @@ from pyqcy import *
 
 from sqlalchemy import *
 
+import os
+import shutil
+import tempfile
+
 import neat.db
 import neat.db_utils as db_utils
 
@@ -35,7 +39,7 @@ class DbUtils(TestCase):
         assert isinstance(db.vm_resource_usage, Table)
         assert isinstance(db.host_states, Table)
         assert db.hosts.c.keys() == \
-            ['id', 'hostname', 'cpu_mhz', 'cpu_cores', 'ram']
+            ['id', 'hostname', 'cpu_mhz', 'cpu_cores', 'ram', 'mac']
         assert db.host_resource_usage.c.keys() == \
             ['id', 'host_id', 'timestamp', 'cpu_mhz']
         assert list(db.host_resource_usage.foreign_keys)[0].target_fullname \
@@ -59,3 +63,38 @@ class DbUtils(TestCase):
             ['id', 'host_id', 'timestamp', 'overload']
         assert list(db.host_overload.foreign_keys)[0].target_fullname \
             == 'hosts.id'
+        assert db.host_power_latencies.c.keys() == \
+            ['id', 'host_id', 'timestamp', 'state', 'latency']
+        assert list(db.host_power_latencies.foreign_keys)[0]. \
+            target_fullname == 'hosts.id'
+
+    def test_init_db_upgrade(self):
+        # A database created before the MAC addresses of the hosts
+        # were stored has no hosts.mac column
+        path = tempfile.mkdtemp()
+        try:
+            url = 'sqlite:///' + os.path.join(path, 'neat.db')
+            engine = create_engine(url)
+            engine.execute('CREATE TABLE hosts (' +
+                           'id INTEGER NOT NULL PRIMARY KEY, ' +
+                           'hostname VARCHAR(255) NOT NULL, ' +
+                           'cpu_mhz INTEGER NOT NULL, ' +
+                           'cpu_cores INTEGER NOT NULL, ' +
+                           'ram INTEGER NOT NULL)')
+            engine.execute('INSERT INTO hosts ' +
+                           '(hostname, cpu_mhz, cpu_cores, ram) ' +
+                           "VALUES ('host1', 3000, 4, 4000)")
+            engine.dispose()
+
+            db = db_utils.init_db(url)
+            assert db.select_host_macs() == {}
+            assert db.select_host_characteristics() == \
+                ({'host1': 3000}, {'host1': 4}, {'host1': 4000})
+            db.update_host_macs({'host1': '00:11:22:33:44:55'})
+            assert db.select_host_macs() == {'host1': '00:11:22:33:44:55'}
+
+            # The upgrade is not repeated
+            db = db_utils.init_db(url)
+            assert db.select_host_macs() == {'host1': '00:11:22:33:44:55'}
+        finally:
+            shutil.rmtree(path)
@@ -0,0 +1,140 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import os
+import shutil
+import tempfile
+import urllib2
+
+import neat.common as common
+import neat.db_utils as db_utils
+import neat.metrics as metrics
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class Metrics(TestCase):
+
+    def test_counters_gauges(self):
+        registry = metrics.Registry()
+        registry.inc('neat_loop_overruns_total')
+        registry.inc('neat_loop_overruns_total', value=2)
+        registry.inc('neat_decisions_total', {'host': 'h1',
+                                              'decision': 'overload'})
+        registry.set('neat_migrations_in_flight', 3)
+        registry.set('neat_migrations_in_flight', 1)
+        assert registry.get('neat_loop_overruns_total') == 3
+        assert registry.get('neat_decisions_total',
+                            {'decision': 'overload', 'host': 'h1'}) == 1
+        assert registry.get('neat_decisions_total', {'host': 'h2'}) is None
+        assert registry.get('neat_migrations_in_flight') == 1
+
+        text = registry.render()
+        assert '# TYPE neat_loop_overruns_total counter\n' in text
+        assert 'neat_loop_overruns_total 3.0\n' in text
+        assert 'neat_decisions_total{decision="overload",host="h1"} 1.0\n' \
+            in text
+        assert '# TYPE neat_migrations_in_flight gauge\n' in text
+        assert 'neat_migrations_in_flight 1.0\n' in text
+
+    def test_histogram(self):
+        registry = metrics.Registry()
+        registry.observe('neat_phase_seconds', 0.02, {'phase': 'db'})
+        registry.observe('neat_phase_seconds', 2., {'phase': 'db'})
+        with registry.timed('neat_phase_seconds', {'phase': 'libvirt'}):
+            pass
+
+        text = registry.render()
+        assert '# TYPE neat_phase_seconds histogram\n' in text
+        assert 'neat_phase_seconds_bucket{phase="db",le="0.01"} 0.0\n' \
+            in text
+        assert 'neat_phase_seconds_bucket{phase="db",le="0.05"} 1.0\n' \
+            in text
+        assert 'neat_phase_seconds_bucket{phase="db",le="5.0"} 2.0\n' in text
+        assert 'neat_phase_seconds_bucket{phase="db",le="+Inf"} 2.0\n' \
+            in text
+        assert 'neat_phase_seconds_sum{phase="db"} 2.02\n' in text
+        assert 'neat_phase_seconds_count{phase="db"} 2.0\n' in text
+        assert 'neat_phase_seconds_count{phase="libvirt"} 1.0\n' in text
+
+    def test_label_escaping(self):
+        assert metrics.sample('x', (('a', 'q"\\\n'),), 1) == \
+            'x{a="q\\"\\\\\\n"} 1.0'
+
+    def test_cache_requests(self):
+        with MockTransaction:
+            expect(metrics.REGISTRY).inc(
+                'neat_cache_requests_total',
+                {'cache': 'vms', 'result': 'hit'}, 2).once()
+            expect(metrics.REGISTRY).inc(
+                'neat_cache_requests_total',
+                {'cache': 'vms', 'result': 'miss'}, 1).once()
+            metrics.cache_requests('vms', True, 2)
+            metrics.cache_requests('vms', False)
+            metrics.cache_requests('vms', False, 0)
+
+    def test_export(self):
+        directory = tempfile.mkdtemp()
+        try:
+            metrics.init_metrics(
+                {'metrics_textfile_directory': directory,
+                 'local_manager_metrics_port': '0'},
+                'local_manager')
+            path = os.path.join(directory, 'local_manager.prom')
+            assert metrics.TEXTFILE['path'] == path
+            metrics.export()
+            with open(path) as f:
+                assert f.read() == metrics.REGISTRY.render()
+            assert not os.access(path + '.tmp', os.F_OK)
+        finally:
+            metrics.TEXTFILE['path'] = None
+            shutil.rmtree(directory)
+
+    def test_serve(self):
+        registry = metrics.Registry()
+        registry.inc('neat_loop_overruns_total')
+        server = metrics.serve(0, '127.0.0.1', registry)
+        try:
+            url = 'http://127.0.0.1:{0}'.format(server.server_port)
+            response = urllib2.urlopen(url + '/metrics')
+            assert response.read() == registry.render()
+            try:
+                urllib2.urlopen(url + '/other')
+            except urllib2.HTTPError as e:
+                assert e.code == 404
+            else:
+                assert False
+        finally:
+            server.shutdown()
+
+    def test_iteration_duration(self):
+        count = (metrics.REGISTRY.get('neat_iteration_seconds') or
+                 [None, 0., 0])[2]
+        state = common.execute_iteration(lambda config, state: state,
+                                         {}, {'x': 1})
+        assert state == {'x': 1}
+        assert metrics.REGISTRY.get('neat_iteration_seconds')[2] == \
+            count + 1
+
+    def test_db_queries(self):
+        labels = {'statement': 'select'}
+        queries = metrics.REGISTRY.get('neat_db_queries_total', labels) or 0
+        db = db_utils.init_db('sqlite:///:memory:')
+        db.select_last_cpu_mhz_for_vms()
+        assert metrics.REGISTRY.get('neat_db_queries_total', labels) > \
+            queries
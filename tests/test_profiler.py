@@ -0,0 +1,76 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import os
+import pstats
+import shutil
+import signal
+import tempfile
+
+import neat.profiler as profiler
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class Profiler(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.handler = signal.getsignal(signal.SIGUSR2)
+
+    def tearDown(self):
+        signal.signal(signal.SIGUSR2, self.handler)
+        profiler.PROFILER['remaining'] = 0
+        shutil.rmtree(self.directory)
+
+    def test_run(self):
+        profiler.init_profiler({'log_directory': self.directory,
+                                'profiler_iterations': '2'},
+                               'service')
+        assert profiler.run(lambda x, y: x + y, 1, 2) == 3
+        assert os.listdir(self.directory) == []
+
+        os.kill(os.getpid(), signal.SIGUSR2)
+        assert profiler.PROFILER['remaining'] == 2
+        for _ in range(3):
+            assert profiler.run(lambda x, y: x + y, 1, 2) == 3
+        assert profiler.PROFILER['remaining'] == 0
+
+        files = sorted(os.listdir(self.directory))
+        assert len(files) == 4
+        assert [x.rsplit('-', 1)[1] for x in files] == \
+            ['1.prof', '1.txt', '2.prof', '2.txt']
+        assert all(x.startswith('service-') for x in files)
+        stats = pstats.Stats(os.path.join(self.directory, files[0]))
+        assert stats.total_calls > 0
+
+    def test_run_exception(self):
+        profiler.init_profiler({'log_directory': self.directory},
+                               'service')
+        profiler.request(1)
+
+        def fail():
+            raise ValueError()
+
+        try:
+            profiler.run(fail)
+        except ValueError:
+            pass
+        else:
+            assert False
+        assert len(os.listdir(self.directory)) == 2
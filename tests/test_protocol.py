@@ -0,0 +1,115 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import unittest
+
+import neat.protocol as protocol
+
+
+class Protocol(TestCase):
+
+    def test_content_type(self):
+        assert protocol.content_type('json') == 'application/json'
+        assert 'application/json' in protocol.supported_content_types()
+        try:
+            protocol.content_type('xml')
+        except ValueError:
+            pass
+        else:
+            assert False
+
+    def test_encode_decode(self):
+        message = protocol.message(
+            'user', 'password',
+            [protocol.event('host', 1.5, 1, ['vm1'], [100],
+                            {'vm1': [200, 300]})])
+        assert message == {
+            'version': protocol.VERSION,
+            'username': 'user',
+            'password': 'password',
+            'events': [{'host': 'host',
+                        'time': 1.5,
+                        'reason': 1,
+                        'vm_uuids': ['vm1'],
+                        'host_cpu_mhz': [100],
+                        'vm_cpu_mhz': {'vm1': [200, 300]}}]}
+        for content_type in protocol.supported_content_types():
+            body = protocol.encode(message, content_type)
+            decoded = protocol.decode(body, content_type)
+            assert decoded == message
+            # The strings are decoded as str
+            assert type(decoded['events'][0]['host']) is str
+            assert type(decoded['events'][0]['vm_cpu_mhz'].keys()[0]) is str
+
+        body = protocol.encode(message, 'application/json')
+        # The JSON encoding is compact
+        assert ' ' not in body
+
+    @unittest.skipIf(protocol.msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        content_type = protocol.content_type('msgpack')
+        assert content_type == 'application/x-msgpack'
+        assert content_type in protocol.supported_content_types()
+        message = protocol.message(
+            'user', 'password',
+            [protocol.event('host', 1.5, 0, [], [100], {'vm1': [200]})])
+        body = protocol.encode(message, content_type)
+        assert body != protocol.encode(message, 'application/json')
+        decoded = protocol.decode(body, content_type)
+        assert decoded == message
+        assert type(decoded['events'][0]['host']) is str
+        assert type(decoded['events'][0]['vm_cpu_mhz'].keys()[0]) is str
+        # A truncated document and a document that is not a map
+        for body in ['\x93\x01', '\x91\x01']:
+            try:
+                protocol.decode(body, content_type)
+            except ValueError:
+                pass
+            else:
+                assert False
+
+    def test_msgpack_missing(self):
+        with MockTransaction:
+            modify(protocol).msgpack = None
+            assert protocol.supported_content_types() == ['application/json']
+            for call in [lambda: protocol.content_type('msgpack'),
+                         lambda: protocol.encode({}, 'application/x-msgpack'),
+                         lambda: protocol.decode('\x80',
+                                                 'application/x-msgpack')]:
+                try:
+                    call()
+                except ValueError:
+                    pass
+                else:
+                    assert False
+
+    def test_decode_errors(self):
+        for body, content_type in [('{}', 'text/plain'),
+                                   ('[1]', 'application/json'),
+                                   ('{', 'application/json')]:
+            try:
+                protocol.decode(body, content_type)
+            except ValueError:
+                pass
+            else:
+                assert False
+        try:
+            protocol.encode({}, 'text/plain')
+        except ValueError:
+            pass
+        else:
+            assert False
@@ -0,0 +1,173 @@
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mocktest import *
+from pyqcy import *
+
+import neat.scheduler as scheduler
+
+import logging
+logging.disable(logging.CRITICAL)
+
+
+class Clock(object):
+    """ A fake clock advanced by sleeping and working.
+    """
+
+    def __init__(self, now=1000.):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Scheduler(TestCase):
+
+    def test_monotonic(self):
+        t1 = scheduler.monotonic()
+        t2 = scheduler.monotonic()
+        assert t1 > 0
+        assert t2 >= t1
+
+    def test_no_drift(self):
+        clock = Clock()
+        s = scheduler.Scheduler(10, clock=clock, sleep=clock.sleep)
+        starts = []
+        for duration in [3, 7, 1, 9.5]:
+            s.wait()
+            starts.append(clock.now)
+            clock.now += duration
+            assert s.advance() == 0
+        assert starts == [1000., 1010., 1020., 1030.]
+        assert s.overruns == 0
+
+    def test_phase(self):
+        clock = Clock(50.)
+        s = scheduler.Scheduler(300, 10, clock=clock,
+                                wall_clock=lambda: 1200. + 250.,
+                                sleep=clock.sleep)
+        s.wait()
+        # The next multiple of 300 plus 10 after 1450 is 1510
+        assert clock.sleeps == [60.]
+
+    def test_skip(self):
+        clock = Clock()
+        s = scheduler.Scheduler(10, clock=clock, sleep=clock.sleep)
+        s.wait()
+        clock.now += 25
+        assert s.advance() == 2
+        assert s.overruns == 1
+        assert s.skipped == 2
+        s.wait()
+        assert clock.now == 1030.
+        clock.now += 1
+        assert s.advance() == 0
+        s.wait()
+        assert clock.now == 1040.
+
+    def test_catch_up(self):
+        clock = Clock()
+        s = scheduler.Scheduler(10, policy=scheduler.CATCH_UP,
+                                clock=clock, sleep=clock.sleep)
+        s.wait()
+        clock.now += 25
+        assert s.advance() == 2
+        starts = []
+        for _ in range(3):
+            s.wait()
+            starts.append(clock.now)
+            clock.now += 1
+            s.advance()
+        # The two missed iterations are performed without waiting
+        assert starts == [1025., 1026., 1030.]
+        assert s.overruns == 1
+        assert s.skipped == 0
+
+    def test_catch_up_limit(self):
+        clock = Clock()
+        s = scheduler.Scheduler(1, policy=scheduler.CATCH_UP,
+                                clock=clock, sleep=clock.sleep)
+        s.wait()
+        clock.now += scheduler.MAX_CATCH_UP + 5.5
+        assert s.advance() == scheduler.MAX_CATCH_UP + 5
+        assert s.skipped == 5
+
+    @qc(10)
+    def host_offset(
+        hostname=str_(of='abc123-', min_length=1, max_length=20),
+        spread=float_(min=0., max=600.)
+    ):
+        offset = scheduler.host_offset(hostname, spread)
+        assert 0 <= offset <= spread
+        assert offset == scheduler.host_offset(hostname, spread)
+
+    def test_host_offset_spread(self):
+        offsets = [scheduler.host_offset('compute' + str(i), 100)
+                   for i in range(100)]
+        assert len(set(offsets)) == 100
+        assert min(offsets) < 20
+        assert max(offsets) > 80
+        assert scheduler.host_offset('compute1', 0) == 0
+
+    def test_offset(self):
+        clock = Clock(50.)
+        s = scheduler.Scheduler(300, 10, offset=25.5, clock=clock,
+                                wall_clock=lambda: 1450.,
+                                sleep=clock.sleep)
+        s.wait()
+        assert clock.sleeps == [85.5]
+
+        clock = Clock(50.)
+        s = scheduler.Scheduler(300, offset=25.5, clock=clock,
+                                sleep=clock.sleep)
+        s.wait()
+        assert clock.sleeps == [25.5]
+
+    def test_jitter(self):
+        clock = Clock()
+        s = scheduler.Scheduler(10, jitter=4, clock=clock,
+                                sleep=clock.sleep, random=lambda: 0.5)
+        starts = []
+        for _ in range(3):
+            s.wait()
+            starts.append(clock.now)
+            clock.now += 1
+            s.advance()
+        # The jitter does not shift the following deadlines
+        assert starts == [1002., 1012., 1022.]
+        assert s.overruns == 0
+
+    def test_interrupted_sleep(self):
+        clock = Clock()
+        s = scheduler.Scheduler(10, clock=clock, sleep=clock.sleep)
+        s.wait()
+        s.advance()
+        # A signal interrupts the sleep after 4 seconds
+        s.sleep = lambda seconds: clock.sleep(min(seconds, 4))
+        s.wait()
+        assert clock.now == 1010.
+        assert clock.sleeps == [4, 4, 2]
+
+    def test_unknown_policy(self):
+        try:
+            scheduler.Scheduler(10, policy='other')
+        except ValueError:
+            pass
+        else:
+            assert False
@@ -0,0 +1,164 @@
+#!/usr/bin/python2
+
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures the overhead of checking the contracts for each subsystem.
+# As contract checking is enabled or disabled when the neat package is
+# imported, each benchmark is run in a separate process with and
+# without the NEAT_CONTRACTS environment variable set.
+#
+# Usage: python2 utils/benchmark-contracts.py [seconds per measurement]
+
+import os
+import random
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def collector():
+    import neat.locals.collector as collector
+    return lambda: [collector.calculate_cpu_mhz(
+        3000, 0., 300., 0, x * 1000000000) for x in range(100)]
+
+
+def local_manager():
+    import neat.locals.manager as manager
+    vms = [[random.randint(0, 3000) for _ in range(30)] for _ in range(10)]
+    host = [random.randint(0, 300) for _ in range(30)]
+    return lambda: manager.vm_mhz_to_percentage(vms, host, 24000)
+
+
+def underload_detection():
+    import neat.locals.underload.trivial as trivial
+    detector = trivial.last_n_average_threshold_factory(
+        300, 20., {'threshold': 0.5, 'n': 2})
+    utilization = [random.random() for _ in range(30)]
+    return lambda: detector(utilization)
+
+
+def overload_detection_mhod():
+    import neat.locals.overload.mhod.core as mhod
+    detector = mhod.mhod_factory(
+        300, 20., {'state_config': [0.8],
+                   'otf': 0.1,
+                   'history_size': 500,
+                   'window_sizes': [30, 40, 50, 60, 70, 80, 90, 100],
+                   'bruteforce_step': 0.5,
+                   'learning_steps': 10})
+    utilization = [random.random() for _ in range(30)]
+    return lambda: detector(utilization)
+
+
+def overload_detection_statistics():
+    import neat.locals.overload.statistics as statistics
+    detector = statistics.loess_factory(
+        300, 20., {'threshold': 1.0, 'param': 1.2, 'length': 10})
+    utilization = [random.random() for _ in range(30)]
+    return lambda: detector(utilization)
+
+
+def vm_selection():
+    import neat.locals.vm_selection.algorithms as algorithms
+    selector = algorithms.minimum_migration_time_max_cpu_factory(
+        300, 20., {'last_n': 2})
+    vms_cpu = dict(('vm' + str(i), [random.randint(0, 3000)
+                                    for _ in range(30)])
+                   for i in range(20))
+    vms_ram = dict((vm, random.randint(512, 4096)) for vm in vms_cpu)
+    return lambda: selector(vms_cpu, vms_ram)
+
+
+def vm_placement():
+    import neat.globals.vm_placement.bin_packing as bin_packing
+    placement = bin_packing.best_fit_decreasing_factory(
+        300, 20., {'cpu_threshold': 0.8,
+                   'ram_threshold': 0.95,
+                   'last_n_vm_cpu': 2})
+    hosts = ['host' + str(i) for i in range(50)]
+    hosts_cpu_usage = dict((x, random.randint(0, 10000)) for x in hosts)
+    hosts_cpu_total = dict((x, 24000) for x in hosts)
+    hosts_ram_usage = dict((x, random.randint(0, 16384)) for x in hosts)
+    hosts_ram_total = dict((x, 32768) for x in hosts)
+    vms_cpu = dict(('vm' + str(i), [random.randint(0, 1000)
+                                    for _ in range(10)])
+                   for i in range(100))
+    vms_ram = dict((vm, random.randint(512, 2048)) for vm in vms_cpu)
+    return lambda: placement(hosts_cpu_usage, hosts_cpu_total,
+                             hosts_ram_usage, hosts_ram_total,
+                             {}, {}, vms_cpu, vms_ram)
+
+
+def database():
+    import neat.db_utils as db_utils
+    db = db_utils.init_db('sqlite:///:memory:')
+    vms = ['%036d' % i for i in range(10)]
+
+    def run():
+        db.insert_vm_cpu_mhz(dict((vm, random.randint(0, 3000))
+                                  for vm in vms))
+        for vm in vms:
+            db.select_cpu_mhz_for_vm(vm, 30)
+    return run
+
+
+BENCHMARKS = [
+    ('collector', collector),
+    ('local manager', local_manager),
+    ('underload detection', underload_detection),
+    ('overload detection: MHOD', overload_detection_mhod),
+    ('overload detection: LR', overload_detection_statistics),
+    ('VM selection', vm_selection),
+    ('VM placement', vm_placement),
+    ('database', database)]
+
+
+def measure(index, duration):
+    random.seed(0)
+    run = BENCHMARKS[index][1]()
+    run()
+    calls = 0
+    start = time.time()
+    while calls == 0 or time.time() - start < duration:
+        run()
+        calls += 1
+    return (time.time() - start) / calls
+
+
+def run_process(index, duration, checked):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [x for x in [env.get('PYTHONPATH')] if x])
+    env['NEAT_CONTRACTS'] = '1' if checked else '0'
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__),
+         '--measure', str(index), str(duration)], env=env)
+    return float(output)
+
+
+if len(sys.argv) > 1 and sys.argv[1] == '--measure':
+    print repr(measure(int(sys.argv[2]), float(sys.argv[3])))
+    sys.exit(0)
+
+duration = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+print '{0:28} {1:>12} {2:>12} {3:>9}'.format(
+    'Subsystem', 'Checked', 'Unchecked', 'Overhead')
+for index, (name, _) in enumerate(BENCHMARKS):
+    checked = run_process(index, duration, True)
+    unchecked = run_process(index, duration, False)
+    print '{0:28} {1:>9.3f} ms {2:>9.3f} ms {3:>8.1f}x'.format(
+        name, checked * 1000, unchecked * 1000, checked / unchecked)
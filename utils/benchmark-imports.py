@@ -0,0 +1,117 @@
+#!/usr/bin/python2
+
+# Copyright 2012 Anton Beloglazov
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures the import time of each entry point and lists the heavy
+# dependencies it loads. A daemon is measured together with the
+# algorithm modules named in the config, as they are imported when
+# the daemon is started. A command line script is measured by running
+# its top-level import statements in the directory of the script.
+# Each measurement is done in a fresh process, the best of several
+# runs is reported.
+#
+# Usage: python2 utils/benchmark-imports.py [runs]
+
+import ast
+import ConfigParser
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+HEAVY = ['libvirt', 'sqlalchemy', 'numpy', 'scipy', 'novaclient',
+         'bottle', 'requests']
+
+DAEMONS = [
+    ('neat-data-collector', 'neat.locals.collector', []),
+    ('neat-local-manager', 'neat.locals.manager',
+     ['algorithm_underload_detection_factory',
+      'algorithm_overload_detection_factory',
+      'algorithm_vm_selection_factory']),
+    ('neat-global-manager', 'neat.globals.manager',
+     ['algorithm_vm_placement_factory']),
+    ('neat-db-cleaner', 'neat.globals.db_cleaner', []),
+    ('neat-dry-run', 'neat.globals.dry_run', [])]
+
+SCRIPTS = ['vm-placement.py',
+           'utils/db.py',
+           'utils/idle-time-fraction.py',
+           'utils/overload-time-fraction.py',
+           'utils/vm-migrations.py']
+
+MEASURE = '''
+import time
+start = time.time()
+{0}
+duration = time.time() - start
+import sys
+print repr(duration)
+print ' '.join(x for x in {1!r} if x in sys.modules)
+'''
+
+
+def read_config():
+    config = ConfigParser.ConfigParser()
+    config.read([os.path.join(ROOT, 'neat.conf'), '/etc/neat/neat.conf'])
+    return dict(config.items('DEFAULT'))
+
+
+def daemon_imports(module, options, config):
+    modules = [module] + [config[x].rsplit('.', 1)[0] for x in options]
+    return '\n'.join('import ' + x for x in modules)
+
+
+def script_imports(path):
+    tree = ast.parse(open(path).read(), path)
+    lines = []
+    for node in tree.body:
+        names = ', '.join(x.name + (' as ' + x.asname if x.asname else '')
+                          for x in node.names) \
+            if isinstance(node, (ast.Import, ast.ImportFrom)) else None
+        if isinstance(node, ast.Import):
+            lines.append('import ' + names)
+        elif isinstance(node, ast.ImportFrom):
+            lines.append('from ' + node.module + ' import ' + names)
+    return '\n'.join(lines)
+
+
+def measure(imports, directory, runs):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [x for x in [env.get('PYTHONPATH')] if x])
+    results = []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, '-c', MEASURE.format(imports, HEAVY)],
+            cwd=directory, env=env).splitlines()
+        results.append((float(output[0]), output[1] if len(output) > 1
+                        else ''))
+    return min(results)
+
+
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+config = read_config()
+entry_points = \
+    [(name, daemon_imports(module, options, config), ROOT)
+     for name, module, options in DAEMONS] + \
+    [(script, script_imports(os.path.join(ROOT, script)),
+      os.path.dirname(os.path.join(ROOT, script)))
+     for script in SCRIPTS]
+
+print '{0:32} {1:>10}  {2}'.format('Entry point', 'Import', 'Loaded')
+for name, imports, directory in entry_points:
+    duration, loaded = measure(imports, directory, runs)
+    print '{0:32} {1:>7.1f} ms  {2}'.format(name, duration * 1000, loaded)
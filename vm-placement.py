@@ -17,6 +17,7 @@
 from novaclient.v2 import client
 import neat.common as common
 import neat.globals.manager as manager
+from neat.globals.cluster import ClusterModel
 from neat.config import *
 import sys
 
@@ -34,13 +35,14 @@ nova = client.Client(config['os_admin_user'],
                      config['os_auth_url'],
                      service_type="compute")
 hosts = common.parse_compute_hosts(config['compute_hosts'])
+cluster = ClusterModel(nova, db, float(config['cluster_model_ttl']))
 
 hosts_cpu_total, hosts_cpu_cores, hosts_ram_total = \
-    db.select_host_characteristics()
+    cluster.host_characteristics()
 hosts_cpu_core = \
     dict((host, int(hosts_cpu_total[host] / hosts_cpu_cores[host]))
          for host in hosts_cpu_total.keys())
-hosts_to_vms = manager.vms_by_hosts(nova, hosts)
+hosts_to_vms = cluster.vms_by_hosts(hosts)
 vms = [item for sublist in hosts_to_vms.values() for item in sublist]
 
 vms_names = []
@@ -55,7 +57,7 @@ vms_cpu_usage = db.select_last_cpu_mhz_for_vms()
 for vm in vms:
     if not vm in vms_cpu_usage:
         vms_cpu_usage[vm] = 0
-vms_ram_usage = manager.vms_ram_limit(nova, vms)
+vms_ram_usage = cluster.vms_ram_limit(vms)
 
 hosts_cpu_usage_hypervisor = db.select_last_cpu_mhz_for_hosts()
 
@@ -64,7 +66,7 @@ hosts_ram_usage = {}
 for host, vms in hosts_to_vms.items():
     hosts_cpu_usage[host] = hosts_cpu_usage_hypervisor[host] + \
                             sum(vms_cpu_usage[x] for x in vms)
-    hosts_ram_usage[host] = manager.host_used_ram(nova, host)
+    hosts_ram_usage[host] = cluster.host_used_ram(host)
 
 
 first = True